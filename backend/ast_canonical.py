@@ -0,0 +1,128 @@
+# ast_canonical.py
+from hashlib import blake2b
+from typing import Dict, List, Tuple
+import json
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode, ClassificationNode
+)
+
+# --- Canonical form ---
+# Two queries that differ only in operand order, redundant nesting or the
+# case of field codes and operators canonicalize to equal trees:
+#   - nested AND/OR of the same operator are flattened, and a single-operand
+#     AND/OR is replaced by its operand;
+#   - operands of commutative operators (AND, OR, XOR, and two-term
+#     NEAR/WITH/SAME unless ordered) are sorted by their digest. A chain of
+#     three or more proximity terms keeps its order: each term is matched
+#     against the span of the ones before it, so reordering can change hits;
+#   - operators and classification symbols are upper-cased and canonical
+#     field names lower-cased;
+#   - the source syntax's field code (system_field_code) is dropped, since the
+#     canonical field name already says which field is searched ("CL=" and
+#     ".CLM." are both claims).
+# Term text is left alone. The sort order is stable but not meaningful, so
+# the canonical tree is for keys and comparison, not for display.
+
+ASSOCIATIVE_OPERATORS = {"AND", "OR"}
+COMMUTATIVE_OPERATORS = {"AND", "OR", "XOR"}
+# Proximity operators whose operands may appear in either order.
+UNORDERED_PROXIMITY_OPERATORS = {"NEAR", "WITH", "SAME"}
+
+# Bump when the canonical form or digest encoding changes, so persisted keys
+# from an older version never match.
+CANONICAL_KEY_VERSION = 2
+
+
+def canonicalize(node: ASTNode) -> ASTNode:
+    """Returns the canonical form of `node` as a new tree. `node` is not modified."""
+    return _canonical(node, {})[0]
+
+
+def canonical_key(node: ASTNode) -> str:
+    """
+    A stable hex digest of the canonical form of `node`. Unlike `hash()` it is
+    the same in every process, so it can key shared or persisted caches.
+    """
+    return _canonical(node, {})[1].hex()
+
+
+def _digest(node: ASTNode, child_digests: Tuple[bytes, ...]) -> bytes:
+    scalars = []
+    for key in node._fields:
+        if key in node._child_fields:
+            continue
+        value = getattr(node, key)
+        # json.dumps gives a process-independent encoding of the scalar fields and settings.
+        scalars.append(json.dumps(value, sort_keys=True, default=str))
+    payload = "\x1f".join([str(CANONICAL_KEY_VERSION), type(node).__name__, *scalars]).encode()
+    h = blake2b(payload, digest_size=16)
+    for child in child_digests:
+        h.update(child)
+    return h.digest()
+
+
+def _canonical_operands(operator: str, operands: List[ASTNode], flatten: bool, sort: bool,
+                        digests: Dict[int, bytes]) -> List[Tuple[ASTNode, bytes]]:
+    result: List[Tuple[ASTNode, bytes]] = []
+    for operand in operands:
+        child, digest = _canonical(operand, digests)
+        # Children are canonical already, so one level of flattening is enough.
+        if flatten and isinstance(child, BooleanOpNode) and child.operator == operator:
+            result.extend((grandchild, digests[id(grandchild)]) for grandchild in child.operands)
+        else:
+            result.append((child, digest))
+    if sort:
+        result.sort(key=lambda pair: pair[1])
+    return result
+
+
+def _canonical(node: ASTNode, digests: Dict[int, bytes]) -> Tuple[ASTNode, bytes]:
+    """Returns (canonical node, digest). `digests` maps id() of every canonical node built so far to its digest."""
+    new_node, digest = _canonical_node(node, digests)
+    digests[id(new_node)] = digest
+    return new_node, digest
+
+
+def _canonical_node(node: ASTNode, digests: Dict[int, bytes]) -> Tuple[ASTNode, bytes]:
+    if isinstance(node, BooleanOpNode):
+        operator = node.operator.upper()
+        operands = _canonical_operands(
+            operator, node.operands,
+            flatten=operator in ASSOCIATIVE_OPERATORS, sort=operator in COMMUTATIVE_OPERATORS, digests=digests,
+        )
+        if len(operands) == 1 and operator in ASSOCIATIVE_OPERATORS:
+            return operands[0]
+        new_node: ASTNode = BooleanOpNode(operator, [child for child, _ in operands])  # type: ignore
+        return new_node, _digest(new_node, tuple(digest for _, digest in operands))
+
+    if isinstance(node, ProximityOpNode):
+        operator = node.operator.upper()
+        unordered = operator in UNORDERED_PROXIMITY_OPERATORS and not node.ordered and len(node.terms) == 2
+        terms = _canonical_operands(operator, node.terms, flatten=False, sort=unordered, digests=digests)
+        new_node = ProximityOpNode(operator, [child for child, _ in terms], distance=node.distance,  # type: ignore
+                                   ordered=node.ordered, scope_unit=node.scope_unit)
+        return new_node, _digest(new_node, tuple(digest for _, digest in terms))
+
+    if isinstance(node, FieldedSearchNode):
+        query, digest = _canonical(node.query, digests)
+        new_node = FieldedSearchNode(node.field_canonical_name.lower(), query)
+        return new_node, _digest(new_node, (digest,))
+
+    if isinstance(node, QueryRootNode):
+        query, digest = _canonical(node.query, digests)
+        new_node = QueryRootNode(query=query, settings=node.settings)
+        return new_node, _digest(new_node, (digest,))
+
+    if isinstance(node, ClassificationNode):
+        new_node = ClassificationNode(node.scheme.upper(), node.value.upper(), include_children=node.include_children)  # type: ignore
+        return new_node, _digest(new_node, ())
+
+    if isinstance(node, DateSearchNode):
+        new_node = DateSearchNode(node.field_canonical_name, node.operator, node.date_value, date_value2=node.date_value2)
+        return new_node, _digest(new_node, ())
+
+    if isinstance(node, TermNode):
+        return node, _digest(node, ())
+
+    raise ValueError(f"Cannot canonicalize node type: {type(node).__name__}")
@@ -0,0 +1,112 @@
+# ast_diff.py
+from typing import Any, Dict, List, Optional
+from ast_nodes import ASTNode
+
+# --- AST diffs ---
+# `diff_ast` describes how to turn one AST's to_dict() form into another's as
+# a JSON Patch (RFC 6902), so a client holding the old dict can apply small
+# edits instead of receiving the whole tree again. Only "replace", "add" and
+# "remove" are emitted, with paths into the to_dict() layout, e.g.
+#   {"op": "replace", "path": "/query/operands/2/value", "value": "anode"}
+# Ops are applied in order; list indexes refer to the list as left by the
+# previous op.
+#
+# Equal subtrees are skipped by comparing cached structural hashes, so the
+# cost is proportional to the changed part of the tree, and only new subtrees
+# are serialized.
+
+Patch = List[Dict[str, Any]]
+
+
+def diff_ast(old: Optional[ASTNode], new: Optional[ASTNode]) -> Patch:
+    """The JSON Patch turning old.to_dict() into new.to_dict(). None stands for no AST (JSON null)."""
+    patch: Patch = []
+    _diff_value(old, new, "", patch)
+    return patch
+
+
+def apply_patch(document: Any, patch: Patch) -> Any:
+    """Applies a patch from `diff_ast` to a to_dict() document in place and returns the result."""
+    for op in patch:
+        if op["path"] == "":
+            document = op.get("value")
+            continue
+        *parents, last = op["path"][1:].split("/")
+        target = document
+        for key in parents:
+            target = target[int(key)] if isinstance(target, list) else target[_unescape(key)]
+        if isinstance(target, list):
+            index = int(last)
+            if op["op"] == "add":
+                target.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del target[index]
+            else:
+                target[index] = op["value"]
+        elif op["op"] == "remove":
+            del target[_unescape(last)]
+        else:
+            target[_unescape(last)] = op["value"]
+    return document
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(key: str) -> str:
+    return key.replace("~1", "/").replace("~0", "~")
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, ASTNode):
+        return value.to_dict()
+    if isinstance(value, list) and value and all(isinstance(item, ASTNode) for item in value):
+        return [item.to_dict() for item in value]
+    return value
+
+
+def _diff_value(old: Any, new: Any, path: str, patch: Patch) -> None:
+    if old is new:
+        return
+    if isinstance(old, ASTNode) and isinstance(new, ASTNode):
+        if type(old) is type(new):
+            if old != new:
+                _diff_node(old, new, path, patch)
+            return
+    elif isinstance(old, list) and isinstance(new, list):
+        _diff_list(old, new, path, patch)
+        return
+    elif type(old) is type(new) and old == new:
+        return
+    patch.append({"op": "replace", "path": path, "value": _to_json(new)})
+
+
+def _diff_node(old: ASTNode, new: ASTNode, path: str, patch: Patch) -> None:
+    # Same node type, so both have the same keys in to_dict().
+    for key in old._fields:
+        _diff_value(getattr(old, key), getattr(new, key), f"{path}/{_escape(key)}", patch)
+
+
+def _diff_list(old: List[Any], new: List[Any], path: str, patch: Patch) -> None:
+    # Trim the common prefix and suffix, so inserting or deleting one operand
+    # is a single add or remove rather than a shift of every later one.
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+
+    paired = min(len(old_middle), len(new_middle))
+    for offset in range(paired):
+        _diff_value(old_middle[offset], new_middle[offset], f"{path}/{prefix + offset}", patch)
+    index = prefix + paired
+    for item in new_middle[paired:]:
+        patch.append({"op": "add", "path": f"{path}/{index}", "value": _to_json(item)})
+        index += 1
+    for _ in old_middle[paired:]:
+        patch.append({"op": "remove", "path": f"{path}/{index}"})
@@ -1,7 +1,6 @@
-
 # ast_nodes.py
 from typing import List, Optional, Literal, Union, Dict, Any
-import re
+from operator import attrgetter
 
 _NODE_CLASSES: Dict[str, type] = {}
 
@@ -9,21 +8,103 @@ def _register_node_class(cls: type) -> type:
     _NODE_CLASSES[cls.__name__] = cls
     return cls
 
+# Characters that mark truncation/wildcards in Google (*, ?) and USPTO ($, ?) syntax.
+_WILDCARD_CHARS = frozenset("?*$")
+
+# --- Compact wire format ---
+# An AST is flattened breadth-first into a node table, so the root is entry 0
+# and every child comes after its parent:
+#   {"v": COMPACT_SCHEMA_VERSION, "n": [[type_code, field, field, ...], ...]}
+# Fields follow the class's `_fields` order with trailing None values dropped.
+# A field listed in `_child_fields` holds the table index of its child node
+# (or a list of indices).
+COMPACT_SCHEMA_VERSION = 1
+
+# Type codes are part of the wire format: only ever append to this tuple.
+_COMPACT_TYPE_NAMES = (
+    "TermNode", "ClassificationNode", "BooleanOpNode", "ProximityOpNode",
+    "FieldedSearchNode", "DateSearchNode", "QueryRootNode",
+)
+_COMPACT_TYPE_CODES = {name: code for code, name in enumerate(_COMPACT_TYPE_NAMES)}
+# Child fields that hold a list of indices; the others hold one index.
+_COMPACT_LIST_FIELDS = frozenset({"operands", "terms"})
+
+# Every node class declares its public attributes once in `_fields`, in
+# constructor order. `__slots__` is derived from it, and equality, repr and
+# (de)serialization iterate it instead of reflecting over `__dict__`.
+# `_child_fields` names the fields that hold a node or a list of nodes.
+#
+# Nodes are hashable. The structural hash is computed once and cached in the
+# `_hash` slot, so a tree must not be modified after it has been hashed or
+# compared; build a new node instead. (Parsed ASTs are shared through the
+# service caches and are never modified.)
 @_register_node_class
 class ASTNode:
+    __slots__ = ('_hash',)
+    _fields: tuple = ()
+    _child_fields: tuple = ()
+    _child_field_positions: tuple = ()
+
     def __init__(self): pass
     def __eq__(self, other):
-        if type(other) is type(self):
-            return all(getattr(self, k, None) == getattr(other, k, None) for k in self.get_compare_attrs())
-        return False
-    def get_compare_attrs(self): return [k for k, v in self.__dict__.items() if not k.startswith('_')]
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return False
+        # Cached hashes reject most unequal trees without walking them.
+        if hash(self) != hash(other):
+            return False
+        return all(getattr(self, k) == getattr(other, k) for k in self._fields)
+    def __hash__(self) -> int:
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        # Post-order over the nodes not hashed yet, without recursion, so a
+        # node's children are always hashed before the node itself. Leaves
+        # hold only scalars and are hashed directly.
+        if not self._child_field_positions:
+            self._hash = hash((self._compact_code, *self._compact_getter(self)))
+            return self._hash
+        stack: List[tuple] = [(self, False)]
+        while stack:
+            node, children_hashed = stack.pop()
+            if children_hashed:
+                values = []
+                for value in node._compact_getter(node):
+                    if type(value) is list:
+                        value = tuple(value)
+                    elif type(value) is dict:
+                        value = None  # QueryRootNode.settings: equality still checks it
+                    values.append(value)
+                node._hash = hash((node._compact_code, *values))
+                continue
+            stack.append((node, True))
+            for i in node._child_field_positions:
+                children = getattr(node, node._fields[i])
+                for child in (children if type(children) is list else (children,)):
+                    if hasattr(child, '_hash'):
+                        continue
+                    if child._child_field_positions:
+                        stack.append((child, False))
+                    else:
+                        child._hash = hash((child._compact_code, *child._compact_getter(child)))
+        return self._hash
+    def __getstate__(self):
+        # str hashes are salted per process, so the cached hash is not pickled
+        # (e.g. when an AST is sent to or from a worker process).
+        return None, {k: getattr(self, k) for k in self._fields}
+    def get_compare_attrs(self): return list(self._fields)
     def __repr__(self):
-        attrs = {k: v for k, v in self.__dict__.items() if not k.startswith('_') and v is not None}
-        return f"{self.__class__.__name__}({', '.join(f'{k}={v!r}' for k, v in attrs.items())})"
+        parts = []
+        for k in self._fields:
+            v = getattr(self, k)
+            if v is not None: parts.append(f'{k}={v!r}')
+        return f"{self.__class__.__name__}({', '.join(parts)})"
     def to_dict(self) -> Dict[str, Any]:
         data = {'node_type': self.__class__.__name__}
-        for key, value in self.__dict__.items():
-            if key.startswith('_'): continue
+        for key in self._fields:
+            value = getattr(self, key)
             if isinstance(value, ASTNode): data[key] = value.to_dict()
             elif isinstance(value, list) and all(isinstance(item, ASTNode) for item in value):
                 data[key] = [item.to_dict() for item in value]
@@ -32,71 +113,145 @@ class ASTNode:
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ASTNode':
-        node_type_str = data.pop('node_type', None)
+        node_type_str = data.get('node_type')
         if not node_type_str: raise ValueError("Missing 'node_type'")
-        
+
         target_class = _NODE_CLASSES.get(node_type_str)
         if not target_class:
             raise ValueError(f"Unknown AST node_type: {node_type_str} in registry. Ensure it's decorated with @_register_node_class.")
 
         processed_args = {}
         for key, value in data.items():
+            if key == 'node_type': continue
             if isinstance(value, dict) and 'node_type' in value:
                 processed_args[key] = ASTNode.from_dict(value) # Recursive call
             elif isinstance(value, list) and value and isinstance(value[0], dict) and 'node_type' in value[0]:
                 processed_args[key] = [ASTNode.from_dict(item) for item in value]
             else:
                 processed_args[key] = value
-        
+
         return target_class(**processed_args)
 
+    def to_compact(self) -> Dict[str, Any]:
+        """Encodes this tree in the compact format. Iterative, so depth is not limited by recursion."""
+        table: List[list] = []
+        # Nodes in table order. A child's index is fixed when it is queued,
+        # so each row is complete as soon as it is built.
+        queue: List[ASTNode] = [self]
+        for node in queue:
+            row = [node._compact_code, *node._compact_getter(node)]
+            for i in node._child_field_positions:
+                value = row[i + 1]
+                if type(value) is list:
+                    row[i + 1] = list(range(len(queue), len(queue) + len(value)))
+                    queue.extend(value)
+                else:
+                    row[i + 1] = len(queue)
+                    queue.append(value)
+            while row[-1] is None:
+                row.pop()
+            table.append(row)
+        return {"v": COMPACT_SCHEMA_VERSION, "n": table}
+
+    @classmethod
+    def from_compact(cls, data: Dict[str, Any]) -> 'ASTNode':
+        """
+        Decodes the output of `to_compact`. Does not modify `data`. Raises
+        ValueError for any other input: an unknown version or type code, a
+        row with too many fields, or a child index that is missing, out of
+        range or does not come after its parent.
+        """
+        version = data.get("v") if isinstance(data, dict) else None
+        if version != COMPACT_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported compact AST schema version: {version!r}")
+        table = data.get("n")
+        if not table or type(table) is not list:
+            raise ValueError("Compact AST has no nodes")
+
+        # Children always come after their parent, so build from the end.
+        nodes: List[Any] = [None] * len(table)
+        for position in range(len(table) - 1, -1, -1):
+            row = table[position]
+            type_code = row[0] if type(row) is list and row else None
+            if type(type_code) is not int or not 0 <= type_code < len(_COMPACT_CLASSES):
+                raise ValueError(f"Unknown compact type code {type_code!r} at node {position}")
+            target_class = _COMPACT_CLASSES[type_code]
+            name = target_class.__name__
+            args = row[1:]
+            if len(args) > len(target_class._fields):
+                raise ValueError(f"Node {position} has {len(args)} fields; {name} has {len(target_class._fields)}")
+            for i in target_class._child_field_positions:
+                field = target_class._fields[i]
+                refs = args[i] if i < len(args) else None
+                if refs is None:
+                    raise ValueError(f"Node {position} ({name}) has no {field}")
+                is_list = field in _COMPACT_LIST_FIELDS
+                if (type(refs) is list) is not is_list:
+                    raise ValueError(f"Node {position} ({name}) needs {'a list of indices' if is_list else 'one index'} for {field}")
+                for ref in (refs if is_list else (refs,)):
+                    if type(ref) is not int or not position < ref < len(nodes):
+                        raise ValueError(f"Invalid child reference {ref!r} in node {position} ({name}.{field})")
+                args[i] = [nodes[ref] for ref in refs] if is_list else nodes[refs]
+            nodes[position] = target_class(*args)
+        return nodes[0]
+
 @_register_node_class
 class TermNode(ASTNode):
+    __slots__ = _fields = ('value', 'is_phrase', 'has_wildcard')
     def __init__(self, value: str, is_phrase: bool = False, has_wildcard: Optional[bool] = None):
-        super().__init__(); self.value = value; self.is_phrase = is_phrase
-        if has_wildcard is None: self.has_wildcard = bool(re.search(r'[\?\*\$]', value)) if value else False
-        else: self.has_wildcard = has_wildcard
-    def get_compare_attrs(self): return ['value', 'is_phrase', 'has_wildcard']
+        self.value = value; self.is_phrase = is_phrase
+        # A set-disjointness test runs in C and avoids a regex search per term.
+        self.has_wildcard = (not _WILDCARD_CHARS.isdisjoint(value) if value else False) if has_wildcard is None else has_wildcard
 
 @_register_node_class
 class ClassificationNode(ASTNode):
+    __slots__ = _fields = ('scheme', 'value', 'include_children')
     def __init__(self, scheme: Literal["CPC", "IPC", "USPC", "CCLS"], value: str, include_children: bool = False):
-        super().__init__(); self.scheme = scheme; self.value = value; self.include_children = include_children
-    def get_compare_attrs(self): return ['scheme', 'value', 'include_children']
+        self.scheme = scheme; self.value = value; self.include_children = include_children
 
 @_register_node_class
 class BooleanOpNode(ASTNode):
+    __slots__ = _fields = ('operator', 'operands')
+    _child_fields = ('operands',)
     def __init__(self, operator: Literal["AND", "OR", "NOT", "XOR"], operands: List[ASTNode]):
-        super().__init__(); self.operator = operator; self.operands = operands
-    def get_compare_attrs(self): return ['operator', 'operands']
+        self.operator = operator; self.operands = operands
 
 @_register_node_class
 class ProximityOpNode(ASTNode):
+    __slots__ = _fields = ('operator', 'terms', 'distance', 'ordered', 'scope_unit')
+    _child_fields = ('terms',)
     def __init__(self, operator: Literal["ADJ", "NEAR", "WITH", "SAME"], terms: List[ASTNode],
                  distance: Optional[int] = None, ordered: bool = False,
                  scope_unit: Optional[Literal["word", "sentence", "paragraph"]] = None):
-        super().__init__(); self.operator = operator; self.terms = terms; self.distance = distance
+        self.operator = operator; self.terms = terms; self.distance = distance
         self.ordered = ordered; self.scope_unit = scope_unit
-    def get_compare_attrs(self): return ['operator', 'terms', 'distance', 'ordered', 'scope_unit']
 
 @_register_node_class
 class FieldedSearchNode(ASTNode):
+    __slots__ = _fields = ('field_canonical_name', 'query', 'system_field_code')
+    _child_fields = ('query',)
     def __init__(self, field_canonical_name: str, query: ASTNode, system_field_code: Optional[str] = None):
-        super().__init__(); self.field_canonical_name = field_canonical_name; self.query = query
+        self.field_canonical_name = field_canonical_name; self.query = query
         self.system_field_code = system_field_code
-    def get_compare_attrs(self): return ['field_canonical_name', 'query', 'system_field_code']
 
 @_register_node_class
 class DateSearchNode(ASTNode):
+    __slots__ = _fields = ('field_canonical_name', 'operator', 'date_value', 'date_value2', 'system_field_code')
     def __init__(self, field_canonical_name: Literal["publication_date", "application_date", "priority_date", "issue_date", "application_year", "publication_year"],
                  operator: Literal[">=", "<=", "=", ">", "<", "<>"], date_value: str,
                  date_value2: Optional[str] = None, system_field_code: Optional[str] = None):
-        super().__init__(); self.field_canonical_name = field_canonical_name; self.operator = operator
+        self.field_canonical_name = field_canonical_name; self.operator = operator
         self.date_value = date_value; self.date_value2 = date_value2; self.system_field_code = system_field_code
-    def get_compare_attrs(self): return ['field_canonical_name', 'operator', 'date_value', 'date_value2', 'system_field_code']
 
 @_register_node_class
 class QueryRootNode(ASTNode):
+    __slots__ = _fields = ('query', 'settings')
+    _child_fields = ('query',)
     def __init__(self, query: ASTNode, settings: Optional[Dict[str, Any]] = None):
-        super().__init__(); self.query = query; self.settings = settings if settings else {}
-    def get_compare_attrs(self): return ['query', 'settings']
\ No newline at end of file
+        self.query = query; self.settings = settings if settings else {}
+
+_COMPACT_CLASSES = tuple(_NODE_CLASSES[name] for name in _COMPACT_TYPE_NAMES)
+for _cls in _COMPACT_CLASSES:
+    _cls._compact_code = _COMPACT_TYPE_CODES[_cls.__name__]
+    _cls._child_field_positions = tuple(_cls._fields.index(key) for key in _cls._child_fields)
+    _cls._compact_getter = attrgetter(*_cls._fields)
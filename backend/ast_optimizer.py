@@ -0,0 +1,193 @@
+# ast_optimizer.py
+from typing import Dict, List, Optional, Tuple
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode
+)
+
+# --- AST optimizer ---
+# Rewrites a parsed AST into an equivalent, smaller one before generation:
+#   - "__EMPTY__" terms are dropped, along with operators left without operands;
+#   - nested AND/OR of the same operator are flattened and single-operand
+#     AND/OR replaced by their operand;
+#   - duplicate AND/OR operands are removed (first occurrence kept);
+#   - date bounds on the same field and operator are merged into the tightest
+#     one under AND and the loosest one under OR;
+#   - a field nested in the same field is unwrapped, and sibling clauses on the
+#     same text field are merged (TI=a OR TI=b -> TI=(a OR b)).
+# Operand order is otherwise preserved, so the output reads like the input.
+# The input tree is never modified; unchanged subtrees are reused as is.
+
+EMPTY_TERM = "__EMPTY__"
+ASSOCIATIVE_OPERATORS = {"AND", "OR"}
+# Fields whose sibling clauses may share one wrapper. Classification and
+# structured-form fields (inventor, country, ...) are left as separate clauses:
+# the generators and the search form expect one value per clause there.
+MERGEABLE_FIELDS = {"title", "abstract", "claims", "description", "brief_summary", "text_all_core"}
+LOWER_BOUND_OPERATORS = {">=", ">"}
+UPPER_BOUND_OPERATORS = {"<=", "<"}
+
+
+def optimize(root: QueryRootNode) -> QueryRootNode:
+    """Returns an optimized copy of `root`. An AST that optimizes away entirely becomes "__EMPTY__"."""
+    query = _optimize(root.query)
+    if query is root.query:
+        return root
+    return QueryRootNode(query=query if query is not None else TermNode(EMPTY_TERM), settings=root.settings)
+
+
+def _optimize(node: ASTNode) -> Optional[ASTNode]:
+    """Returns the optimized node, the same object if nothing changed, or None if it is empty."""
+    if isinstance(node, TermNode):
+        return None if node.value == EMPTY_TERM else node
+
+    if isinstance(node, BooleanOpNode):
+        return _optimize_boolean(node)
+
+    if isinstance(node, ProximityOpNode):
+        terms = [term for term in (_optimize(t) for t in node.terms) if term is not None]
+        if len(terms) < 2:
+            return terms[0] if terms else None
+        if _same_children(terms, node.terms):
+            return node
+        return ProximityOpNode(node.operator, terms, distance=node.distance,
+                               ordered=node.ordered, scope_unit=node.scope_unit)
+
+    if isinstance(node, FieldedSearchNode):
+        query = _optimize(node.query)
+        if query is None:
+            return None
+        # TI=(TI=x) searches the same field twice.
+        while isinstance(query, FieldedSearchNode) and query.field_canonical_name == node.field_canonical_name:
+            query = query.query
+        if query is node.query:
+            return node
+        return FieldedSearchNode(node.field_canonical_name, query, system_field_code=node.system_field_code)
+
+    return node
+
+
+def _optimize_boolean(node: BooleanOpNode) -> Optional[ASTNode]:
+    operator = node.operator.upper()
+    optimized = [_optimize(op) for op in node.operands]
+
+    if operator == "NOT" and len(optimized) > 1:
+        # Binary "a NOT b NOT c": without exclusions it is just a; with nothing
+        # to exclude from, only the exclusion is left.
+        left, excluded = optimized[0], [op for op in optimized[1:] if op is not None]
+        if not excluded:
+            return left
+        if left is None:
+            return BooleanOpNode("NOT", [excluded[0] if len(excluded) == 1 else BooleanOpNode("OR", excluded)])
+        operands = [left] + excluded
+        return node if _same_children(operands, node.operands) else BooleanOpNode(node.operator, operands)
+
+    operands = [op for op in optimized if op is not None]
+    if operator in ASSOCIATIVE_OPERATORS:
+        flattened: List[ASTNode] = []
+        for op in operands:
+            if isinstance(op, BooleanOpNode) and op.operator.upper() == operator:
+                flattened.extend(op.operands)
+            else:
+                flattened.append(op)
+        operands = _merge_fields(operator, _merge_dates(operator, _dedupe(flattened)))
+
+    if not operands:
+        return None
+    if len(operands) == 1 and operator != "NOT":
+        return operands[0]
+    if _same_children(operands, node.operands):
+        return node
+    return BooleanOpNode(node.operator, operands)
+
+
+def _same_children(new: List[ASTNode], old: List[ASTNode]) -> bool:
+    return len(new) == len(old) and all(a is b for a, b in zip(new, old))
+
+
+def _dedupe(operands: List[ASTNode]) -> List[ASTNode]:
+    # AST nodes hash structurally, so equal subtrees collapse to one.
+    seen = set()
+    result = []
+    for op in operands:
+        if op not in seen:
+            seen.add(op)
+            result.append(op)
+    return result
+
+
+def _date_sort_key(value: str) -> Optional[str]:
+    digits = value.replace("-", "")
+    return digits if digits.isdigit() else None
+
+
+def _merge_dates(operator: str, operands: List[ASTNode]) -> List[ASTNode]:
+    """
+    Keeps one bound per (field, comparison) among the direct operands. Under
+    AND the tightest bound wins (the latest "after", the earliest "before");
+    under OR the loosest. The survivor takes the first bound's position.
+    """
+    best: Dict[Tuple[str, str], int] = {}
+    result: List[ASTNode] = []
+    for op in operands:
+        if not (isinstance(op, DateSearchNode) and op.date_value2 is None
+                and op.operator in LOWER_BOUND_OPERATORS | UPPER_BOUND_OPERATORS):
+            result.append(op)
+            continue
+        value = _date_sort_key(op.date_value)
+        key = (op.field_canonical_name, op.operator)
+        position = best.get(key)
+        if value is None or position is None:
+            if value is not None:
+                best[key] = len(result)
+            result.append(op)
+            continue
+        current = result[position]
+        current_value = _date_sort_key(current.date_value)  # type: ignore
+        if len(current_value) != len(value):  # type: ignore
+            result.append(op)  # Different precision (year vs full date): leave both.
+            continue
+        later = value > current_value  # type: ignore
+        # AND of lower bounds keeps the later date; OR keeps the earlier. Upper bounds are the mirror image.
+        want_later = (operator == "AND") == (op.operator in LOWER_BOUND_OPERATORS)
+        if later == want_later and value != current_value:
+            result[position] = op
+    return result
+
+
+def _merge_fields(operator: str, operands: List[ASTNode]) -> List[ASTNode]:
+    """Merges sibling clauses on the same text field into one field wrapping an `operator` group."""
+    groups: Dict[Tuple[str, Optional[str]], List[ASTNode]] = {}
+    order: List[object] = []
+    for op in operands:
+        if isinstance(op, FieldedSearchNode) and op.field_canonical_name in MERGEABLE_FIELDS:
+            key = (op.field_canonical_name, op.system_field_code)
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(op)
+        else:
+            order.append(op)
+    if all(len(group) == 1 for group in groups.values()):
+        return operands
+
+    result: List[ASTNode] = []
+    for item in order:
+        if not isinstance(item, tuple):
+            result.append(item)  # type: ignore
+            continue
+        fields = groups[item]
+        if len(fields) == 1:
+            result.append(fields[0])
+            continue
+        inner: List[ASTNode] = []
+        for field in fields:
+            query = field.query  # type: ignore
+            if isinstance(query, BooleanOpNode) and query.operator.upper() == operator:
+                inner.extend(query.operands)
+            else:
+                inner.append(query)
+        first = fields[0]
+        result.append(FieldedSearchNode(first.field_canonical_name, BooleanOpNode(operator, _dedupe(inner)),  # type: ignore
+                                        system_field_code=first.system_field_code))  # type: ignore
+    return result
@@ -0,0 +1,101 @@
+# benchmarks/bench_evaluator.py
+"""
+Hit-count throughput of evaluator.CorpusIndex over a synthetic patent corpus
+and the query shapes in corpus.py.
+
+Run from the backend directory:
+    python benchmarks/bench_evaluator.py                      # 100k documents
+    python benchmarks/bench_evaluator.py --docs 1000000 --queries 200
+    python benchmarks/bench_evaluator.py --corpus patents.jsonl
+
+For each query shape, "cold" runs the queries once on an empty cache and
+"warm" runs them again, as when scoring many variants that share most of
+their clauses.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from evaluator import BITSET_CACHE_BYTES, CorpusIndex
+from google_parser import GoogleQueryParser
+from corpus import CPC_SYMBOLS, DEFAULT_SEED, SHAPES, VOCABULARY
+
+# Zipf-like filler so the index has a realistic long tail next to VOCABULARY.
+FILLER_WORDS = [f"w{i}" for i in range(5000)]
+ASSIGNEES = ("Acme Energy", "Globex Corp", "Initech", "Umbrella Labs", "Stark Industries")
+COUNTRIES = ("US", "EP", "CN", "JP", "KR", "WO")
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(
+        rng.choice(VOCABULARY) if rng.random() < 0.05 else FILLER_WORDS[int(rng.paretovariate(1.2)) % len(FILLER_WORDS)]
+        for _ in range(words)
+    ) + "."
+
+
+def synthetic_patents(count: int, seed: int = DEFAULT_SEED) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(f"{seed}:patents")
+    for i in range(count):
+        symbol = rng.choice(CPC_SYMBOLS)
+        yield {
+            "id": f"US{10000000 + i}",
+            "title": _sentence(rng, rng.randint(4, 10)),
+            "abstract": " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 4))),
+            "claims": [_sentence(rng, rng.randint(10, 25)) for _ in range(rng.randint(1, 4))],
+            "cpc": [symbol, symbol.split("/")[0] + f"/{rng.randint(1, 99):02d}"],
+            "assignee": rng.choice(ASSIGNEES),
+            "country_code": rng.choice(COUNTRIES),
+            "publication_date": f"{rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "application_date": f"{rng.randint(1988, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        }
+
+
+def build_queries(shape: str, count: int, seed: int = DEFAULT_SEED) -> List[Any]:
+    """`count` parsed `shape` queries of one to four clauses."""
+    parser = GoogleQueryParser()
+    rng = random.Random(f"{seed}:evaluator:{shape}")
+    return [parser.parse(SHAPES[shape](rng.randint(1, 4), rng)) for _ in range(count)]
+
+
+def run(index: CorpusIndex, queries: List[Any]) -> Tuple[float, float]:
+    """Queries per second and mean hits over `queries`."""
+    start = time.perf_counter()
+    hits = sum(index.count(query) for query in queries)
+    return len(queries) / (time.perf_counter() - start), hits / len(queries)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--docs", type=int, default=100_000, help="synthetic corpus size")
+    arg_parser.add_argument("--corpus", help="JSONL corpus to load instead of the synthetic one")
+    arg_parser.add_argument("--queries", type=int, default=500, help="queries per shape")
+    arg_parser.add_argument("--cache-mb", type=int, default=BITSET_CACHE_BYTES >> 20)
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    cache_bytes = args.cache_mb << 20
+    if args.corpus:
+        index = CorpusIndex.from_jsonl(args.corpus, cache_bytes)
+    else:
+        index = CorpusIndex.from_records(synthetic_patents(args.docs), cache_bytes)
+    print(f"indexed {index.size} documents in {time.perf_counter() - start:.1f} s")
+
+    print(f"{'shape':<16} {'cold q/s':>10} {'warm q/s':>10} {'mean hits':>10}")
+    for shape in SHAPES:
+        if shape == "deep_nesting":
+            continue
+        queries = build_queries(shape, args.queries)
+        index.clear_cache()
+        cold, hits = run(index, queries)
+        warm, _ = run(index, queries)
+        print(f"{shape:<16} {cold:>10.0f} {warm:>10.0f} {hits:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_google_generator.py
+"""
+Throughput of ASTToGoogleQueryGenerator on wide and deep trees.
+
+Run from the backend directory:
+    python benchmarks/bench_google_generator.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ast_nodes import ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode, FieldedSearchNode
+from google_generator import ASTToGoogleQueryGenerator
+
+
+def wide_tree(width: int) -> QueryRootNode:
+    """An OR of `width` synonyms, each a term or a short proximity pair."""
+    operands = [
+        ProximityOpNode("NEAR", [TermNode(f"a{i}"), TermNode(f"b{i}")], distance=3) if i % 4 == 0 else TermNode(f"syn{i}")
+        for i in range(width)
+    ]
+    return QueryRootNode(query=FieldedSearchNode("title", BooleanOpNode("OR", operands)))
+
+
+def deep_tree(depth: int) -> QueryRootNode:
+    """Alternating AND/OR nesting `depth` levels deep, two terms per level."""
+    node: ASTNode = TermNode("leaf")
+    for i in range(depth):
+        node = BooleanOpNode("OR" if i % 2 else "AND", [TermNode(f"t{i}"), node])
+    return QueryRootNode(query=node)
+
+
+def bench(label: str, root: QueryRootNode, generator: ASTToGoogleQueryGenerator) -> None:
+    try:
+        generator.generate(root)
+    except RecursionError:
+        print(f"{label:<14} RecursionError")
+        return
+    timer = timeit.Timer(lambda: generator.generate(root))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=5, number=number)) / number
+    print(f"{label:<14} {1 / best:>12,.1f} ops/sec  {best * 1e6:>12,.1f} us/op")
+
+
+def main() -> None:
+    generator = ASTToGoogleQueryGenerator()
+    for width in (10, 100, 1000, 10000):
+        bench(f"wide {width}", wide_tree(width), generator)
+    for depth in (10, 100, 900, 5000):
+        bench(f"deep {depth}", deep_tree(depth), generator)
+
+
+if __name__ == "__main__":
+    main()
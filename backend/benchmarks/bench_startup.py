@@ -0,0 +1,61 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start cost of the services module with lazily and eagerly built dialects.
+
+Each sample is a fresh interpreter that times `import services` and then the
+first Google -> Google conversion, which builds only the Google dialect.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py [--runs 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import services
+imported = time.perf_counter()
+services._convert_one("battery (anode OR cathode)", "google", "google", use_cache=False)
+converted = time.perf_counter()
+dialect_modules = [m for m in ("google_parser", "google_generator", "uspto_parser", "uspto_generator") if m in sys.modules]
+print(json.dumps({"import": imported - started, "first_convert": converted - imported, "modules": dialect_modules}))
+"""
+
+
+def sample(eager: bool) -> dict:
+    env = dict(os.environ, PATENTPEEK_EAGER_DIALECTS="1" if eager else "0", PYTHONWARNINGS="ignore")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--runs", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    # Warm the OS file cache and .pyc files so the first mode is not penalized.
+    sample(eager=True)
+    results = {}
+    for label, eager in (("eager", True), ("lazy", False)):
+        samples = [sample(eager) for _ in range(args.runs)]
+        results[label] = {
+            "import_ms": statistics.median(s["import"] for s in samples) * 1000,
+            "first_convert_ms": statistics.median(s["first_convert"] for s in samples) * 1000,
+            "modules": samples[-1]["modules"],
+        }
+    for label, r in results.items():
+        total = r["import_ms"] + r["first_convert_ms"]
+        print(f"{label:<6} import {r['import_ms']:8.2f} ms   first convert {r['first_convert_ms']:7.2f} ms   "
+              f"total {total:8.2f} ms   dialect modules loaded: {', '.join(r['modules'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/corpus.py
+"""
+Deterministic synthetic Google Patents queries for benchmarking.
+
+Every shape is a function `(size, rng) -> query string` where `size` is the
+number of clauses. The same (shape, size, seed) always yields the same query,
+so results from different commits are comparable.
+"""
+import random
+from typing import Callable, Dict, List
+
+DEFAULT_SEED = 20240611
+
+VOCABULARY = (
+    "battery", "lithium", "anode", "cathode", "electrolyte", "separator", "polymer",
+    "solar", "cell", "panel", "inverter", "sensor", "wireless", "antenna", "signal",
+    "vehicle", "brake", "engine", "turbine", "blade", "rotor", "valve", "pump",
+    "semiconductor", "wafer", "etching", "laser", "optical", "fiber", "lens",
+)
+FIELD_CODES = ("TI", "AB", "CL", "TAC")
+CPC_SYMBOLS = ("H01M10/0525", "H01M4/13", "H02J7/00", "G06F21/62", "H04L9/32", "B60L58/12")
+PROXIMITY_OPERATORS = ("NEAR3", "NEAR5", "ADJ", "ADJ2", "WITH", "SAME")
+DATE_TYPES = ("publication", "filing", "priority")
+
+
+def _term(rng: random.Random) -> str:
+    word = rng.choice(VOCABULARY)
+    roll = rng.random()
+    if roll < 0.1:
+        return f'"{word} {rng.choice(VOCABULARY)}"'
+    if roll < 0.2:
+        return word[:5] + "*"
+    return word
+
+
+def _date(rng: random.Random) -> str:
+    keyword = rng.choice(("after", "before"))
+    return f"{keyword}:{rng.choice(DATE_TYPES)}:{rng.randint(1990, 2024)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+
+
+def wide_or(size: int, rng: random.Random) -> str:
+    """One OR group of `size` synonyms."""
+    return "(" + " OR ".join(_term(rng) for _ in range(size)) + ")"
+
+
+def deep_nesting(size: int, rng: random.Random) -> str:
+    """`size` levels of parenthesized alternating AND/OR groups."""
+    query = _term(rng)
+    for level in range(size):
+        operator = "OR" if level % 2 else "AND"
+        query = f"({_term(rng)} {operator} {query})"
+    return query
+
+
+def proximity_chain(size: int, rng: random.Random) -> str:
+    """`size` proximity pairs joined by AND, some wrapped around OR groups."""
+    clauses = []
+    for _ in range(size):
+        left = _term(rng) if rng.random() < 0.7 else f"({_term(rng)} OR {_term(rng)})"
+        clauses.append(f"{left} {rng.choice(PROXIMITY_OPERATORS)} {_term(rng)}")
+    return " AND ".join(clauses)
+
+
+def fielded(size: int, rng: random.Random) -> str:
+    """`size` field clauses: text fields around OR groups plus CPC symbols."""
+    clauses = []
+    for _ in range(size):
+        if rng.random() < 0.25:
+            clauses.append(f"CPC={rng.choice(CPC_SYMBOLS)}")
+        else:
+            clauses.append(f"{rng.choice(FIELD_CODES)}=({_term(rng)} OR {_term(rng)})")
+    return " ".join(clauses)
+
+
+def dates(size: int, rng: random.Random) -> str:
+    """`size` date restrictions around a short text query."""
+    return " ".join([f"({_term(rng)} OR {_term(rng)})"] + [_date(rng) for _ in range(size)])
+
+
+def mixed(size: int, rng: random.Random) -> str:
+    """`size` clauses drawn from all the other shapes."""
+    builders = (wide_or, proximity_chain, fielded, dates)
+    return " ".join(rng.choice(builders)(rng.randint(1, 4), rng) for _ in range(size))
+
+
+SHAPES: Dict[str, Callable[[int, random.Random], str]] = {
+    "wide_or": wide_or,
+    "deep_nesting": deep_nesting,
+    "proximity_chain": proximity_chain,
+    "fielded": fielded,
+    "dates": dates,
+    "mixed": mixed,
+}
+
+# Sizes for the scaling curves. Nesting stays well inside the parser's
+# recursion limit.
+SIZES: Dict[str, List[int]] = {
+    "wide_or": [10, 100, 1000],
+    "deep_nesting": [5, 25, 100],
+    "proximity_chain": [5, 50, 500],
+    "fielded": [5, 50, 500],
+    "dates": [2, 20, 200],
+    "mixed": [5, 50, 200],
+}
+
+
+def build_query(shape: str, size: int, seed: int = DEFAULT_SEED) -> str:
+    # Seed per (shape, size) so adding a shape or size leaves the others unchanged.
+    rng = random.Random(f"{seed}:{shape}:{size}")
+    return SHAPES[shape](size, rng)
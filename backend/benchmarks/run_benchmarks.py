@@ -0,0 +1,231 @@
+# benchmarks/run_benchmarks.py
+"""
+Microbenchmarks for the query hot path: parsing, generation, AST
+serialization, round trips and the services pipelines, over the synthetic
+corpus in corpus.py.
+
+Run from the backend directory:
+    python benchmarks/run_benchmarks.py                      # full run, saves JSON
+    python benchmarks/run_benchmarks.py --quick --only parse
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json
+
+Results go to benchmarks/results/<commit>.json unless --output is given.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import models
+import services
+from ast_nodes import ASTNode
+from google_parser import GoogleQueryParser, QueryEdit
+from google_generator import ASTToGoogleQueryGenerator
+from corpus import DEFAULT_SEED, SHAPES, SIZES, build_query
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+# A benchmark turns a corpus query into the zero-argument callable to time.
+Benchmark = Callable[[str], Callable[[], Any]]
+
+_parser = GoogleQueryParser()
+_generator = ASTToGoogleQueryGenerator()
+
+
+def _clear_caches() -> None:
+    services.PARSE_CACHE.clear()
+    services.PARSE_STATE_CACHE.clear()
+    services.GENERATE_CACHE.clear()
+
+
+def bench_parse(query: str) -> Callable[[], Any]:
+    return lambda: _parser.parse(query)
+
+
+def bench_reparse(query: str) -> Callable[[], Any]:
+    # One character typed in the middle of the query, as in parse-as-you-type.
+    _, state = _parser.parse_with_state(query)
+    if state is None:
+        return lambda: _parser.parse(query)
+    middle = len(state.query) // 2
+    edit = QueryEdit(middle, middle, "x")
+    return lambda: _parser.reparse(state, edit)
+
+
+def bench_generate(query: str) -> Callable[[], Any]:
+    ast_root = _parser.parse(query)
+    return lambda: _generator.generate(ast_root)
+
+
+def bench_to_dict(query: str) -> Callable[[], Any]:
+    ast_root = _parser.parse(query)
+    return ast_root.to_dict
+
+
+def bench_from_dict(query: str) -> Callable[[], Any]:
+    data = _parser.parse(query).to_dict()
+    return lambda: ASTNode.from_dict(data)
+
+
+def bench_roundtrip(query: str) -> Callable[[], Any]:
+    return lambda: _generator.generate(_parser.parse(query))
+
+
+def bench_serialize_roundtrip(query: str) -> Callable[[], Any]:
+    ast_root = _parser.parse(query)
+    return lambda: ASTNode.from_dict(ast_root.to_dict())
+
+
+def bench_services_parse(query: str) -> Callable[[], Any]:
+    req = models.ParseRequest(format="google", queryString=query)
+    def run():
+        # Time the full pipeline, not a cache hit.
+        _clear_caches()
+        return services.parse_query_json(req)
+    return run
+
+
+def bench_services_generate(query: str) -> Callable[[], Any]:
+    req = models.GenerateRequest(
+        format="google",
+        searchConditions=[models.SearchCondition(type="TEXT", data=models.TextSearchData(type="TEXT", text=query))],
+    )
+    def run():
+        _clear_caches()
+        return services.generate_query_json(req)
+    return run
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "google_parser.parse": bench_parse,
+    "google_parser.reparse": bench_reparse,
+    "google_generator.generate": bench_generate,
+    "ast.to_dict": bench_to_dict,
+    "ast.from_dict": bench_from_dict,
+    "roundtrip.text": bench_roundtrip,
+    "roundtrip.dict": bench_serialize_roundtrip,
+    "services.parse_query": bench_services_parse,
+    "services.generate_query": bench_services_generate,
+}
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> float:
+    """Best seconds per call over `repeat` rounds of at least `min_time` each."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed * 1.1)) if elapsed > 0 else number * 10
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, timer.timeit(number) / number)
+    return best
+
+
+def scaling_exponent(points: List[Dict[str, Any]]) -> Optional[float]:
+    """Slope of log(time) over log(size) between the smallest and largest size. 1.0 is linear."""
+    if len(points) < 2:
+        return None
+    first, last = points[0], points[-1]
+    if first["size"] == last["size"]:
+        return None
+    return round(math.log(last["seconds_per_op"] / first["seconds_per_op"]) / math.log(last["size"] / first["size"]), 3)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(only: Optional[str], shapes: List[str], quick: bool, seed: int) -> Dict[str, Any]:
+    repeat, min_time = (3, 0.05) if quick else (5, 0.2)
+    curves = []
+    for name, benchmark in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        for shape in shapes:
+            sizes = SIZES[shape][:2] if quick else SIZES[shape]
+            points = []
+            for size in sizes:
+                query = build_query(shape, size, seed)
+                seconds = measure(benchmark(query), repeat, min_time)
+                points.append({
+                    "size": size, "query_chars": len(query),
+                    "ops_per_sec": round(1 / seconds, 1), "seconds_per_op": seconds,
+                })
+                print(f"{name:<26} {shape:<16} {size:>6} {1 / seconds:>14,.1f} ops/sec {seconds * 1e6:>12,.1f} us/op")
+            curves.append({
+                "benchmark": name, "shape": shape, "points": points,
+                "scaling_exponent": scaling_exponent(points),
+            })
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "quick": quick,
+        },
+        "results": curves,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Prints the speedup of `current` over `baseline` for every point they share."""
+    base_points = {
+        (curve["benchmark"], curve["shape"], point["size"]): point["ops_per_sec"]
+        for curve in baseline["results"] for point in curve["points"]
+    }
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} (>1.00x is faster):")
+    for curve in current["results"]:
+        for point in curve["points"]:
+            base = base_points.get((curve["benchmark"], curve["shape"], point["size"]))
+            if base:
+                print(f"{curve['benchmark']:<26} {curve['shape']:<16} {point['size']:>6} {point['ops_per_sec'] / base:>8.2f}x")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--only", help="run benchmarks whose name contains this text")
+    arg_parser.add_argument("--shape", action="append", choices=sorted(SHAPES), help="corpus shape (repeatable)")
+    arg_parser.add_argument("--quick", action="store_true", help="fewer sizes and shorter timing rounds")
+    arg_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    arg_parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<commit>.json)")
+    arg_parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = arg_parser.parse_args()
+
+    report = run(args.only, args.shape or list(SHAPES), args.quick, args.seed)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'local'}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
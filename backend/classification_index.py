@@ -0,0 +1,263 @@
+# classification_index.py
+from array import array
+from hashlib import blake2b
+from typing import List, NamedTuple, Optional, Tuple
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+
+# --- Classification symbols and hierarchy ---
+# Symbols are normalized to the form Google and the USPTO display, e.g.
+# "H01M10/0525": no spaces, upper case, no leading zeros in the main group.
+# `normalize_symbol` needs nothing else; the hierarchy needs a scheme file.
+#
+# A scheme file is text with one symbol per line (blank lines and lines
+# starting with "#" are skipped). An optional second tab-separated column is
+# the dot level of a group, as in the CPC title lists; without it a subgroup
+# is placed under the listed subgroup whose digits are the longest prefix of
+# its own (H01M10/0525 under H01M10/052, see `descendant_prefix`). Further
+# columns are ignored.
+#
+# `ClassificationIndex.build` turns a scheme file into an index file that is
+# memory-mapped when opened, so the worker processes on a host share one copy
+# in the page cache. Layout, in native byte order:
+#   header       magic, byte order, entry count, symbol bytes
+#   offsets      uint32[count + 1]  symbol i is blob[offsets[i]:offsets[i + 1]]
+#   subtree_end  uint32[count]      entries i + 1 .. subtree_end[i] - 1 are i's descendants
+#   by_symbol    uint32[count]      entry numbers in symbol order, for lookups
+#   blob         the symbols, ASCII
+# Entries are in hierarchy order (each symbol before its descendants), so the
+# descendants of a symbol are one contiguous range.
+#
+# Set PATENTPEEK_CLASSIFICATION_INDEX to an index file to have the parsers,
+# generators and evaluator use it.
+
+SYMBOL_REGEX = re.compile(
+    r"^(?P<subclass>[A-HY](?:\d{2}(?:[A-Z])?)?)"  # section, class or subclass: H, H01, H01M
+    r"(?:0*(?P<group>\d{1,4})(?:/(?P<subgroup>\d{2,6}))?)?$"  # main group and subgroup: 10/0525
+)
+INDEX_MAGIC = b"PPCLSIDX"
+_HEADER = struct.Struct("=8s8sII")  # magic, byte order, count, blob size
+INDEX_ENV_VAR = "PATENTPEEK_CLASSIFICATION_INDEX"
+
+
+def normalize_symbol(value: str) -> Optional[str]:
+    """The normalized form of a classification symbol, or None if `value` is not one."""
+    match = SYMBOL_REGEX.match("".join(value.split()).upper())
+    if not match:
+        return None
+    subclass, group, subgroup = match.group("subclass", "group", "subgroup")
+    if group is None:
+        return subclass
+    if len(subclass) < 4:
+        # A group number needs a subclass in front of it.
+        return None
+    return f"{subclass}{int(group)}/{subgroup or '00'}"
+
+
+def descendant_prefix(symbol: str) -> str:
+    """
+    The prefix that the symbols below a normalized `symbol` share by the
+    numbering convention alone: H01M10/ for H01M10/00, H01M10/05 for
+    H01M10/050. The scheme's dot levels can place a subgroup elsewhere.
+    """
+    if "/" not in symbol:
+        return symbol
+    head, subgroup = symbol.split("/")
+    if subgroup == "00":
+        return head + "/"
+    return f"{head}/{subgroup[:2]}{subgroup[2:].rstrip('0')}"
+
+
+class _Entry(NamedTuple):
+    symbol: str
+    depth: int
+
+
+def _depth_from_symbol(symbol: str) -> int:
+    # Section, class, subclass, main group; subgroups are placed by the caller.
+    if "/" not in symbol:
+        return {1: 0, 3: 1, 4: 2}[len(symbol)]
+    return 3
+
+
+def _family(symbol: str) -> str:
+    """The prefix every descendant of `symbol` starts with."""
+    return symbol.split("/")[0] + "/" if "/" in symbol else symbol
+
+
+def _sort_key(symbol: str) -> Tuple[str, int, str]:
+    if "/" not in symbol:
+        return (symbol, -1, "")
+    head = symbol.split("/")[0]
+    return (head[:4], int(head[4:]), descendant_prefix(symbol)[len(head) + 1:])
+
+
+def _read_scheme(path: str) -> List[_Entry]:
+    """The scheme's entries in hierarchy order. Raises ValueError for a malformed symbol."""
+    rows: List[Tuple[str, Optional[int]]] = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            columns = line.rstrip("\n").split("\t")
+            symbol = normalize_symbol(columns[0])
+            if symbol is None:
+                raise ValueError(f"{path}:{line_number}: not a classification symbol: {columns[0].strip()!r}")
+            level = columns[1].strip() if len(columns) > 1 else ""
+            rows.append((symbol, int(level) if level.isdigit() else None))
+
+    seen = set()
+    rows = [row for row in rows if not (row[0] in seen or seen.add(row[0]))]  # type: ignore
+    if all(level is not None for symbol, level in rows if "/" in symbol and not symbol.endswith("/00")):
+        # Dot levels given: the file is already in hierarchy order.
+        return [_Entry(symbol, 3 + level if level is not None and "/" in symbol and not symbol.endswith("/00")
+                       else _depth_from_symbol(symbol))
+                for symbol, level in rows]
+
+    # No levels: nest subgroups by their numbers.
+    entries: List[_Entry] = []
+    ancestors: List[str] = []  # descendant prefixes of the open subgroups
+    for symbol in sorted((symbol for symbol, _ in rows), key=_sort_key):
+        if "/" not in symbol or symbol.endswith("/00"):
+            entries.append(_Entry(symbol, _depth_from_symbol(symbol)))
+            ancestors = []
+            continue
+        while ancestors and not symbol.startswith(ancestors[-1]):
+            ancestors.pop()
+        entries.append(_Entry(symbol, 4 + len(ancestors)))
+        ancestors.append(descendant_prefix(symbol))
+    return entries
+
+
+class ClassificationIndex:
+    """A memory-mapped classification hierarchy; see the module comment. Open with `open` or `build`."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order, count, blob_size = _HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a classification index")
+        built_on = byte_order.rstrip(b"\0").decode()
+        if built_on != sys.byteorder:
+            raise ValueError(f"{path} was built on a {built_on}-endian machine")
+        self.path = path
+        self._count = count
+        self._fingerprint: Optional[str] = None
+        words = memoryview(self._map)[_HEADER.size:_HEADER.size + (3 * count + 1) * 4].cast("I")
+        self._offsets = words[:count + 1]
+        self._subtree_end = words[count + 1:2 * count + 1]
+        self._by_symbol = words[2 * count + 1:]
+        blob_start = _HEADER.size + (3 * count + 1) * 4
+        self._blob = memoryview(self._map)[blob_start:blob_start + blob_size]
+
+    @classmethod
+    def open(cls, path: str) -> "ClassificationIndex":
+        return cls(path)
+
+    @classmethod
+    def build(cls, scheme_path: str, index_path: str) -> "ClassificationIndex":
+        """Writes the index for a scheme file and opens it. Raises ValueError for a malformed scheme."""
+        entries = _read_scheme(scheme_path)
+        count = len(entries)
+        offsets = array("I", [0])
+        blob = bytearray()
+        for entry in entries:
+            blob += entry.symbol.encode("ascii")
+            offsets.append(len(blob))
+        subtree_end = array("I", [count] * count)
+        open_entries: List[int] = []
+        for position, entry in enumerate(entries):
+            # Ancestors missing from the scheme must not make one symbol look like another's descendant.
+            while open_entries and (entries[open_entries[-1]].depth >= entry.depth
+                                    or not entry.symbol.startswith(_family(entries[open_entries[-1]].symbol))):
+                subtree_end[open_entries.pop()] = position
+            open_entries.append(position)
+        by_symbol = array("I", sorted(range(count), key=lambda position: entries[position].symbol))
+
+        # Written under a temporary name and renamed, so a worker never maps a half-written file.
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, sys.byteorder.encode(), count, len(blob)))
+            for column in (offsets, subtree_end, by_symbol):
+                column.tofile(f)
+            f.write(blob)
+        os.replace(temporary_path, index_path)
+        return cls(index_path)
+
+    @property
+    def fingerprint(self) -> str:
+        """A digest of the index file's contents, for keys of cached output that depends on the scheme."""
+        if self._fingerprint is None:
+            self._fingerprint = blake2b(self._map, digest_size=8).hexdigest()
+        return self._fingerprint
+
+    def close(self) -> None:
+        for view in (self._offsets, self._subtree_end, self._by_symbol, self._blob):
+            view.release()
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _symbol(self, position: int) -> str:
+        return bytes(self._blob[self._offsets[position]:self._offsets[position + 1]]).decode("ascii")
+
+    def _position(self, symbol: str) -> Optional[int]:
+        """The entry number of a normalized symbol, or None."""
+        by_symbol = self._by_symbol
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._symbol(by_symbol[middle]) < symbol:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._symbol(by_symbol[low]) == symbol:
+            return by_symbol[low]
+        return None
+
+    def __contains__(self, symbol: str) -> bool:
+        normalized = normalize_symbol(symbol)
+        return normalized is not None and self._position(normalized) is not None
+
+    def has_children(self, symbol: str) -> bool:
+        normalized = normalize_symbol(symbol)
+        position = self._position(normalized) if normalized else None
+        return position is not None and self._subtree_end[position] > position + 1
+
+    def descendants(self, symbol: str, include_self: bool = False) -> List[str]:
+        """The symbols below `symbol` in hierarchy order ([] if it is not in the scheme)."""
+        normalized = normalize_symbol(symbol)
+        position = self._position(normalized) if normalized else None
+        if position is None:
+            return []
+        start = position if include_self else position + 1
+        return [self._symbol(entry) for entry in range(start, self._subtree_end[position])]
+
+
+_default_index: Optional[ClassificationIndex] = None
+_default_index_loaded = False
+_default_index_lock = threading.Lock()
+
+
+def default_index() -> Optional[ClassificationIndex]:
+    """The index named by PATENTPEEK_CLASSIFICATION_INDEX, opened on first use, or None if it is not set."""
+    global _default_index, _default_index_loaded
+    if not _default_index_loaded:
+        with _default_index_lock:
+            if not _default_index_loaded:
+                path = os.environ.get(INDEX_ENV_VAR)
+                _default_index = ClassificationIndex.open(path) if path else None
+                _default_index_loaded = True
+    return _default_index
+
+
+def may_have_children(symbol: str) -> bool:
+    """False only if the default index lists `symbol` as a leaf, so a children suffix on it adds nothing."""
+    index = default_index()
+    return index is None or symbol not in index or index.has_children(symbol)
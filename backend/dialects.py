@@ -0,0 +1,137 @@
+# dialects.py
+from importlib import import_module
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Union
+import os
+import threading
+
+# --- Dialect registry ---
+# A dialect is a query syntax with a parser (text -> AST) and a generator
+# (AST -> text). Parsers and generators are only imported and built the first
+# time a dialect is used, so a worker that only ever converts Google queries
+# never imports the USPTO modules.
+#
+# Other packages can add dialects through the "patentpeek.dialects" entry
+# point group. The entry point's name is the dialect name and it must resolve
+# to a DialectSpec, e.g. in pyproject.toml:
+#   [project.entry-points."patentpeek.dialects"]
+#   epo = "patentpeek_epo:DIALECT"
+# Entry points are only looked up when a name that is not built in is asked
+# for, or when all dialects are listed.
+#
+# Set PATENTPEEK_EAGER_DIALECTS=1 to build every dialect at import instead,
+# e.g. in a pre-forking server that should pay the cost once in the parent.
+
+ENTRY_POINT_GROUP = "patentpeek.dialects"
+
+# Either a "module:attribute" path or the class/factory itself. It is called
+# with no arguments to build the parser or generator.
+Factory = Union[str, Callable[[], Any]]
+
+
+class DialectSpec(NamedTuple):
+    parser: Factory
+    generator: Factory
+
+
+BUILTIN_DIALECTS: Dict[str, DialectSpec] = {
+    "google": DialectSpec("google_parser:GoogleQueryParser", "google_generator:ASTToGoogleQueryGenerator"),
+    "uspto": DialectSpec("uspto_parser:USPTOQueryParser", "uspto_generator:ASTToUSPTOQueryGenerator"),
+}
+
+
+def _build(factory: Factory) -> Any:
+    if isinstance(factory, str):
+        module_name, _, attribute = factory.partition(":")
+        factory = getattr(import_module(module_name), attribute)
+    return factory()
+
+
+class DialectRegistry:
+    def __init__(self, entry_point_group: str = ENTRY_POINT_GROUP):
+        self.entry_point_group = entry_point_group
+        self._specs: Dict[str, DialectSpec] = dict(BUILTIN_DIALECTS)
+        self._instances: Dict[str, Dict[str, Any]] = {"parser": {}, "generator": {}}
+        self._entry_points_loaded = False
+        self._lock = threading.RLock()
+        self.parsers: Mapping[str, Any] = _ComponentView(self, "parser")
+        self.generators: Mapping[str, Any] = _ComponentView(self, "generator")
+
+    def register(self, name: str, parser: Factory, generator: Factory) -> None:
+        """Adds or replaces a dialect. Already-built components of a replaced dialect are discarded."""
+        with self._lock:
+            self._specs[name] = DialectSpec(parser, generator)
+            for instances in self._instances.values():
+                instances.pop(name, None)
+
+    def names(self) -> List[str]:
+        self._load_entry_points()
+        return list(self._specs)
+
+    def __contains__(self, name: object) -> bool:
+        if name in self._specs:
+            return True
+        self._load_entry_points()
+        return name in self._specs
+
+    def get_component(self, name: str, kind: str) -> Any:
+        instances = self._instances[kind]
+        component = instances.get(name)
+        if component is not None:
+            return component
+        with self._lock:
+            component = instances.get(name)
+            if component is None:
+                if name not in self:
+                    raise KeyError(f"Unknown query dialect: {name}")
+                component = instances[name] = _build(getattr(self._specs[name], kind))
+            return component
+
+    def load_all(self) -> None:
+        for name in self.names():
+            self.get_component(name, "parser")
+            self.get_component(name, "generator")
+
+    def _load_entry_points(self) -> None:
+        if self._entry_points_loaded:
+            return
+        with self._lock:
+            if self._entry_points_loaded:
+                return
+            from importlib.metadata import entry_points
+            try:
+                found = entry_points(group=self.entry_point_group)
+            except TypeError:  # Python < 3.10: entry_points() returns a dict by group
+                found = entry_points().get(self.entry_point_group, [])
+            for entry_point in found:
+                # Built-in and explicitly registered dialects take precedence.
+                if entry_point.name not in self._specs:
+                    spec = entry_point.load()
+                    if not isinstance(spec, DialectSpec):
+                        raise TypeError(f"Entry point {entry_point.name!r} in {self.entry_point_group} is not a DialectSpec")
+                    self._specs[entry_point.name] = spec
+            self._entry_points_loaded = True
+
+
+class _ComponentView(Mapping):
+    """Read-only name -> parser (or generator) mapping that builds entries on first access."""
+    def __init__(self, registry: DialectRegistry, kind: str):
+        self._registry = registry
+        self._kind = kind
+
+    def __getitem__(self, name: str) -> Any:
+        return self._registry.get_component(name, self._kind)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._registry
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._registry.names())
+
+    def __len__(self) -> int:
+        return len(self._registry.names())
+
+
+DIALECTS = DialectRegistry()
+
+if os.environ.get("PATENTPEEK_EAGER_DIALECTS", "").lower() in ("1", "true", "yes"):
+    DIALECTS.load_all()
@@ -0,0 +1,177 @@
+# dispatch.py
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import threading
+from metrics import merge_worker_stats, take_worker_stats
+
+# --- Execution of CPU-bound service calls ---
+# The handlers in main.py are async, but parsing and generating are plain CPU
+# work. Running them on the event loop lets one pathological query stall every
+# other request on the worker, so they are handed to a bounded pool instead.
+#
+# Configuration (environment variables):
+#   PATENTPEEK_EXECUTION_MODE   "thread" (default), "process" or "inline"
+#   PATENTPEEK_MAX_WORKERS      pool size (default: CPU count)
+#   PATENTPEEK_MAX_QUEUE        calls allowed to wait for a worker (default: 4 x workers)
+#   PATENTPEEK_REQUEST_TIMEOUT  seconds before a call is answered with 504 (default: 10, 0 = none)
+#
+# A call is admitted only while fewer than workers + queue calls are in
+# flight; otherwise it is rejected at once with 503 rather than queueing
+# without bound. A call that times out keeps its slot until its worker has
+# actually finished, so a runaway query cannot make the service over-admit.
+#
+# In process mode each call also brings back the stage timings and cache
+# counts it recorded in its worker, which are merged into this process's
+# metrics, so /metrics and /api/cache-stats cover the work done in the pool.
+# Cache sizes remain per process.
+
+EXECUTION_MODES = ("inline", "thread", "process")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _call_in_worker(func: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[bool, Any, Dict[str, Any]]:
+    """
+    Runs `func` in a worker process. HTTPException cannot be unpickled, so it
+    is sent back as (False, (status_code, detail)) and re-raised by the caller.
+    The third item is the stage timings and cache counts the call recorded in
+    this process, for the parent to merge (see metrics.take_worker_stats).
+    """
+    take_worker_stats()
+    try:
+        ok, value = True, func(*args)
+    except HTTPException as e:
+        ok, value = False, (e.status_code, e.detail)
+    return ok, value, take_worker_stats()
+
+
+def _merge_from_worker(future: Future) -> None:
+    """Merges a worker's counts when its call ends, even if the request timed out waiting for it."""
+    if not future.cancelled() and future.exception() is None:
+        merge_worker_stats(future.result()[2])
+
+
+class Dispatcher:
+    def __init__(self, mode: str = "thread", max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None, timeout: Optional[float] = 10.0):
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {mode!r} (expected one of {', '.join(EXECUTION_MODES)})")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 4 if max_queue is None else max_queue
+        self.timeout = timeout or None
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls) -> "Dispatcher":
+        max_queue = os.environ.get("PATENTPEEK_MAX_QUEUE")
+        return cls(
+            mode=os.environ.get("PATENTPEEK_EXECUTION_MODE", "thread").lower(),
+            max_workers=_env_int("PATENTPEEK_MAX_WORKERS", 0) or None,
+            max_queue=int(max_queue) if max_queue else None,
+            timeout=_env_float("PATENTPEEK_REQUEST_TIMEOUT", 10.0),
+        )
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="patentpeek-query")
+            return self._executor
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _release(self, _future: Optional[Future] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs `func(*args)` according to the execution mode and returns its result."""
+        if self.mode == "inline":
+            return func(*args)
+
+        if not self._admit():
+            raise HTTPException(status_code=503, detail="Server is busy, please retry shortly",
+                                headers={"Retry-After": "1"})
+        try:
+            executor, future = self._submit(func, args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the work ends, not when the request gives up on it.
+        future.add_done_callback(self._release)
+        if self.mode == "process":
+            future.add_done_callback(_merge_from_worker)
+
+        try:
+            # On timeout wait_for cancels the future, which drops the call if it has not started yet.
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HTTPException(status_code=504, detail=f"Query processing timed out after {self.timeout:g}s")
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise HTTPException(status_code=503, detail="Query worker crashed, please retry shortly",
+                                headers={"Retry-After": "1"})
+
+        if self.mode == "process":
+            ok, value, _ = result
+            if not ok:
+                status_code, detail = value
+                raise HTTPException(status_code=status_code, detail=detail)
+            return value
+        return result
+
+    def _submit(self, func: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[Executor, Future]:
+        """
+        Submits the call to the pool. Another request may shut the pool down
+        between fetching and submitting to it (see _reset_executor), and a
+        process pool may have lost a worker; either way submit raises a
+        RuntimeError, and the call is retried once on a fresh pool.
+        """
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                if self.mode == "process":
+                    return executor, executor.submit(_call_in_worker, func, args)
+                return executor, executor.submit(func, *args)
+            except RuntimeError:  # BrokenProcessPool included
+                self._reset_executor(executor)
+        raise HTTPException(status_code=503, detail="Query workers are restarting, please retry shortly",
+                            headers={"Retry-After": "1"})
+
+    def _reset_executor(self, broken: Executor) -> None:
+        """Replaces a pool that lost a worker or was shut down; the next call starts a fresh one."""
+        with self._lock:
+            if self._executor is not broken:
+                return  # Another request already replaced it.
+            self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+DISPATCHER = Dispatcher.from_env()
@@ -0,0 +1,879 @@
+# evaluator.py
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import re
+import numpy as np
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode, ClassificationNode
+)
+from ast_canonical import canonicalize
+from lru_cache import LRUCache
+from classification_index import ClassificationIndex, default_index, descendant_prefix, normalize_symbol
+from wildcard_expansion import WILDCARD_REGEX, Vocabulary, WildcardExpander
+
+# --- Local query evaluation ---
+# Runs an AST against a patent corpus held in memory, to count the hits of a
+# generated query offline. The corpus is JSONL, one patent per line, with the
+# keys in CORPUS_FIELDS (lists are allowed for every field).
+#
+# Everything a query touches is a numpy array, so the Python-level work is per
+# posting list rather than per document or per occurrence:
+#   - result sets are bitsets, uint64 arrays with bit i for document i, so AND,
+#     OR and NOT are single array operations and the hit count is a popcount;
+#   - a document posting is a sorted uint32 array of document numbers, or a
+#     bitset once that is smaller;
+#   - the documents of a text field are laid end to end in one token stream,
+#     one unused position apart so a phrase never runs from one document into
+#     the next, and a positional posting is the sorted stream positions of a
+#     term, next to the document number of each position.
+# Phrases and proximity operators are first narrowed to the documents that
+# contain all their words (a bitset AND). When those are a small part of the
+# corpus, their operands' positions are narrowed to them too (a lookup per
+# position, or a search for each document's run of positions when there are
+# only a few documents), and positions are placed in documents, sentences and
+# paragraphs among the start positions of those documents alone. The positions
+# are then matched as arrays: a phrase checks its rarest word's positions
+# against the others' at their offsets, ADJn/NEARn pair spans up with
+# searchsorted, and WITH/SAME compare the sentence or paragraph each span
+# starts in. AND evaluates proximity operands last, only in the documents its
+# other operands left, and skips them once those are none. The bitsets of
+# leaves and proximity operators are kept in an LRU cache sized to a memory
+# budget. Sentences end at . ! ? ; and paragraphs at line breaks (or list
+# items).
+#
+# Semantics that the query syntaxes leave open:
+#   - text is lower-cased and split into runs of letters and digits; a term
+#     that splits into several words ("lithium-ion") is a phrase;
+#   - "*" and "$" match any run of characters, "$n" up to n, "?" exactly one;
+#   - a term with a leading "-" excludes the rest of the term;
+#   - ADJn matches in order with at most n-1 words between, NEARn in either
+#     order; without a distance both mean adjacent; WITH means the same
+#     sentence and SAME the same paragraph;
+#   - inside a proximity operator, operands other than terms, phrases, OR
+#     groups and nested proximity operators only need to occur in the same
+#     field, anywhere;
+#   - a classification with children matches its descendants in the
+#     classification index (see classification_index.py) when the symbol is
+#     listed there, and otherwise the symbols numbered below it
+#     (H01M10/05 -> H01M10/05*); a wildcard matches every symbol it is a
+#     prefix of;
+#   - a date with only a year (or year and month) covers the whole period.
+
+# Canonical field -> corpus keys it may be stored under, in order of preference.
+CORPUS_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "title": ("title",),
+    "abstract": ("abstract",),
+    "claims": ("claims",),
+    "description": ("description",),
+    "assignee_name": ("assignee_name", "assignee", "assignees"),
+    "inventor_name": ("inventor_name", "inventor", "inventors"),
+    "patent_number": ("patent_number", "publication_number"),
+    "country_code": ("country_code", "country"),
+    "language": ("language",),
+    "status": ("status",),
+    "patent_type": ("patent_type", "type"),
+    "cpc": ("cpc",),
+    "ipc": ("ipc",),
+    "publication_date": ("publication_date",),
+    "application_date": ("application_date", "filing_date"),
+    "priority_date": ("priority_date",),
+    "litigated": ("litigated",),
+}
+# Fields searched as tokenized text, and those searched by whole normalized value.
+TEXT_FIELDS = ("title", "abstract", "claims", "description", "assignee_name", "inventor_name")
+KEYWORD_FIELDS = ("patent_number", "country_code", "language", "status", "patent_type")
+CLASSIFICATION_FIELDS = {"cpc": "CPC", "ipc": "IPC"}
+DATE_FIELDS = ("publication_date", "application_date", "priority_date")
+# Fields searched by a term outside any field.
+DEFAULT_TEXT_FIELDS = ("title", "abstract", "claims", "description")
+# Canonical field names from the parsers that search other fields here.
+FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "text_all_core": DEFAULT_TEXT_FIELDS,
+    "brief_summary": ("description",),
+}
+DATE_FIELD_ALIASES = {"issue_date": "publication_date", "publication_year": "publication_date",
+                      "application_year": "application_date"}
+
+
+WORD_REGEX = re.compile(r"[0-9a-z]+")
+SENTENCE_END_REGEX = re.compile(r"[.!?;]")
+QUERY_WORD_REGEX = re.compile(r"[0-9a-z*?$]+")
+DATE_REGEX = re.compile(r"^(\d{4})-?(\d{2})?-?(\d{2})?$")
+
+DEFAULT_PROXIMITY_DISTANCE = 1
+SCOPE_UNITS = {"WITH": "sentence", "SAME": "paragraph"}
+
+# Date columns keep the documents sorted by date plus the bitset of every
+# 1/DATE_CHECKPOINTS-th prefix of that order, so a range needs at most two
+# partial buckets converted to bitsets.
+DATE_CHECKPOINTS = 128
+# Default memory for cached bitsets; the entry count follows from the corpus size.
+BITSET_CACHE_BYTES = 256 * 1024 * 1024
+
+# Bitsets and document postings are both numpy arrays; a bitset is uint64.
+Bitset = np.ndarray
+Posting = np.ndarray
+# Spans of stream positions, (first, last) arrays sorted by first.
+Spans = Tuple[np.ndarray, np.ndarray]
+_NO_SPANS: Spans = (np.zeros(0, np.int64), np.zeros(0, np.int64))
+
+
+class _TermIds(dict):
+    """Term -> term id, adding unseen terms; `map(term_ids.__getitem__, words)` then runs at C speed."""
+    def __missing__(self, term: str) -> int:
+        term_id = self[term] = len(self)
+        return term_id
+
+
+# --- Bitsets ---
+
+def _empty_bits(size: int) -> Bitset:
+    return np.zeros((size + 63) >> 6, np.uint64)
+
+
+def _full_bits(size: int) -> Bitset:
+    bits = np.full((size + 63) >> 6, np.uint64(0xFFFFFFFFFFFFFFFF))
+    if size & 63:
+        bits[-1] = np.uint64((1 << (size & 63)) - 1)
+    return bits
+
+
+def _bits_from_ids(ids: np.ndarray, size: int) -> Bitset:
+    """The bitset of `ids`, which may be unsorted and repeat."""
+    words = (size + 63) >> 6
+    if len(ids) < words:
+        # Sparse: set the bits one byte at a time.
+        buffer = np.zeros(words * 8, np.uint8)
+        np.bitwise_or.at(buffer, ids >> 3, np.left_shift(1, ids & 7).astype(np.uint8))
+        return buffer.view(np.uint64)
+    flags = np.zeros(words * 64, np.bool_)
+    flags[ids] = True
+    return np.packbits(flags, bitorder="little").view(np.uint64)
+
+
+def _ids_from_bits(bits: Bitset, limit: Optional[int] = None) -> np.ndarray:
+    """The document numbers in `bits` in ascending order, the first `limit` of them."""
+    ids = np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder="little").view(np.bool_))
+    return ids if limit is None else ids[:limit]
+
+
+def _count(bits: Bitset) -> int:
+    return int(np.bitwise_count(bits).sum())
+
+
+def _union(postings: Iterable[Posting], size: int) -> Bitset:
+    """The documents in any of `postings`; the document-number arrays are converted together."""
+    bits: Optional[Bitset] = None
+    id_arrays = []
+    for posting in postings:
+        if posting.dtype == np.uint64:
+            bits = posting if bits is None else bits | posting
+        elif len(posting):
+            id_arrays.append(posting)
+    if id_arrays:
+        ids = _bits_from_ids(np.concatenate(id_arrays) if len(id_arrays) > 1 else id_arrays[0], size)
+        bits = ids if bits is None else bits | ids
+    return bits if bits is not None else _empty_bits(size)
+
+
+def _compact_postings(postings: Dict[Any, Any], size: int) -> None:
+    """Turns the postings into numpy arrays in place, as bitsets where that is smaller."""
+    for key, posting in postings.items():
+        ids = np.frombuffer(posting, np.uint32)
+        postings[key] = _bits_from_ids(ids, size) if len(ids) * 32 >= size else ids
+
+
+# --- Spans ---
+
+def _pairs(low: np.ndarray, high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(i, j) for every i and every j in range(low[i], high[i]), as two arrays."""
+    counts = np.maximum(high - low, 0)
+    total = int(counts.sum())
+    left = np.repeat(np.arange(len(low)), counts)
+    right = np.arange(total) + np.repeat(low - (np.cumsum(counts) - counts), counts)
+    return left, right
+
+
+def _contains(ordered: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Which of `values` occur in the sorted array `ordered`. The values are
+    cast to its dtype rather than the other way round, so a large `ordered`
+    is not copied; a negative value cast to uint32 is too large to occur.
+    """
+    if not len(ordered):
+        return np.zeros(len(values), np.bool_)
+    values = values.astype(ordered.dtype)
+    index = np.minimum(np.searchsorted(ordered, values), len(ordered) - 1)
+    return ordered[index] == values
+
+
+def _sorted_spans(first: np.ndarray, last: np.ndarray) -> Spans:
+    """The distinct spans, sorted by first position."""
+    if len(first) > 1:
+        order = np.lexsort((last, first))
+        first, last = first[order], last[order]
+        keep = np.ones(len(first), np.bool_)
+        keep[1:] = (first[1:] != first[:-1]) | (last[1:] != last[:-1])
+        first, last = first[keep], last[keep]
+    return first, last
+
+
+def _follows(left: Spans, right: Spans, distance: int) -> Spans:
+    """Spans from each left span to each right span starting at most `distance` words after it ends."""
+    low = np.searchsorted(right[0], left[1], "right")
+    high = np.searchsorted(right[0], left[1] + distance, "right")
+    i, j = _pairs(low, high)
+    return left[0][i], right[1][j]
+
+
+def _parse_date(value: str, upper: bool = False) -> Optional[int]:
+    """YYYYMMDD as an int. A partial date is the first day of its period, or the last with `upper`."""
+    match = DATE_REGEX.match(value.strip())
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if month is None:
+        return int(year) * 10000 + (1231 if upper else 101)
+    if day is None:
+        return int(year + month) * 100 + (31 if upper else 1)
+    return int(year + month + day)
+
+
+def _values(record: Dict[str, Any], field: str) -> List[str]:
+    for key in CORPUS_FIELDS[field]:
+        value = record.get(key)
+        if value is None or value == "":
+            continue
+        if isinstance(value, list):
+            return [str(item) for item in value if item is not None and item != ""]
+        return [str(value)]
+    return []
+
+
+def _normalize_keyword(value: str) -> str:
+    return "".join(WORD_REGEX.findall(value.lower()))
+
+
+def _normalize_classification(value: str) -> str:
+    return normalize_symbol(value) or "".join(value.upper().split())
+
+
+class _DateColumn:
+    def __init__(self, dates: List[Tuple[int, int]], size: int):
+        dates.sort()
+        self.size = size
+        self.values = np.array([date for date, _ in dates], np.int64)
+        self.order = np.array([doc for _, doc in dates], np.uint32)
+        self.step = max(1, -(-len(dates) // DATE_CHECKPOINTS))
+        self.prefixes = [_empty_bits(size)]
+        for start in range(0, len(dates), self.step):
+            self.prefixes.append(self.prefixes[-1] | _bits_from_ids(self.order[start:start + self.step], size))
+
+    def _prefix(self, count: int) -> Bitset:
+        """Bitset of the `count` earliest documents."""
+        checkpoint = count // self.step
+        bits = self.prefixes[checkpoint]
+        if count % self.step:
+            bits = bits | _bits_from_ids(self.order[checkpoint * self.step:count], self.size)
+        return bits
+
+    def between(self, low: Optional[int], high: Optional[int]) -> Bitset:
+        """Documents dated within [low, high]; None leaves that end open."""
+        start = int(np.searchsorted(self.values, low, "left")) if low is not None else 0
+        end = int(np.searchsorted(self.values, high, "right")) if high is not None else len(self.values)
+        if end <= start:
+            return _empty_bits(self.size)
+        return self._prefix(end) & ~self._prefix(start)
+
+
+class _Candidates:
+    """
+    The documents a phrase or proximity match may lie in, within one text
+    field. When they are a small part of the corpus they are `sparse`: term
+    positions are then only taken from inside them, and positions are placed
+    in documents, sentences and paragraphs by searching the start positions
+    of these documents alone (see _TextField._starts_in).
+    """
+    __slots__ = ("bits", "count", "size", "sparse", "local_starts", "_flags", "_ids")
+
+    def __init__(self, bits: Bitset, size: int):
+        self.bits = bits
+        self.count = _count(bits)
+        self.size = size
+        self.sparse = self.count * 4 < size
+        self.local_starts: Dict[str, np.ndarray] = {}
+        self._flags: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+
+    @property
+    def flags(self) -> np.ndarray:
+        """One bool per document number, a faster lookup than the bitset."""
+        if self._flags is None:
+            self._flags = np.unpackbits(self.bits.view(np.uint8), bitorder="little").view(np.bool_)
+        return self._flags
+
+    @property
+    def ids(self) -> np.ndarray:
+        if self._ids is None:
+            if self.count * 1024 < self.size:
+                # A handful of documents: unpack only the words that have any.
+                words = np.flatnonzero(self.bits)
+                offsets = np.flatnonzero(np.unpackbits(self.bits[words].view(np.uint8), bitorder="little"))
+                self._ids = (words[offsets >> 6] << 6) | (offsets & 63)
+            else:
+                self._ids = np.flatnonzero(self.flags)
+        return self._ids
+
+
+class _TextField:
+    """
+    One text field over the whole corpus: the stream position where each
+    document starts (followed by one unused position), the sentence and
+    paragraph start positions, and each term's document and positional
+    postings. Documents are added with `add`; `finish` builds the arrays.
+    """
+    def __init__(self) -> None:
+        self._stream: Optional[array] = array("I")  # term ids, without the gaps; dropped by finish
+        self._starts = array("q")
+        self._sentences = array("q")
+        self._paragraphs = array("q")
+
+    def add(self, values: List[str], term_ids: _TermIds) -> None:
+        stream = self._stream
+        # Stream positions count one gap per earlier document.
+        gap = len(self._starts)
+        self._starts.append(len(stream) + gap)  # type: ignore
+        # List items are paragraphs of their own.
+        for paragraph in "\n".join(values).lower().split("\n"):
+            paragraph_start = len(stream)  # type: ignore
+            for sentence in SENTENCE_END_REGEX.split(paragraph):
+                words = WORD_REGEX.findall(sentence)
+                if words:
+                    self._sentences.append(len(stream) + gap)  # type: ignore
+                    stream.extend(map(term_ids.__getitem__, words))  # type: ignore
+            if len(stream) > paragraph_start:  # type: ignore
+                self._paragraphs.append(paragraph_start + gap)
+
+    def finish(self, vocabulary_size: int, size: int) -> None:
+        tokens = np.frombuffer(self._stream, np.uint32)  # type: ignore
+        self.doc_starts = np.append(np.frombuffer(self._starts, np.int64), len(tokens) + size)
+        self.sentence_starts = np.frombuffer(self._sentences, np.int64)
+        self.paragraph_starts = np.frombuffer(self._paragraphs, np.int64)
+        self.starts = {"doc": self.doc_starts, "sentence": self.sentence_starts, "paragraph": self.paragraph_starts}
+        # The index of each document's first sentence and paragraph, and one past its last.
+        self.doc_units = {unit: np.searchsorted(self.starts[unit], self.doc_starts) for unit in ("sentence", "paragraph")}
+        lengths = np.diff(self.doc_starts) - 1
+        self.has_text = _bits_from_ids(np.flatnonzero(lengths), size)
+
+        # Stream indices grouped by term, in stream order within a term.
+        if len(tokens) < 1 << 32:
+            # Sorting (term id, index) keys is much faster than a stable argsort.
+            keys = tokens.astype(np.uint64) << np.uint64(32)
+            keys |= np.arange(len(tokens), dtype=np.uint64)
+            keys.sort()
+            order = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+            del keys
+        else:
+            order = np.argsort(tokens, kind="stable")
+        counts = np.bincount(tokens, minlength=vocabulary_size)
+        self.term_bounds = np.zeros(vocabulary_size + 1, np.int64)
+        np.cumsum(counts, out=self.term_bounds[1:])
+        docs = np.repeat(np.arange(size, dtype=np.uint32), lengths)[order]
+        # A stream index plus its document number (one gap per earlier document) is its position.
+        self.positions = order.astype(np.int64 if len(tokens) + size >= 1 << 32 else np.uint32)
+        del order
+        self.positions += docs
+        # The document of each position, to filter positions by document without a search.
+        self.position_docs = docs
+
+        # Document postings: the first entry of each (term, document) run.
+        first = np.ones(len(docs), np.bool_)
+        np.not_equal(docs[1:], docs[:-1], out=first[1:])
+        first[self.term_bounds[:-1][counts > 0]] = True
+        document_frequency = np.bincount(np.repeat(np.arange(vocabulary_size, dtype=np.uint32), counts)[first],
+                                         minlength=vocabulary_size) if len(docs) else counts
+        dense = document_frequency * 32 >= size
+        starts = np.zeros(vocabulary_size + 1, np.int64)
+        np.cumsum(document_frequency, out=starts[1:])
+        all_postings = docs[first]
+        del first
+        self.dense: Dict[int, Bitset] = {
+            int(term_id): _bits_from_ids(all_postings[starts[term_id]:starts[term_id + 1]], size)
+            for term_id in np.flatnonzero(dense & (document_frequency > 0))
+        }
+        self.doc_postings = all_postings[~np.repeat(dense, document_frequency)]
+        self.doc_bounds = np.zeros(vocabulary_size + 1, np.int64)
+        np.cumsum(np.where(dense, 0, document_frequency), out=self.doc_bounds[1:])
+        self._stream = None
+        self._starts = self._sentences = self._paragraphs = None  # type: ignore
+
+    def doc_bits(self, term_ids: List[int], size: int) -> Bitset:
+        """The documents containing any of `term_ids`."""
+        return _union((self.dense.get(term_id, self.doc_postings[self.doc_bounds[term_id]:self.doc_bounds[term_id + 1]])
+                       for term_id in term_ids), size)
+
+    def _term_positions(self, term_id: int) -> np.ndarray:
+        return self.positions[self.term_bounds[term_id]:self.term_bounds[term_id + 1]]
+
+    def _term_docs(self, term_id: int) -> np.ndarray:
+        return self.position_docs[self.term_bounds[term_id]:self.term_bounds[term_id + 1]]
+
+    def occurrences(self, term_ids: List[int]) -> int:
+        return sum(int(self.term_bounds[term_id + 1] - self.term_bounds[term_id]) for term_id in term_ids)
+
+    def term_positions(self, term_ids: List[int], candidates: "_Candidates") -> np.ndarray:
+        """The sorted positions of any of `term_ids`, leaving out most of those outside `candidates`."""
+        parts = [self._in_docs(term_id, candidates) for term_id in term_ids]
+        if len(parts) == 1:
+            return parts[0].astype(np.int64)
+        return np.sort(np.concatenate(parts).astype(np.int64))
+
+    def contains(self, term_ids: List[int], positions: np.ndarray) -> np.ndarray:
+        """Which of `positions` hold one of `term_ids`."""
+        found = _contains(self._term_positions(term_ids[0]), positions)
+        for term_id in term_ids[1:]:
+            found |= _contains(self._term_positions(term_id), positions)
+        return found
+
+    def _in_docs(self, term_id: int, candidates: "_Candidates") -> np.ndarray:
+        """The positions of `term_id` inside `candidates` if those are sparse; otherwise all of them."""
+        positions = self._term_positions(term_id)
+        if not candidates.sparse:
+            return positions
+        docs = self._term_docs(term_id)
+        if candidates.count * 64 < len(positions):
+            # Few candidates: look up each one's run of positions instead of testing every position.
+            ids = candidates.ids.astype(docs.dtype)
+            _, runs = _pairs(np.searchsorted(docs, ids, "left"), np.searchsorted(docs, ids, "right"))
+            return positions[runs]
+        return positions[candidates.flags[docs]]
+
+    def _starts_in(self, kind: str, candidates: "_Candidates") -> np.ndarray:
+        """
+        The sorted document, sentence or paragraph start positions to search:
+        only those of `candidates` if they are sparse, as every position
+        looked up is then inside them. A few thousand starts stay in cache
+        where the field's millions do not.
+        """
+        if not candidates.sparse:
+            return self.starts[kind]
+        starts = candidates.local_starts.get(kind)
+        if starts is None:
+            ids = candidates.ids
+            if kind == "doc":
+                starts = self.doc_starts[ids]
+            else:
+                bounds = self.doc_units[kind]
+                _, units = _pairs(bounds[ids], bounds[ids + 1])
+                starts = self.starts[kind][units]
+            candidates.local_starts[kind] = starts
+        return starts
+
+    def docs_of(self, positions: np.ndarray, candidates: "_Candidates") -> np.ndarray:
+        docs = np.searchsorted(self._starts_in("doc", candidates), positions, "right") - 1
+        return candidates.ids[docs] if candidates.sparse else docs
+
+    def same_doc(self, first: np.ndarray, last: np.ndarray, candidates: "_Candidates") -> np.ndarray:
+        starts = self._starts_in("doc", candidates)
+        return np.searchsorted(starts, first, "right") == np.searchsorted(starts, last, "right")
+
+    def units_of(self, unit: str, positions: np.ndarray, candidates: "_Candidates") -> np.ndarray:
+        """Numbers that are equal for `positions` in the same sentence or paragraph, increasing with position."""
+        return np.searchsorted(self._starts_in(unit, candidates), positions, "right")
+
+    def whole_docs(self, docs: np.ndarray) -> Spans:
+        """Spans covering each of `docs` (which must have text) from its first to its last token."""
+        return self.doc_starts[docs], self.doc_starts[docs + 1] - 2
+
+
+class CorpusIndex:
+    """Inverted index over a patent corpus. Build with `from_jsonl` or `from_records`; read-only afterwards."""
+
+    def __init__(self, cache_bytes: int = BITSET_CACHE_BYTES,
+                 classifications: Optional[ClassificationIndex] = None):
+        """`classifications` defaults to classification_index.default_index()."""
+        self.size = 0
+        self.cache_bytes = cache_bytes
+        self.classifications = classifications if classifications is not None else default_index()
+        self.doc_ids: List[str] = []
+        self.all_bits = _empty_bits(0)
+        self._term_ids = _TermIds()
+        self._wildcards: Optional[WildcardExpander] = None  # over the vocabulary, built by _finish
+        self._texts: Dict[str, _TextField] = {field: _TextField() for field in TEXT_FIELDS}
+        self._keywords: Dict[str, Dict[str, Any]] = {field: {} for field in KEYWORD_FIELDS}
+        self._classifications: Dict[str, Dict[str, Any]] = {scheme: {} for scheme in CLASSIFICATION_FIELDS.values()}
+        self._classification_symbols: Dict[str, List[str]] = {}
+        self._pending_dates: Dict[str, List[Tuple[int, int]]] = {field: [] for field in DATE_FIELDS}
+        self._dates: Dict[str, _DateColumn] = {}
+        self._litigated: Any = array("I")
+        self._cache: Optional[LRUCache] = None
+
+    @classmethod
+    def from_jsonl(cls, path: str, cache_bytes: int = BITSET_CACHE_BYTES,
+                   classifications: Optional[ClassificationIndex] = None) -> "CorpusIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_records((json.loads(line) for line in f if line.strip()), cache_bytes, classifications)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], cache_bytes: int = BITSET_CACHE_BYTES,
+                     classifications: Optional[ClassificationIndex] = None) -> "CorpusIndex":
+        index = cls(cache_bytes, classifications)
+        for record in records:
+            index._add(record)
+        index._finish()
+        return index
+
+    # --- Building ---
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        doc = self.size
+        self.size += 1
+        numbers = _values(record, "patent_number")
+        self.doc_ids.append(str(record.get("id") or (numbers[0] if numbers else doc)))
+
+        for field in TEXT_FIELDS:
+            self._texts[field].add(_values(record, field), self._term_ids)
+        for field in KEYWORD_FIELDS:
+            for value in {_normalize_keyword(v) for v in _values(record, field)}:
+                self._keywords[field].setdefault(value, array("I")).append(doc)
+        for field, scheme in CLASSIFICATION_FIELDS.items():
+            for symbol in {_normalize_classification(v) for v in _values(record, field)}:
+                self._classifications[scheme].setdefault(symbol, array("I")).append(doc)
+        for field in DATE_FIELDS:
+            values = _values(record, field)
+            date = _parse_date(values[0]) if values else None
+            if date is not None:
+                self._pending_dates[field].append((date, doc))
+        litigated = _values(record, "litigated")
+        if litigated and litigated[0].lower() not in ("0", "false", "no"):
+            self._litigated.append(doc)
+
+    def _finish(self) -> None:
+        self.all_bits = _full_bits(self.size)
+        # Uncapped: a hit count needs every term a wildcard matches.
+        self._wildcards = WildcardExpander(Vocabulary.from_terms(self._term_ids.keys()), max_expansions=None, max_scan=None)
+        for text in self._texts.values():
+            text.finish(len(self._term_ids), self.size)
+        for postings in (*self._keywords.values(), *self._classifications.values()):
+            _compact_postings(postings, self.size)
+        self._classification_symbols = {scheme: sorted(symbols) for scheme, symbols in self._classifications.items()}
+        self._dates = {field: _DateColumn(dates, self.size) for field, dates in self._pending_dates.items()}
+        self._pending_dates = {}
+        self._litigated = _bits_from_ids(np.frombuffer(self._litigated, np.uint32), self.size)
+        self._cache = LRUCache(maxsize=max(64, self.cache_bytes // max(8, self.all_bits.nbytes)))
+
+    # --- Querying ---
+
+    def evaluate(self, root: ASTNode) -> Bitset:
+        """
+        The bitset of documents matching `root`: a uint64 array with bit i
+        for document i. Read-only, as it may be shared with the cache.
+        Raises ValueError for a parse error AST.
+
+        The query is canonicalized first, so queries that differ only in
+        operand order or nesting share cache entries.
+        """
+        root = canonicalize(root)
+        node = root.query if isinstance(root, QueryRootNode) else root
+        return self._eval(node, DEFAULT_TEXT_FIELDS)
+
+    def count(self, root: ASTNode) -> int:
+        return _count(self.evaluate(root))
+
+    def matching_ids(self, root: ASTNode, limit: Optional[int] = None) -> List[str]:
+        """The ids of the matching documents in corpus order, at most `limit` of them."""
+        return [self.doc_ids[doc] for doc in _ids_from_bits(self.evaluate(root), limit).tolist()]
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self._cache.stats() if self._cache else {}
+
+    def clear_cache(self) -> None:
+        if self._cache:
+            self._cache.clear()
+        if self._wildcards:
+            self._wildcards.clear_cache()
+
+    def _eval(self, node: ASTNode, scope: Tuple[str, ...], within: Optional[Bitset] = None) -> Bitset:
+        """
+        The documents matching `node` in the `scope` fields. With `within`,
+        a proximity operator may leave out documents outside it, which the
+        caller is about to AND away.
+        """
+        if isinstance(node, BooleanOpNode):
+            operator = node.operator.upper()
+            operands = node.operands
+            if operator == "NOT":
+                if len(operands) == 1:
+                    return self.all_bits & ~self._eval(operands[0], scope)
+                bits = self._eval(operands[0], scope)
+                for operand in operands[1:]:
+                    if not bits.any():
+                        break
+                    bits = bits & ~self._eval(operand, scope)
+                return bits
+            if operator == "AND":
+                bits = self.all_bits
+                for operand in sorted(operands, key=_is_positional):
+                    # Positions are only matched in the documents the operands before left.
+                    bits = bits & self._eval(operand, scope, bits if _is_positional(operand) else None)
+                    if not bits.any():
+                        break
+                return bits
+            bits = _empty_bits(self.size)
+            for operand in operands:
+                value = self._eval(operand, scope)
+                bits = bits ^ value if operator == "XOR" else bits | value
+            return bits
+
+        if isinstance(node, FieldedSearchNode):
+            field = node.field_canonical_name
+            return self._eval(node.query, FIELD_ALIASES.get(field, (field,)), within)
+
+        if isinstance(node, TermNode) and node.value.startswith("-") and len(node.value) > 1 and not node.is_phrase:
+            # Google's "-word" exclusion, which the parser keeps as a term.
+            return self.all_bits & ~self._eval(TermNode(node.value[1:]), scope)
+
+        # Leaves and proximity operators are cached: building their bitsets is the expensive part.
+        key = (scope, node)
+        bits = self._cache.get(key)  # type: ignore
+        if bits is None:
+            if isinstance(node, ProximityOpNode):
+                if within is not None and _count(within) * 4 < self.size:
+                    return self._eval_proximity_within(node, scope, within)
+                bits = self._eval_proximity(node, scope)
+            else:
+                bits = self._eval_leaf(node, scope)
+            self._cache.put(key, bits)  # type: ignore
+        return bits
+
+    def _eval_leaf(self, node: ASTNode, scope: Tuple[str, ...]) -> Bitset:
+        if isinstance(node, TermNode):
+            return self._eval_term(node, scope)
+        if isinstance(node, DateSearchNode):
+            return self._eval_date(node)
+        if isinstance(node, ClassificationNode):
+            return self._classification_bits(node.scheme.upper(), _normalize_classification(node.value),
+                                             node.include_children)
+        raise ValueError(f"Cannot evaluate node type: {type(node).__name__}")
+
+    def _word_ids(self, word: str) -> List[int]:
+        """Term ids a query word stands for: one, none, or a wildcard's expansion."""
+        if not WILDCARD_REGEX.search(word):
+            term_id = self._term_ids.get(word)
+            return [] if term_id is None else [term_id]
+        if self._wildcards is None:
+            return []
+        return [self._term_ids[term] for term in self._wildcards.expand(word).terms]
+
+    def _eval_term(self, node: TermNode, scope: Tuple[str, ...]) -> Bitset:
+        value = node.value
+        if value.startswith("PARSE_ERROR"):
+            raise ValueError(value)
+        if value == "__EMPTY__":
+            return _empty_bits(self.size)
+        if value.lower() == "is:litigated":
+            return self._litigated
+
+        bits = _empty_bits(self.size)
+        for field in scope:
+            if field in CLASSIFICATION_FIELDS:
+                scheme = CLASSIFICATION_FIELDS[field]
+                symbol = "".join(value.upper().split())
+                include_children = symbol.endswith("/LOW")
+                if include_children:
+                    symbol = symbol[:-len("/LOW")]
+                wildcard = WILDCARD_REGEX.search(symbol)
+                if wildcard:
+                    bits = bits | self._classification_prefix_bits(scheme, symbol[:wildcard.start()])
+                else:
+                    bits = bits | self._classification_bits(scheme, _normalize_classification(symbol), include_children)
+            elif field in KEYWORD_FIELDS:
+                posting = self._keywords[field].get(_normalize_keyword(value))
+                if posting is not None:
+                    bits = bits | _union((posting,), self.size)
+            elif field in self._texts:
+                bits = bits | self._text_bits(field, QUERY_WORD_REGEX.findall(value.lower()))
+        return bits
+
+    def _text_bits(self, field: str, words: List[str]) -> Bitset:
+        """Documents whose `field` contains `words` as a phrase."""
+        alternatives = [self._word_ids(word) for word in words]
+        if not alternatives or not all(alternatives):
+            return _empty_bits(self.size)
+        text = self._texts[field]
+        bits = text.doc_bits(alternatives[0], self.size)
+        for ids in alternatives[1:]:
+            if not bits.any():
+                return bits
+            bits = bits & text.doc_bits(ids, self.size)
+        if len(alternatives) == 1 or not bits.any():
+            return bits
+        candidates = _Candidates(bits, self.size)
+        starts = self._phrase_starts(text, alternatives, candidates)
+        return _bits_from_ids(text.docs_of(starts, candidates), self.size)
+
+    def _classification_bits(self, scheme: str, symbol: str, include_children: bool) -> Bitset:
+        symbols = self._classifications.get(scheme)
+        if not symbols:
+            return _empty_bits(self.size)
+        if not include_children:
+            return _union([symbols[symbol]] if symbol in symbols else [], self.size)
+        if self.classifications is not None and symbol in self.classifications:
+            descendants = self.classifications.descendants(symbol, include_self=True)
+            return _union((symbols[descendant] for descendant in descendants if descendant in symbols), self.size)
+        return self._classification_prefix_bits(scheme, descendant_prefix(symbol))
+
+    def _classification_prefix_bits(self, scheme: str, prefix: str) -> Bitset:
+        """Documents with a `scheme` symbol starting with `prefix`."""
+        symbols = self._classifications.get(scheme)
+        if not symbols:
+            return _empty_bits(self.size)
+        ordered = self._classification_symbols[scheme]
+        matching = []
+        for position in range(bisect_left(ordered, prefix), len(ordered)):
+            if not ordered[position].startswith(prefix):
+                break
+            matching.append(symbols[ordered[position]])
+        return _union(matching, self.size)
+
+    def _eval_date(self, node: DateSearchNode) -> Bitset:
+        field = DATE_FIELD_ALIASES.get(node.field_canonical_name, node.field_canonical_name)
+        column = self._dates.get(field)
+        if column is None:
+            return _empty_bits(self.size)
+        operator = node.operator
+        if node.date_value2 is not None:
+            low, high = _parse_date(node.date_value), _parse_date(node.date_value2, upper=True)
+            if low is None or high is None:
+                raise ValueError(f"Invalid date range: {node.date_value} - {node.date_value2}")
+            bits = column.between(low, high)
+            return self.all_bits & ~bits if operator == "<>" else bits
+        first, last = _parse_date(node.date_value), _parse_date(node.date_value, upper=True)
+        if first is None or last is None:
+            raise ValueError(f"Invalid date: {node.date_value}")
+        if operator == ">=":
+            return column.between(first, None)
+        if operator == ">":
+            return column.between(last + 1, None)
+        if operator == "<=":
+            return column.between(None, last)
+        if operator == "<":
+            return column.between(None, first - 1)
+        bits = column.between(first, last)
+        return self.all_bits & ~bits if operator == "<>" else bits
+
+    # --- Positional matching ---
+
+    def _eval_proximity_within(self, node: ProximityOpNode, scope: Tuple[str, ...], within: Bitset) -> Bitset:
+        """
+        The documents in `within` matching `node`. Cached next to `within`,
+        and only reused for an equal one, as when a query is run again.
+        """
+        key = (scope, node, "within")
+        cached = self._cache.get(key)  # type: ignore
+        if cached is not None and np.array_equal(cached[0], within):
+            return cached[1]
+        bits = self._eval_proximity(node, scope, within)
+        self._cache.put(key, (within, bits))  # type: ignore
+        return bits
+
+    def _eval_proximity(self, node: ProximityOpNode, scope: Tuple[str, ...], within: Optional[Bitset] = None) -> Bitset:
+        bits = _empty_bits(self.size)
+        for field in scope:
+            text = self._texts.get(field)
+            if text is None:
+                continue
+            # A match lies within one field, so only documents with every operand in this field can have one.
+            candidates = text.has_text if within is None else text.has_text & within
+            for term in node.terms:
+                candidates = candidates & self._eval(term, (field,))
+                if not candidates.any():
+                    break
+            if not candidates.any():
+                continue
+            in_field = _Candidates(candidates, self.size)
+            first, _ = self._spans(node, text, field, in_field)
+            # Spans may also have been found outside the candidates, which cannot match.
+            bits = bits | (_bits_from_ids(text.docs_of(first, in_field), self.size) & candidates)
+        return bits
+
+    def _spans(self, node: ASTNode, text: _TextField, field: str, candidates: _Candidates) -> Spans:
+        """
+        The (first, last) positions where `node` matches in `field`, in the
+        `candidates` (and maybe in others).
+        """
+        if isinstance(node, TermNode):
+            alternatives = [self._word_ids(word) for word in QUERY_WORD_REGEX.findall(node.value.lower())]
+            if not alternatives or not all(alternatives):
+                return _NO_SPANS
+            starts = self._phrase_starts(text, alternatives, candidates)
+            return starts, starts + (len(alternatives) - 1)
+        if isinstance(node, BooleanOpNode) and node.operator.upper() == "OR":
+            spans = [self._spans(operand, text, field, candidates) for operand in node.operands]
+            return _sorted_spans(np.concatenate([first for first, _ in spans]), np.concatenate([last for _, last in spans]))
+        if isinstance(node, ProximityOpNode):
+            spans = self._spans(node.terms[0], text, field, candidates)
+            for term in node.terms[1:]:
+                if not len(spans[0]):
+                    break
+                spans = self._near(node, text, candidates, spans, self._spans(term, text, field, candidates))
+            return spans
+        # Anything else only has to match the document in this field.
+        docs = candidates.ids
+        matched = docs[_ids_in(self._eval(node, (field,)) & text.has_text, docs)]
+        return text.whole_docs(matched)
+
+    def _phrase_starts(self, text: _TextField, alternatives: List[List[int]], candidates: _Candidates) -> np.ndarray:
+        """The sorted positions where the i-th word is one of alternatives[i], for every i, in the `candidates`."""
+        # Start from the rarest word and look the others up at their offsets from it.
+        pivot = min(range(len(alternatives)), key=lambda offset: text.occurrences(alternatives[offset]))
+        starts = text.term_positions(alternatives[pivot], candidates) - pivot
+        for offset, ids in enumerate(alternatives):
+            if offset != pivot and len(starts):
+                starts = starts[text.contains(ids, starts + offset)]
+        return starts
+
+    def _near(self, node: ProximityOpNode, text: _TextField, candidates: _Candidates,
+              left: Spans, right: Spans) -> Spans:
+        """The spans covering a left and a right span that satisfy `node`'s operator."""
+        operator = node.operator.upper()
+        unit = node.scope_unit if node.scope_unit not in (None, "word") else SCOPE_UNITS.get(operator, "word")
+        ordered = node.ordered or operator == "ADJ"
+
+        if unit == "word":
+            distance = node.distance or DEFAULT_PROXIMITY_DISTANCE
+            first, last = _follows(left, right, distance)
+            if not ordered:
+                before_first, before_last = _follows(right, left, distance)
+                first, last = np.concatenate((first, before_first)), np.concatenate((last, before_last))
+            if distance > 1:
+                # Adjacent words are always in one document; farther ones may not be.
+                same = text.same_doc(first, last, candidates)
+                first, last = first[same], last[same]
+            return _sorted_spans(first, last)
+
+        left_units = text.units_of(unit, left[0], candidates)
+        right_units = text.units_of(unit, right[0], candidates)  # sorted, as right is
+        low = np.searchsorted(right_units, left_units, "left")
+        high = np.searchsorted(right_units, left_units, "right")
+        if ordered:
+            low = np.maximum(low, np.searchsorted(right[0], left[0], "left"))
+        i, j = _pairs(low, high)
+        a_first, a_last, b_first, b_last = left[0][i], left[1][i], right[0][j], right[1][j]
+        distinct = (a_first != b_first) | (a_last != b_last)
+        return _sorted_spans(np.minimum(a_first, b_first)[distinct], np.maximum(a_last, b_last)[distinct])
+
+
+def _ids_in(bits: Bitset, docs: np.ndarray) -> np.ndarray:
+    """Which of the document numbers `docs` are in `bits`."""
+    return ((bits[docs >> 6] >> (docs & 63).astype(np.uint64)) & np.uint64(1)).astype(np.bool_)
+
+
+def _is_positional(node: ASTNode) -> bool:
+    """Whether `node` is a proximity operator, which AND evaluates after its other operands."""
+    if isinstance(node, FieldedSearchNode):
+        node = node.query
+    return isinstance(node, ProximityOpNode)
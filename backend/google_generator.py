@@ -3,8 +3,9 @@ from ast_nodes import (
     ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
     FieldedSearchNode, DateSearchNode, ClassificationNode
 )
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import re
+from classification_index import may_have_children, normalize_symbol
 
 # --- FIX: Removed AND/OR from the regex. ---
 # This regex now only includes keywords that are *always* operators in Google's syntax (like NOT, NEAR).
@@ -31,6 +32,43 @@ CANONICAL_TO_GOOGLE_DATE_TYPE: Dict[str, str] = {
     "priority_date": "priority"
 }
 
+GOOGLE_FIELD_MAP: Dict[str, str] = {
+    "title": "TI", "abstract": "AB", "claims": "CL", "cpc": "CPC",
+    "ipc": "IPC", "assignee_name": "assignee", "inventor_name": "inventor",
+    "patent_number": "PN", "country_code": "country", "language": "lang",
+    "status": "status", "patent_type": "type",
+}
+
+GOOGLE_DATE_OPERATOR_KEYWORDS: Dict[str, str] = {">=": "after", "<=": "before"}
+
+ATOM_PRECEDENCE = 100
+
+# Memo of op-type string -> precedence. Op types with a distance suffix
+# ("NEAR5") share the precedence of their base operator.
+_precedence_cache: Dict[str, int] = {}
+
+def _precedence(op_type_str: str) -> int:
+    prec = _precedence_cache.get(op_type_str)
+    if prec is None:
+        prec = GOOGLE_OP_PRECEDENCE.get(op_type_str.rstrip('0123456789'), 0)
+        _precedence_cache[op_type_str] = prec
+    return prec
+
+_NOT_PREC = _precedence("NOT")
+_NOT_OPERAND_PREC = _precedence("NOT_OPERAND")
+
+def _term_str(node: TermNode, parent_prec: Optional[int]) -> str:
+    value = node.value
+    if value == "__EMPTY__":
+        return ""
+    if node.is_phrase: res_str = f'"{value}"'
+    # Only keywords that are always operators are quoted, so "AND" and "OR" are not.
+    elif GOOGLE_OPERATOR_KEYWORDS_REGEX.match(value): res_str = f'"{value}"'
+    else: res_str = value
+    if parent_prec is not None and ATOM_PRECEDENCE <= parent_prec:
+        return f"({res_str})"
+    return res_str
+
 class ASTToGoogleQueryGenerator:
     def __init__(self):
         pass
@@ -63,98 +101,144 @@ class ASTToGoogleQueryGenerator:
 
 
     def _map_canonical_to_google_field(self, canonical_name: str) -> Optional[str]:
-        field_map = {
-            "title": "TI", "abstract": "AB", "claims": "CL", "cpc": "CPC",
-            "ipc": "IPC", "assignee_name": "assignee", "inventor_name": "inventor",
-            "patent_number": "PN", "country_code": "country", "language": "lang",
-            "status": "status", "patent_type": "type",
-        }
-        return field_map.get(canonical_name)
-
-    def _needs_paren_google(self, current_op_type_str: Optional[str], parent_op_type_str: Optional[str]) -> bool:
-        if not parent_op_type_str:
-            return False
-        current_op_base = current_op_type_str.rstrip('0123456789') if current_op_type_str else None
-        parent_op_base = parent_op_type_str.rstrip('0123456789') if parent_op_type_str else None
-        current_prec = GOOGLE_OP_PRECEDENCE.get(current_op_base, 0)
-        parent_prec = GOOGLE_OP_PRECEDENCE.get(parent_op_base, 0)
-        
-        # Wrap if the inner operator has lower-or-equal precedence
-        if current_prec <= parent_prec:
-            return True
-        return False
+        return GOOGLE_FIELD_MAP.get(canonical_name)
 
     def _generate_node(self, node: ASTNode, parent_op_type: Optional[str] = None) -> str:
-        res_str = ""
-        current_node_op_type_str = ""
-
-        if isinstance(node, TermNode):
-            current_node_op_type_str = "TERM"
-            if node.value == "__EMPTY__": return ""
-            if node.is_phrase: res_str = f'"{node.value}"'
-            # --- FIX: We now check a more specific regex so that "AND" and "OR" are NOT quoted ---
-            elif GOOGLE_OPERATOR_KEYWORDS_REGEX.match(node.value): res_str = f'"{node.value}"'
-            else: res_str = node.value
-        
-        elif isinstance(node, FieldedSearchNode):
-            field_google = self._map_canonical_to_google_field(node.field_canonical_name)
-            if not field_google:
-                return self._generate_node(node.query, parent_op_type)
-            query_str = self._generate_node(node.query, field_google)
-            if not query_str: return ""
-            res_str = self._format_field_equals_value(field_google, query_str)
-            current_node_op_type_str = "FIELD_WRAPPER"
-        
-        elif isinstance(node, BooleanOpNode):
-            operator_upper = node.operator.upper()
-            current_node_op_type_str = operator_upper
-            if operator_upper == "NOT" and len(node.operands) == 1:
-                operand_str = self._generate_node(node.operands[0], "NOT_OPERAND")
-                if not operand_str: return ""
-                res_str = f"NOT {operand_str}"
-            else:
-                op_strs = [self._generate_node(op, current_node_op_type_str) for op in node.operands]
-                op_strs_filtered = [s for s in op_strs if s]
-                if not op_strs_filtered: return ""
-                if len(op_strs_filtered) == 1: return op_strs_filtered[0]
-                
-                # --- THIS IS THE CORE FIX ---
-                # Use a space for AND, otherwise use the explicit operator.
-                joiner = " " if operator_upper == "AND" else f" {operator_upper} "
-                res_str = joiner.join(op_strs_filtered)
-
-        elif isinstance(node, ProximityOpNode):
-            base_op_type = node.operator.upper()
-            if node.distance is not None and base_op_type in ["ADJ", "NEAR"]:
-                current_node_op_type_str = f"{base_op_type}{node.distance}"
+        """
+        Generates the Google syntax for `node` with an explicit stack instead of
+        recursion, so wide or deeply nested trees cannot hit the recursion limit.
+
+        A visit frame is (node, parent_prec); parent_prec is None at the top,
+        where nothing is parenthesized. A composite node pushes a combine frame
+        (node, parent_prec, parts, pending, op_label, prec) below its children.
+        Term operands are rendered straight into `parts`; the others are left
+        as None and visited, and the combine frame fills those slots from the
+        last `pending` entries of `results` before joining.
+        """
+        results: List[str] = []
+        push_result = results.append
+        stack: List[tuple] = [(node, _precedence(parent_op_type) if parent_op_type else None)]
+        push = stack.append
+        pop = stack.pop
+
+        while stack:
+            frame = pop()
+
+            if len(frame) != 2:
+                node, parent_prec, parts, pending, op_label, prec = frame
+                if pending:
+                    child_strs = results[-pending:]
+                    del results[-pending:]
+                    if pending == len(parts):
+                        parts = child_strs
+                    else:
+                        child_index = 0
+                        for i, part in enumerate(parts):
+                            if part is None:
+                                parts[i] = child_strs[child_index]
+                                child_index += 1
+
+                if op_label == "NOT_OPERAND":
+                    if not parts[0]:
+                        push_result("")
+                        continue
+                    res_str = f"NOT {parts[0]}"
+                elif isinstance(node, FieldedSearchNode):
+                    if not parts[0]:
+                        push_result("")
+                        continue
+                    res_str = self._format_field_equals_value(op_label, parts[0])
+                else:
+                    parts = [p for p in parts if p]
+                    if not parts:
+                        push_result("")
+                        continue
+                    if len(parts) == 1:
+                        push_result(parts[0])
+                        continue
+                    # Use a space for AND, otherwise use the explicit operator.
+                    res_str = (" " if op_label == "AND" else f" {op_label} ").join(parts)
+
+                if parent_prec is not None and prec <= parent_prec:
+                    res_str = f"({res_str})"
+                push_result(res_str)
+                continue
+
+            node, parent_prec = frame
+
+            if isinstance(node, TermNode):
+                push_result(_term_str(node, parent_prec))
+                continue
+
+            if isinstance(node, BooleanOpNode) or isinstance(node, ProximityOpNode):
+                if isinstance(node, BooleanOpNode):
+                    op_label = node.operator.upper()
+                    children = node.operands
+                    if op_label == "NOT" and len(children) == 1:
+                        push((node, parent_prec, [None], 1, "NOT_OPERAND", _NOT_PREC))
+                        push((children[0], _NOT_OPERAND_PREC))
+                        continue
+                else:
+                    base_op_type = node.operator.upper()
+                    if node.distance is not None and base_op_type in ["ADJ", "NEAR"]:
+                        op_label = f"{base_op_type}{node.distance}"
+                    else:
+                        op_label = base_op_type
+                    children = node.terms
+                prec = _precedence_cache.get(op_label)
+                if prec is None:
+                    prec = _precedence(op_label)
+                parts = []
+                pending = 0
+                for child in children:
+                    if isinstance(child, TermNode):
+                        parts.append(_term_str(child, prec))
+                    else:
+                        parts.append(None)
+                        pending += 1
+                push((node, parent_prec, parts, pending, op_label, prec))
+                if pending:
+                    for child in reversed(children):
+                        if not isinstance(child, TermNode):
+                            push((child, prec))
+                continue
+
+            if isinstance(node, FieldedSearchNode):
+                field_google = GOOGLE_FIELD_MAP.get(node.field_canonical_name)
+                if not field_google:
+                    # Unmapped fields are transparent: generate the inner query in place.
+                    push((node.query, parent_prec))
+                    continue
+                push((node, parent_prec, [None], 1, field_google, ATOM_PRECEDENCE))
+                push((node.query, _precedence(field_google)))
+                continue
+
+            if isinstance(node, ClassificationNode):
+                symbol = node.value
+                if "/" in symbol or not node.include_children:  # H01M10 with children is a truncation, kept as is
+                    symbol = normalize_symbol(symbol) or symbol
+                res_str = symbol.replace("/", "")
+                # A leaf in the classification index has nothing below it to add.
+                if node.scheme == "CPC" and node.include_children and may_have_children(symbol):
+                    res_str += "/low"
+
+            elif isinstance(node, DateSearchNode):
+                google_date_type = CANONICAL_TO_GOOGLE_DATE_TYPE.get(node.field_canonical_name)
+                if not google_date_type:
+                    push_result(f"Error:UnknownDateK-V({node.field_canonical_name})")
+                    continue
+                keyword = GOOGLE_DATE_OPERATOR_KEYWORDS.get(node.operator)
+                if not keyword:
+                    push_result(f"Error:UnhandledDateOp({node.operator})")
+                    continue
+                res_str = f"{keyword}:{google_date_type}:{node.date_value}"
+
             else:
-                current_node_op_type_str = base_op_type
-            terms_s = [self._generate_node(t, current_node_op_type_str) for t in node.terms]
-            terms_s_filtered = [ts for ts in terms_s if ts]
-            if not terms_s_filtered: return ""
-            if len(terms_s_filtered) == 1: return terms_s_filtered[0]
-            res_str = f" {current_node_op_type_str} ".join(terms_s_filtered)
-
-        elif isinstance(node, ClassificationNode):
-            current_node_op_type_str = "CLASSIFICATION_ATOM"
-            base_val = node.value.replace("/", "")
-            if node.scheme == "CPC" and node.include_children:
-                base_val += "/low"
-            res_str = base_val
-        
-        elif isinstance(node, DateSearchNode):
-            current_node_op_type_str = "DATE_EXPR_ATOM"
-            google_date_type = CANONICAL_TO_GOOGLE_DATE_TYPE.get(node.field_canonical_name)
-            if not google_date_type: return f"Error:UnknownDateK-V({node.field_canonical_name})"
-            operator_map = {">=": "after", "<=": "before"}
-            keyword = operator_map.get(node.operator)
-            if not keyword: return f"Error:UnhandledDateOp({node.operator})"
-            res_str = f"{keyword}:{google_date_type}:{node.date_value}"
-        
-        else: 
-            return f"Error:UnhandledASTNode({type(node).__name__})"
+                push_result(f"Error:UnhandledASTNode({type(node).__name__})")
+                continue
+
+            if parent_prec is not None and ATOM_PRECEDENCE <= parent_prec:
+                res_str = f"({res_str})"
+            push_result(res_str)
 
-        if self._needs_paren_google(current_node_op_type_str, parent_op_type):
-            return f"({res_str})"
-            
-        return res_str
\ No newline at end of file
+        return results[0]
@@ -1,10 +1,13 @@
 # google_parser.py
-from typing import Dict, Any, List, Optional, Callable, Tuple
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Tuple
 import re
+from time import perf_counter
 from ast_nodes import (
     ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
     FieldedSearchNode, DateSearchNode, ClassificationNode
 )
+from classification_index import normalize_symbol
+from query_budget import QueryBudget, QueryBudgetExceeded, check_cost, check_length, query_cost
 
 # Maps Google's code to (canonical_name, needs_paren_around_content_in_google_syntax_by_default)
 GOOGLE_FIELD_CODE_TO_CANONICAL: Dict[str, tuple[str, bool]] = {
@@ -24,99 +27,475 @@ GOOGLE_DATE_TYPE_TO_CANONICAL: Dict[str, str] = {
     "publication": "publication_date", "filing": "application_date", "priority": "priority_date"
 }
 
-# Regex to capture different parts of a query
+# Lexer regex. Every alternative consumes at least one character, so a single
+# finditer pass splits the query in linear time while keeping match offsets.
 TOKENIZE_REGEX = re.compile(
     r'''
-    (
-        \( .*? \) |  # Match content within parentheses non-greedily
-        "[^"]+" |  # Match content within double quotes
-        \S+  # Match any non-whitespace characters
-    )
+    (?P<ws>\s+) |
+    (?P<lparen>\() |
+    (?P<rparen>\)) |
+    "(?P<phrase>[^"]*)(?P<phrase_close>"?) |  # A phrase; an empty close group means it is unterminated
+    (?P<word>[^\s()"]+)  # Anything else up to whitespace, a paren or a quote
     ''',
     re.VERBOSE
 )
-FIELD_REGEX = re.compile(r"^(\w+)([:=])(.+)$", re.IGNORECASE)
+FIELD_REGEX = re.compile(r"^(\w+)([:=])(.*)$", re.IGNORECASE)
 DATE_REGEX = re.compile(r"^(after|before):(\w+):(.+)$", re.IGNORECASE)
-# Proximity operators are still special
-PROXIMITY_OPERATOR_REGEX = re.compile(r"^(ADJ\d*|NEAR\d*|WITH|SAME)$", re.IGNORECASE)
+# Proximity operators are matched case-insensitively, like the generator's keyword quoting.
+PROXIMITY_OPERATOR_REGEX = re.compile(r"^(ADJ|NEAR)(\d*)$|^(WITH|SAME)$", re.IGNORECASE)
 
+# Token kinds
+T_LPAREN, T_RPAREN, T_PHRASE, T_WORD = "LPAREN", "RPAREN", "PHRASE", "WORD"
+T_OR, T_AND, T_NOT, T_PROX = "OR", "AND", "NOT", "PROX"
 
-class GoogleQueryParser:
+# A token is (kind, value, position in the query string). For T_PROX the
+# value is an (operator, distance) pair.
+Token = Tuple[str, Any, int]
 
-    def _parse_expression(self, tokens: List[str]) -> ASTNode:
-        """
-        Parses a list of tokens into an AST.
-        This simplified version treats all non-proximity operators as regular terms.
-        """
-        if not tokens:
-            return TermNode("__EMPTY__")
-
-        # Handle proximity operators first
-        if len(tokens) == 3 and PROXIMITY_OPERATOR_REGEX.match(tokens[1]):
-            op_token = tokens[1]
-            m = re.match(r"^(ADJ|NEAR|WITH|SAME)(\d*)$", op_token, re.I)
-            op_type, dist_val_str = m.group(1).upper(), m.group(2)
-            distance = int(dist_val_str) if dist_val_str else None
-            
-            left = self._parse_atom(tokens[0])
-            right = self._parse_atom(tokens[2])
-            return ProximityOpNode(op_type, [left, right], distance=distance) # type: ignore
-
-        # Otherwise, treat all tokens as terms to be AND'ed together
-        nodes = [self._parse_atom(t) for t in tokens]
-        
-        if len(nodes) == 1:
-            return nodes[0]
+# Binary operator precedence, lowest first. Adjacent operands are joined by an
+# implicit AND. A unary NOT binds tighter than AND but looser than proximity.
+OR_PRECEDENCE = 1
+AND_PRECEDENCE = 2
+PROXIMITY_PRECEDENCE = 3
+
+
+# --- Incremental parsing ---
+# The query builder reparses on nearly every keystroke, and one keystroke
+# changes a few characters of a long query. `GoogleQueryParser.reparse` takes
+# the ParseState of the previous query plus the edit and
+#   - re-lexes only from the last token before the edit until the scan reaches
+#     a token boundary of the previous query past the edit; the lexer is
+#     context-free from a token boundary, so the tokens after it are the old
+#     ones, shifted by the edit's change in length;
+#   - reuses the subtree of every parenthesized group that lies entirely
+#     before or after the edit, instead of parsing its tokens again, and the
+#     node of every word seen before.
+# Only the groups enclosing the edit and the top-level operator chain are
+# rebuilt. The result is identical to a full parse of the edited query.
+
+# Words recorded beyond the current query's token count before the word table is restarted.
+WORD_TABLE_SLACK = 256
+
+# A parenthesized group: (token count from "(" to ")", position of ")", inner node).
+Group = Tuple[int, int, ASTNode]
+
+
+def _longest_match(limit: int, matches: Callable[[int], bool]) -> int:
+    """The largest n <= limit with matches(n), for a predicate that holds up to some n and fails above it."""
+    # Binary search over slice comparisons, which run in C, rather than a character loop.
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if matches(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class QueryEdit(NamedTuple):
+    """Replacement of query[start:end] by `text`."""
+    start: int
+    end: int
+    text: str
+
+    @classmethod
+    def between(cls, old: str, new: str) -> "QueryEdit":
+        """The smallest single edit that turns `old` into `new`."""
+        limit = min(len(old), len(new))
+        prefix = _longest_match(limit, lambda n: old[:n] == new[:n])
+        suffix = _longest_match(limit - prefix, lambda n: old[len(old) - n:] == new[len(new) - n:])
+        return cls(prefix, len(old) - suffix, new[prefix:len(new) - suffix])
+
+    def apply(self, query_string: str) -> str:
+        return query_string[:self.start] + self.text + query_string[self.end:]
+
+
+class ParseState(NamedTuple):
+    """
+    What `reparse` needs from a previous parse. States share subtrees and are
+    not modified, except `words`, which later states share and add to.
+    """
+    query: str
+    root: QueryRootNode
+    tokens: List[Token]
+    # Parenthesized groups by the position of their "(".
+    groups: Dict[int, Group]
+    # Nodes of words that parse on their own (not "TI=" followed by a group), by word.
+    words: Dict[str, ASTNode]
+
+
+def _normalize_classifications(node: ASTNode) -> ASTNode:
+    """
+    `node` with the classification symbols in its terms normalized
+    (h01m 10/0525 -> H01M10/0525), keeping a "/low" suffix. Values that are not
+    symbols, such as wildcards, are left as written, and so is a group with
+    children but no "/" (H01M10/low), which is a truncation rather than
+    H01M10/00, as in the USPTO parser and the generators.
+    """
+    if isinstance(node, TermNode) and not node.is_phrase:
+        value, suffix = node.value, ""
+        if value.lower().endswith("/low"):
+            value, suffix = value[:-len("/low")], "/low"
+        if "/" not in value and suffix:
+            return node
+        symbol = normalize_symbol(value)
+        if symbol is None or symbol == value:
+            return node
+        return TermNode(symbol + suffix)
+    if isinstance(node, BooleanOpNode):
+        operands = [_normalize_classifications(operand) for operand in node.operands]
+        if all(new is old for new, old in zip(operands, node.operands)):
+            return node
+        return BooleanOpNode(node.operator, operands)  # type: ignore
+    return node
+
+
+class QuerySyntaxError(ValueError):
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+def tokenize(query_string: str) -> List[Token]:
+    return _tokenize(query_string)[0]
+
+
+def _tokenize(query_string: str, start: int = 0, sync_from: Optional[int] = None,
+              is_synced: Optional[Callable[[int], bool]] = None) -> Tuple[List[Token], Optional[int]]:
+    """
+    Tokenizes `query_string` from `start`. If `is_synced` is given, it is asked
+    about every match boundary at or after `sync_from`; the first boundary it
+    accepts ends the scan. Returns the tokens and that boundary (None if the
+    scan ran to the end).
+    """
+    tokens: List[Token] = []
+    if sync_from is None:
+        sync_from = len(query_string) + 1
+    for m in TOKENIZE_REGEX.finditer(query_string, start):
+        kind = m.lastgroup
+        pos = m.start()
+        if pos >= sync_from and is_synced is not None and is_synced(pos):
+            return tokens, pos
+        if kind == "ws":
+            continue
+        if kind == "lparen":
+            tokens.append((T_LPAREN, "(", pos))
+        elif kind == "rparen":
+            tokens.append((T_RPAREN, ")", pos))
+        elif kind in ("phrase", "phrase_close"):
+            if not m.group("phrase_close"):
+                raise QuerySyntaxError("Unterminated phrase", pos)
+            if m.group("phrase"):
+                tokens.append((T_PHRASE, m.group("phrase"), pos))
         else:
-            return BooleanOpNode("AND", nodes)
+            word = m.group("word")
+            # AND/OR/NOT are only operators in upper case; lower-case "and"/"or"/"not" stay ordinary terms.
+            if word == "OR":
+                tokens.append((T_OR, word, pos))
+            elif word == "AND":
+                tokens.append((T_AND, word, pos))
+            elif word == "NOT":
+                tokens.append((T_NOT, word, pos))
+            else:
+                prox_match = PROXIMITY_OPERATOR_REGEX.match(word)
+                if prox_match:
+                    if prox_match.group(1):
+                        op_type, dist_val_str = prox_match.group(1).upper(), prox_match.group(2)
+                    else:
+                        op_type, dist_val_str = prox_match.group(3).upper(), ""
+                    distance = int(dist_val_str) if dist_val_str else None
+                    tokens.append((T_PROX, (op_type, distance), pos))
+                else:
+                    tokens.append((T_WORD, word, pos))
+    return tokens, None
+
+
+def _check_tokens(tokens: List[Token], budget: QueryBudget) -> None:
+    """Raises QueryBudgetExceeded for too many tokens, or parentheses and NOTs nested deeper than max_depth."""
+    if len(tokens) > budget.max_tokens:
+        raise QueryBudgetExceeded("tokens", len(tokens), budget.max_tokens, tokens[budget.max_tokens][2])
+    # A run of NOTs nests like parentheses: each one is another level of recursion in the parser.
+    parentheses = nots = 0
+    for kind, _, pos in tokens:
+        if kind == T_LPAREN:
+            parentheses += 1
+        elif kind == T_RPAREN:
+            parentheses -= 1
+        elif kind == T_NOT:
+            nots += 1
+        else:
+            nots = 0
+            continue
+        if parentheses + nots > budget.max_depth:
+            raise QueryBudgetExceeded("depth", parentheses + nots, budget.max_depth, pos)
+
+
+def _first_token_at_or_after(tokens: List[Token], position: int) -> int:
+    low, high = 0, len(tokens)
+    while low < high:
+        middle = (low + high) // 2
+        if tokens[middle][2] < position:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _retokenize(old_tokens: List[Token], new_query: str, edit: QueryEdit) -> List[Token]:
+    """Tokens of `new_query`, the query of `old_tokens` with `edit` applied, re-lexing only around the edit."""
+    delta = len(edit.text) - (edit.end - edit.start)
+    # Everything before the last token that starts before the edit is unchanged.
+    restart = max(_first_token_at_or_after(old_tokens, edit.start) - 1, 0)
+    restart_position = old_tokens[restart][2] if restart else 0
 
-    def _parse_atom(self, token: str) -> ASTNode:
-        """Parses a single token (which can be a group) into an ASTNode."""
-        token = token.strip()
+    def is_synced(position: int) -> bool:
+        # A boundary where an old token started: from here on the text, and so the tokens, are the old ones.
+        old_position = position - delta
+        index = _first_token_at_or_after(old_tokens, old_position)
+        return index < len(old_tokens) and old_tokens[index][2] == old_position
 
-        if token.startswith('(') and token.endswith(')'):
-            inner_content = token[1:-1]
-            inner_tokens = TOKENIZE_REGEX.findall(inner_content)
-            return self._parse_expression(inner_tokens)
+    relexed, synced_at = _tokenize(new_query, restart_position, edit.start + len(edit.text), is_synced)
+    tokens = old_tokens[:restart] + relexed
+    if synced_at is not None:
+        tail = old_tokens[_first_token_at_or_after(old_tokens, synced_at - delta):]
+        tokens += tail if not delta else [(kind, value, pos + delta) for kind, value, pos in tail]
+    return tokens
 
-        if token.startswith('"') and token.endswith('"'):
-            return TermNode(token[1:-1], is_phrase=True)
-            
-        field_match = FIELD_REGEX.match(token)
+
+class _ExpressionParser:
+    """
+    Precedence-climbing parser over a token list. Each token is visited once,
+    so parsing is linear in the number of tokens. Holds per-call state so that
+    a single GoogleQueryParser can be shared between threads.
+    """
+    def __init__(self, tokens: List[Token], query_length: int,
+                 groups: Optional[Dict[int, Group]] = None, words: Optional[Dict[str, ASTNode]] = None):
+        self.tokens = tokens
+        self.index = 0
+        self.end_position = query_length
+        # If given, parsed groups and words are recorded here, and one already
+        # in them is taken from them instead of being parsed again.
+        self.groups = groups
+        self.words = words
+
+    def _peek(self) -> Optional[Token]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _peek_operator(self) -> Optional[Tuple[Any, int]]:
+        """Returns (operator key, precedence) for the operator at the cursor, if any."""
+        token = self._peek()
+        if token is None or token[0] == T_RPAREN:
+            return None
+        kind = token[0]
+        if kind == T_OR:
+            return T_OR, OR_PRECEDENCE
+        if kind == T_PROX:
+            return token[1], PROXIMITY_PRECEDENCE
+        # An explicit AND, or the start of another operand (implicit AND).
+        return T_AND, AND_PRECEDENCE
+
+    def parse_expression(self, min_precedence: int = OR_PRECEDENCE) -> ASTNode:
+        left = self.parse_unary()
+        while True:
+            operator = self._peek_operator()
+            if operator is None or operator[1] < min_precedence:
+                return left
+            key, precedence = operator
+            # Collect a whole chain of the same operator into one node (a OR b OR c).
+            operands = [left]
+            while True:
+                if self.tokens[self.index][0] in (T_OR, T_AND, T_PROX):
+                    self.index += 1
+                operands.append(self.parse_expression(precedence + 1))
+                following = self._peek_operator()
+                if following is None or following[0] != key:
+                    break
+            left = self._build(key, operands)
+
+    def _build(self, key: Any, operands: List[ASTNode]) -> ASTNode:
+        if key == T_OR or key == T_AND:
+            return BooleanOpNode(key, operands)
+        op_type, distance = key
+        return ProximityOpNode(op_type, operands, distance=distance)  # type: ignore
+
+    def parse_unary(self) -> ASTNode:
+        token = self._peek()
+        if token is not None and token[0] == T_NOT:
+            self.index += 1
+            following = self._peek()
+            if following is None or following[0] in (T_RPAREN, T_OR, T_AND, T_PROX):
+                # Nothing to negate ("a NOT", "NOT OR b"): the word itself, as before NOT was an operator.
+                return TermNode(token[1])
+            return BooleanOpNode("NOT", [self.parse_expression(PROXIMITY_PRECEDENCE)])
+        return self.parse_atom()
+
+    def parse_atom(self) -> ASTNode:
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query", self.end_position)
+        kind, value, pos = token
+
+        if kind == T_LPAREN:
+            groups = self.groups
+            if groups is not None and pos in groups:
+                span, closing_position, node = groups[pos]
+                end = self.index + span
+                # The group's ")" must still be where it was, or its tokens changed.
+                if end < len(self.tokens) and self.tokens[end][2] == closing_position:
+                    self.index = end + 1
+                    return node
+            opening_index = self.index
+            self.index += 1
+            closing = self._peek()
+            if closing is not None and closing[0] == T_RPAREN:
+                self.index += 1
+                return TermNode("__EMPTY__")
+            inner = self.parse_expression()
+            closing = self._peek()
+            if closing is None or closing[0] != T_RPAREN:
+                raise QuerySyntaxError("Unclosed parenthesis opened", pos)
+            if groups is not None:
+                groups[pos] = (self.index - opening_index, closing[2], inner)
+            self.index += 1
+            return inner
+
+        if kind == T_PHRASE:
+            self.index += 1
+            return TermNode(value, is_phrase=True)
+
+        if kind == T_WORD:
+            self.index += 1
+            words = self.words
+            if words is None:
+                return self._parse_word(value)
+            node = words.get(value)
+            if node is None:
+                following = self.index
+                node = self._parse_word(value)
+                if self.index == following:
+                    words[value] = node
+            return node
+
+        if kind == T_RPAREN:
+            raise QuerySyntaxError("Unmatched ')'", pos)
+        operator_text = value[0] if kind == T_PROX else value
+        raise QuerySyntaxError(f"Unexpected operator '{operator_text}'", pos)
+
+    def _parse_word(self, word: str) -> ASTNode:
+        if word.lower() == "is:litigated":
+            return TermNode("is:litigated")
+
+        field_match = FIELD_REGEX.match(word)
         if field_match:
             key, _, value = field_match.groups()
-            key_lower = key.lower()
 
-            date_match = DATE_REGEX.match(token)
+            date_match = DATE_REGEX.match(word)
             if date_match:
                 op_keyword, date_type, date_val = date_match.groups()
                 canonical_field = GOOGLE_DATE_TYPE_TO_CANONICAL.get(date_type.lower())
                 if canonical_field:
-                     op = ">=" if op_keyword.lower() == "after" else "<="
-                     return DateSearchNode(canonical_field, op, date_val) # type: ignore
-            
-            canonical_name_tuple = CASE_INSENSITIVE_FIELD_MAP.get(key_lower)
+                    op = ">=" if op_keyword.lower() == "after" else "<="
+                    return DateSearchNode(canonical_field, op, date_val)  # type: ignore
+
+            canonical_name_tuple = CASE_INSENSITIVE_FIELD_MAP.get(key.lower())
             if canonical_name_tuple:
                 canonical_name = canonical_name_tuple[0]
-                return FieldedSearchNode(canonical_name, self._parse_atom(value), system_field_code=key.upper())
-        
-        if token.lower() == "is:litigated":
-            return TermNode("is:litigated")
+                # "TI=word" carries its value inline; "TI=(...)" and 'TI="..."' take the next atom.
+                field_query = self._parse_word(value) if value else self.parse_atom()
+                if canonical_name in ("cpc", "ipc"):
+                    field_query = _normalize_classifications(field_query)
+                return FieldedSearchNode(canonical_name, field_query, system_field_code=key.upper())
 
-        return TermNode(token)
+        return TermNode(word)
 
-    def parse(self, query_string: str) -> QueryRootNode:
-        query_string = query_string.strip()
+
+class GoogleQueryParser:
+
+    def parse(self, query_string: str, timings: Optional[Dict[str, float]] = None,
+              budget: Optional[QueryBudget] = None) -> QueryRootNode:
+        """
+        Parses `query_string`. If `timings` is given, the seconds spent in the
+        "tokenize" and "parse" stages are stored in it. With a `budget`, a query
+        over it raises QueryBudgetExceeded as soon as that is known, instead of
+        being parsed (see query_budget.py).
+        """
+        return self._parse(query_string.strip(), tokenize, None, None, timings, budget)[0]
+
+    def parse_with_state(self, query_string: str, timings: Optional[Dict[str, float]] = None,
+                         budget: Optional[QueryBudget] = None) -> Tuple[QueryRootNode, Optional[ParseState]]:
+        """Like `parse`, but also returns the state `reparse` needs (None if the query did not parse)."""
+        return self._parse(query_string.strip(), tokenize, {}, {}, timings, budget)
+
+    def reparse(self, previous: ParseState, edit: QueryEdit, timings: Optional[Dict[str, float]] = None,
+                budget: Optional[QueryBudget] = None) -> Tuple[QueryRootNode, Optional[ParseState]]:
+        """
+        Parses `edit` applied to `previous.query`, reusing the previous tokens
+        and unchanged groups. Returns the same AST as `parse_with_state` on the
+        edited query, and the new state.
+        """
+        query_string = edit.apply(previous.query)
+        if query_string != query_string.strip() or not previous.tokens:
+            return self.parse_with_state(query_string, timings, budget)
+
+        delta = len(edit.text) - (edit.end - edit.start)
+        # Groups untouched by the edit keep their subtree; those after it move by `delta`.
+        groups: Dict[int, Group] = {}
+        for pos, (span, closing_position, node) in previous.groups.items():
+            if closing_position < edit.start:
+                groups[pos] = (span, closing_position, node)
+            elif pos >= edit.end:
+                groups[pos + delta] = (span, closing_position + delta, node)
+
+        def retokenize(new_query: str) -> List[Token]:
+            return _retokenize(previous.tokens, new_query, edit)
+
+        # Word nodes do not depend on position, so the table is carried over
+        # as is; it is only restarted when words typed over time outgrow the query.
+        words = previous.words if len(previous.words) <= len(previous.tokens) + WORD_TABLE_SLACK else {}
+        return self._parse(query_string, retokenize, groups, words, timings, budget)
+
+    def reparse_query(self, previous: ParseState, query_string: str, timings: Optional[Dict[str, float]] = None,
+                      budget: Optional[QueryBudget] = None) -> Tuple[QueryRootNode, Optional[ParseState]]:
+        """Like `reparse`, for callers that have the new query rather than the edit."""
+        return self.reparse(previous, QueryEdit.between(previous.query, query_string.strip()), timings, budget)
+
+    def _parse(self, query_string: str, tokenizer: Callable[[str], List[Token]],
+               groups: Optional[Dict[int, Group]], words: Optional[Dict[str, ASTNode]],
+               timings: Optional[Dict[str, float]],
+               budget: Optional[QueryBudget] = None) -> Tuple[QueryRootNode, Optional[ParseState]]:
+        """Parses a stripped query. A state is only returned when `groups` is given and the query parsed."""
         if not query_string:
-            return QueryRootNode(query=TermNode("__EMPTY__"))
+            return QueryRootNode(query=TermNode("__EMPTY__")), None
+        if budget is not None:
+            check_length(query_string, budget)
 
         try:
-            tokens = TOKENIZE_REGEX.findall(query_string)
+            started = perf_counter()
+            tokens = tokenizer(query_string)
+            tokenized = perf_counter()
             if not tokens:
-                 return QueryRootNode(query=TermNode("__EMPTY__"))
+                 return QueryRootNode(query=TermNode("__EMPTY__")), None
+            if budget is not None:
+                _check_tokens(tokens, budget)
+
+            expression_parser = _ExpressionParser(tokens, len(query_string), groups, words)
+            final_ast = expression_parser.parse_expression()
+            leftover = expression_parser._peek()
+            if leftover is not None:
+                raise QuerySyntaxError("Unmatched ')'", leftover[2])
+            if timings is not None:
+                timings["tokenize"] = tokenized - started
+                timings["parse"] = perf_counter() - tokenized
+            root = QueryRootNode(query=final_ast)
+            if budget is not None:
+                check_cost(query_cost(root), budget)
+            state = ParseState(query_string, root, tokens, groups, words) if groups is not None and words is not None else None
+            return root, state
 
-            final_ast = self._parse_expression(tokens)
-            return QueryRootNode(query=final_ast)
-        
+        except QueryBudgetExceeded:
+            raise
+        except RecursionError:
+            return QueryRootNode(query=TermNode("PARSE_ERROR: Query is nested too deeply")), None
         except Exception as e:
-            return QueryRootNode(query=TermNode(f"PARSE_ERROR: {str(e)}"))
\ No newline at end of file
+            return QueryRootNode(query=TermNode(f"PARSE_ERROR: {str(e)}")), None
@@ -0,0 +1,77 @@
+# live_query.py
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from pydantic import ValidationError
+from ast_nodes import QueryRootNode
+from dispatch import DISPATCHER
+import models
+import services
+
+# --- Live query sessions ---
+# One session per /ws/live-query connection. The client keeps its form state
+# on the server and sends only what changed; the server answers each message
+# with the generated query and a patch to the AST it sent last.
+#
+# Client -> server, one JSON object per message:
+#   {"id": 1, "request": {...}}  the whole GenerateRequest
+#   {"id": 2, "patch": {...}}    a JSON Merge Patch (RFC 7386) to the last
+#                                request: objects merge key by key, null
+#                                deletes a key, anything else (including
+#                                lists) replaces the old value
+# Server -> client:
+#   {"id": 2, "queryStringDisplay": "...", "url": "...", "astPatch": [...]}
+#   {"id": 2, "error": {"status": 422, "detail": ...}}
+# "astPatch" is a JSON Patch (RFC 6902, see ast_diff) from the AST of the
+# last successful reply, or from null for the first one, to the new AST in
+# its to_dict() form. The request's astFormat is ignored.
+#
+# A merged request that fails validation is discarded, so the next patch
+# applies to the last valid one. A valid request is kept even if generating
+# from it fails (e.g. 503), since the client has already moved on from it.
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Returns `target` with the JSON Merge Patch `patch` applied. `target` is not modified."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+class LiveQuerySession:
+    def __init__(self):
+        self.request: Optional[Dict[str, Any]] = None
+        self.ast: Optional[QueryRootNode] = None
+
+    async def handle(self, message: Any) -> Dict[str, Any]:
+        """Processes one client message and returns the reply."""
+        message_id = message.get("id") if isinstance(message, dict) else None
+        reply: Dict[str, Any] = {"id": message_id}
+        try:
+            if not isinstance(message, dict) or ("request" in message) == ("patch" in message):
+                raise HTTPException(status_code=400, detail='A message needs exactly one of "request" or "patch"')
+            if "request" in message:
+                data = message["request"]
+            elif self.request is None:
+                raise HTTPException(status_code=409, detail='Send a "request" before the first "patch"')
+            else:
+                data = merge_patch(self.request, message["patch"])
+            try:
+                request = models.GenerateRequest.model_validate(data)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+            self.request = data
+
+            display, url, ast_root, patch = await DISPATCHER.run(services.generate_query_diff, request, self.ast)
+            self.ast = ast_root
+            reply.update(queryStringDisplay=display, url=url, astPatch=patch)
+        except HTTPException as e:
+            reply["error"] = {"status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            reply["error"] = {"status": 500, "detail": f"Internal server error: {e}"}
+        return reply
@@ -0,0 +1,89 @@
+# lru_cache.py
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import threading
+import time
+
+_MISSING = object()
+_COUNTERS = ("hits", "misses", "evictions", "expirations")
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded mapping that evicts the least recently used
+    entry once `maxsize` is reached. With `ttl` (seconds), entries also expire
+    that long after they were stored. Keeps hit/miss/eviction/expiry counters
+    so the effectiveness of each cache can be observed at runtime.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Without a ttl values are stored as is; with one, as (value, expiry time).
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            if self.ttl is not None:
+                value, expires_at = value
+                if time.monotonic() >= expires_at:
+                    del self._data[key]
+                    self.expirations += 1
+                    self.misses += 1
+                    return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.ttl is not None:
+            value = (value, time.monotonic() + self.ttl)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self._data[key] = value
+                return
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def take_counters(self) -> Dict[str, int]:
+        """Returns the counters and zeroes them, leaving the entries alone (see metrics.take_worker_stats)."""
+        with self._lock:
+            counters = {name: getattr(self, name) for name in _COUNTERS}
+            self.hits = self.misses = self.evictions = self.expirations = 0
+            return counters
+
+    def add_counters(self, counters: Dict[str, int]) -> None:
+        """Adds counters taken from the same cache in another process."""
+        with self._lock:
+            for name in _COUNTERS:
+                setattr(self, name, getattr(self, name) + counters.get(name, 0))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "size": len(self._data), "maxsize": self.maxsize,
+            }
@@ -1,7 +1,15 @@
 
 # /backend/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, List, Literal, Optional, Tuple, Union
+import asyncio
+import codecs
+from dispatch import DISPATCHER
+from live_query import LiveQuerySession
+import metrics
 import models
 import services
 
@@ -19,14 +27,37 @@ app.add_middleware(
 
 # --- API Endpoints ---
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak and strong validators compare equal for If-None-Match.
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
 @app.post("/api/generate-query", response_model=models.GenerateResponse)
-async def handle_generate_query(request: models.GenerateRequest):
+async def handle_generate_query(request: models.GenerateRequest,
+                                if_none_match: Optional[str] = Header(default=None)):
     """
     Receives structured data from the frontend and generates a query string and URL.
     This single endpoint handles both 'google' and 'uspto' formats.
+    The work runs on the dispatcher's pool (503 when saturated, 504 on timeout).
+
+    The ETag is a hash of the request body, so a client that sends it back in
+    If-None-Match for the same form state gets a 304 without any work being done.
+    The body is built as JSON bytes (see services), so response_model only
+    documents it.
     """
     try:
-        return services.generate_query(request)
+        key = services.generate_request_key(request)
+        etag = f'"{key}"'
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        body = services.GENERATE_RESPONSE_CACHE.get(key)
+        if body is None:
+            body = await DISPATCHER.run(services.generate_query_json, request)
+            services.GENERATE_RESPONSE_CACHE.put(key, body)
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
     except HTTPException as e:
         raise e  # Re-raise known HTTP exceptions
     except Exception as e:
@@ -36,10 +67,14 @@ async def handle_generate_query(request: models.GenerateRequest):
 async def handle_parse_query(request: models.ParseRequest):
     """
     Receives a raw query string and deconstructs it into a structured
-    representation for the frontend UI.
+    representation for the frontend UI. A query over the complexity budget
+    gets a 413 (too long, too many tokens) or 422 (too many nodes, too deep,
+    too many wildcards or proximity combinations), detailed in the body.
+    Like generate-query, the body is built as JSON bytes.
     """
     try:
-        return services.parse_query(request)
+        body = await DISPATCHER.run(services.parse_query_json, request)
+        return Response(content=body, media_type="application/json")
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -51,9 +86,234 @@ async def handle_convert_query(request: models.ConvertRequest):
     Converts a query string from a source format to a target format.
     """
     try:
-        return services.convert_query_service(request)
+        return await DISPATCHER.run(services.convert_query_service, request)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error during conversion: {e}")
 
+@app.post("/api/convert-query/batch", response_model=models.BatchConvertResponse)
+async def handle_convert_query_batch(request: models.BatchConvertRequest):
+    """
+    Converts many query strings in one call. Results come back in input order,
+    each with its own error slot, so one bad query does not fail the batch.
+    """
+    try:
+        # The batch blocks on the worker pool; keep the event loop free meanwhile.
+        return await run_in_threadpool(services.convert_query_batch_service, request)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error during batch conversion: {e}")
+
+@app.post("/api/query-templates/render", response_model=models.TemplateRenderResponse)
+async def handle_render_template(request: models.TemplateRenderRequest):
+    """
+    Renders a query template with {name} placeholders once per set of values.
+    The template is parsed once; each binding only fills in its values. A
+    binding with missing or empty values gets an error slot of its own.
+    """
+    try:
+        return await DISPATCHER.run(services.render_template_service, request)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+
+@app.post("/api/wildcard-expansion", response_model=models.WildcardExpansionResponse)
+async def handle_wildcard_expansion(request: models.WildcardExpansionRequest):
+    """
+    Reports how many vocabulary terms each wildcard term of a query matches,
+    and the query with those terms spelled out as ORs of plain terms, for
+    searches that lack truncation. Terms whose expansion was capped keep
+    their wildcard. 503 if no vocabulary is configured.
+    """
+    try:
+        return await DISPATCHER.run(services.wildcard_expansion_service, request)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+
+@app.websocket("/ws/live-query")
+async def handle_live_query(websocket: WebSocket):
+    """
+    A query-building session: the client sends the form state once and then
+    only its changes, and gets back the query string, URL and a patch to the
+    previous AST for each message. See live_query.py for the message format.
+    """
+    await websocket.accept()
+    session = LiveQuerySession()
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"id": None, "error": {"status": 400, "detail": "Message is not valid JSON"}})
+                continue
+            await websocket.send_json(await session.handle(message))
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/api/cache-stats")
+async def handle_cache_stats():
+    """Reports hit, miss and eviction counters for the parse/generate caches."""
+    return services.cache_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def handle_metrics():
+    """
+    Per-stage latency histograms for the generate, parse and convert
+    pipelines in the Prometheus text format, labeled by endpoint, format and
+    stage (tokenize, parse, extract_fields, generate, to_dict, response, ...).
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose content generator is still reading the request
+    body. The stock class may listen for client disconnects on `receive` while
+    streaming, which would swallow body chunks; here only the body reader
+    (_BodyReader) calls `receive`, and it reports disconnects itself.
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+class _BodyReader:
+    """
+    Reads a request body chunk by chunk and notices when the client goes
+    away: at the next chunk while the body is arriving, and through a
+    listener for the disconnect message once it has been read.
+    """
+    def __init__(self, request: Request):
+        self._receive = request.receive
+        self._complete = False
+        self._disconnected = False
+        self._listener: Optional[asyncio.Future] = None
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while not self._complete:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                self._disconnected = True
+                return
+            if not message.get("more_body", False):
+                self._complete = True
+                # Only the disconnect can come after the body.
+                self._listener = asyncio.ensure_future(self._receive())
+            if message.get("body"):
+                yield message["body"]
+
+    @property
+    def client_gone(self) -> bool:
+        return self._disconnected or (self._listener is not None and self._listener.done())
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+
+async def _iter_body_lines(chunks: AsyncIterator[bytes], max_length: int) -> AsyncIterator[List[Union[str, int]]]:
+    """
+    Yields the request body's lines as chunks arrive, without buffering it
+    whole: for each chunk, the lines it completes. A line longer than
+    `max_length` characters is not kept; its length (an int) stands in for
+    it, and the rest of it is only counted as it arrives.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    # Text of the current, still unterminated line. Kept as a list of pieces so
+    # a long line split across many chunks is joined once.
+    partial: List[str] = []
+    length = 0
+    async for chunk in chunks:
+        *lines, tail = decoder.decode(chunk).split("\n")
+        complete: List[Union[str, int]] = []
+        for line in lines:
+            length += len(line)
+            if length > max_length:
+                complete.append(length)
+            elif partial:
+                partial.append(line)
+                complete.append("".join(partial))
+            else:
+                complete.append(line)
+            partial = []
+            length = 0
+        length += len(tail)
+        if length > max_length:
+            partial = []
+        elif tail:
+            partial.append(tail)
+        if complete:
+            yield complete
+    tail = decoder.decode(b"", final=True)
+    length += len(tail)
+    if length > max_length:
+        yield [length]
+    else:
+        partial.append(tail)
+        last_line = "".join(partial)
+        if last_line:
+            yield [last_line]
+
+# Lines converted per worker call: enough to amortize the hand-off, few enough
+# that results still trickle out while a long body is uploading.
+STREAM_GROUP_SIZE = 64
+
+@app.post("/api/convert-query/stream")
+async def handle_convert_query_stream(
+    request: Request,
+    source_format: Literal["google", "uspto"],
+    target_format: Literal["google", "uspto"],
+):
+    """
+    Converts newline-delimited query strings from the request body and streams
+    one NDJSON result per non-blank input line. `index` is the 0-based input
+    line number. Results are produced only as fast as the client reads them.
+
+    Lines are converted on the dispatcher's pool in small groups. A line over
+    the query length budget gets an error result without being buffered, and
+    so does every line of a group the pool turns away (busy or timed out),
+    since the response status is already sent. Once the client disconnects,
+    no further group is converted.
+    """
+    async def convert(group: List[Tuple[int, str]]) -> bytes:
+        try:
+            return await DISPATCHER.run(services.convert_query_ndjson_lines, group, source_format, target_format)
+        except HTTPException as e:
+            return b"".join(services.ndjson_error_line(index, str(e.detail)) for index, _ in group)
+
+    async def results() -> AsyncIterator[bytes]:
+        body = _BodyReader(request)
+        index = 0
+        # Room for the "\r" of a CRLF line end; conversion checks the exact length.
+        max_length = services.QUERY_BUDGET.max_length + 1
+        try:
+            async for lines in _iter_body_lines(body.chunks(), max_length):
+                group: List[Tuple[int, str]] = []
+                for line in lines:
+                    if isinstance(line, int):
+                        if group:
+                            yield await convert(group)
+                            group = []
+                        yield services.oversized_ndjson_line(index, line)
+                    else:
+                        query_string = line.rstrip("\r")
+                        if query_string.strip():
+                            group.append((index, query_string))
+                            if len(group) == STREAM_GROUP_SIZE:
+                                if body.client_gone:
+                                    return
+                                yield await convert(group)
+                                group = []
+                    index += 1
+                if group and not body.client_gone:
+                    yield await convert(group)
+        finally:
+            body.close()
+
+    return _DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
 # To run the app:
 # uvicorn main:app --reload
\ No newline at end of file
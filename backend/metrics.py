@@ -0,0 +1,158 @@
+# metrics.py
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+
+# Upper bounds in seconds. Pipeline stages range from microseconds (generating
+# a short query) to seconds (parsing a huge pasted query), so the buckets are
+# spread logarithmically over that whole range.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    A labeled histogram rendered in the Prometheus text format. `observe`
+    only bumps one bucket counter under a lock; cumulative counts are worked
+    out when the metrics are scraped.
+    """
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def take(self) -> Dict[Tuple[str, ...], list]:
+        """Returns the series observed since the last take and clears them (see take_worker_stats)."""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], list]) -> None:
+        """Adds series taken from another Histogram with the same buckets."""
+        with self._lock:
+            for label_values, (counts, total, count) in series.items():
+                mine = self._series.get(label_values)
+                if mine is None:
+                    mine = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                mine[1] += total
+                mine[2] += count
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        for label_values, counts, total, count in sorted(snapshot):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+STAGE_LATENCY = Histogram(
+    "patentpeek_stage_duration_seconds",
+    "Time spent in each stage of the query pipeline.",
+    ("endpoint", "format", "stage"),
+)
+
+REGISTRY: List[Histogram] = [STAGE_LATENCY]
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Counts from worker processes ---
+# With PATENTPEEK_EXECUTION_MODE=process (and for batch chunks) service calls
+# run in pool processes, whose histograms and cache counters /metrics and
+# /api/cache-stats in the parent never see. Each source of such counts
+# registers a `take` (return the counts since the last take, and zero them)
+# and a `merge` (add counts taken in another process). A worker takes once
+# before a call, to drop counts it inherited or left over, and once after it;
+# the second take travels back with the result and the parent merges it.
+_WORKER_STATS: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+
+
+def register_worker_stats(name: str, take: Callable[[], Any], merge: Callable[[Any], None]) -> None:
+    _WORKER_STATS[name] = (take, merge)
+
+
+def take_worker_stats() -> Dict[str, Any]:
+    return {name: take() for name, (take, _) in _WORKER_STATS.items()}
+
+
+def merge_worker_stats(stats: Dict[str, Any]) -> None:
+    for name, value in stats.items():
+        entry = _WORKER_STATS.get(name)
+        if entry is not None:
+            entry[1](value)
+
+
+for _metric in REGISTRY:
+    register_worker_stats(_metric.name, _metric.take, _metric.merge)
+
+
+class StageTimer:
+    """
+    Times the consecutive stages of one service call. Each `lap` records the
+    time since the previous lap (or since the timer was created), so a stage
+    costs a single clock read. `finish` records the whole call as "total".
+    """
+    __slots__ = ('endpoint', 'fmt', '_start', '_last')
+
+    def __init__(self, endpoint: str, fmt: str):
+        self.endpoint = endpoint
+        self.fmt = fmt
+        self._start = self._last = perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = perf_counter()
+        STAGE_LATENCY.observe((self.endpoint, self.fmt, stage), now - self._last)
+        self._last = now
+
+    def record(self, timings: Optional[Dict[str, float]]) -> None:
+        """Records stage durations measured elsewhere (e.g. by a parser) and restarts the lap clock."""
+        if timings:
+            for stage, seconds in timings.items():
+                STAGE_LATENCY.observe((self.endpoint, self.fmt, stage), seconds)
+        self._last = perf_counter()
+
+    def finish(self) -> None:
+        STAGE_LATENCY.observe((self.endpoint, self.fmt, "total"), perf_counter() - self._start)
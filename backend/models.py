@@ -49,6 +49,9 @@ class GenerateRequest(BaseModel):
     searchConditions: List[SearchCondition]
     googleLikeFields: Optional[GoogleLikeSearchFields] = None
     usptoSpecificSettings: Optional[UsptoSpecificSettings] = None
+    # Encoding of the `ast` field in the response: nested node dicts (default),
+    # or the versioned node-table format from ASTNode.to_compact.
+    astFormat: Literal["dict", "compact"] = "dict"
 
 class GenerateResponse(BaseModel):
     queryStringDisplay: str
@@ -58,6 +61,9 @@ class GenerateResponse(BaseModel):
 class ParseRequest(BaseModel):
     format: Literal["google", "uspto"]
     queryString: str
+    # The query parsed just before this one, e.g. before the last keystroke.
+    # Lets parsers that support it reparse only the edited part.
+    previousQueryString: Optional[str] = None
 
 class ParseResponse(BaseModel):
     searchConditions: List[SearchCondition]
@@ -72,4 +78,39 @@ class ConvertRequest(BaseModel):
 class ConvertResponse(BaseModel):
     converted_text: Optional[str] = None
     error: Optional[str] = None
-    settings: Dict[str, Any]
\ No newline at end of file
+    settings: Dict[str, Any]
+
+class BatchConvertRequest(BaseModel):
+    items: List[ConvertRequest]
+
+class BatchConvertResponse(BaseModel):
+    # One entry per request item, in input order. Failed items carry `error`.
+    results: List[ConvertResponse]
+
+class TemplateRenderRequest(BaseModel):
+    # A Google query with {name} placeholders, see query_templates.py.
+    template: str
+    # One placeholder name -> value mapping per query to render.
+    bindings: List[Dict[str, str]]
+
+class TemplateRenderResult(BaseModel):
+    query_string: Optional[str] = None
+    url: Optional[str] = None
+    error: Optional[str] = None
+
+class TemplateRenderResponse(BaseModel):
+    placeholders: List[str]
+    # One entry per binding, in input order. Failed bindings carry `error`.
+    results: List[TemplateRenderResult]
+
+class WildcardExpansionRequest(BaseModel):
+    format: Literal["google", "uspto"]
+    queryString: str
+    # Dialect of `expandedQuery`; defaults to `format`.
+    targetFormat: Optional[Literal["google", "uspto"]] = None
+
+class WildcardExpansionResponse(BaseModel):
+    # How many vocabulary terms each wildcard term matches (a lower bound if the scan was capped).
+    sizes: Dict[str, int]
+    # The query with each fully expanded wildcard term replaced by an OR of its terms.
+    expandedQuery: str
@@ -0,0 +1,116 @@
+# query_budget.py
+from typing import Any, Dict, List, NamedTuple, Optional
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode, FieldedSearchNode
+)
+
+# --- Query complexity budget ---
+# A request's query is checked against a budget before it is worth a worker's
+# time. The cost of a parsed query is
+#   nodes             AST nodes, the root included;
+#   depth             nodes on the longest root-to-leaf path;
+#   wildcards         terms with a wildcard (TermNode.has_wildcard), each of
+#                     which the search side expands over its whole vocabulary;
+#   proximity_fanout  the largest number of term combinations one proximity
+#                     operator has to check: the product over its operands of
+#                     their alternatives (a OR b OR c counts 3).
+# The budgeted parse (the parsers' `budget` argument) checks the query length
+# before lexing, and the Google parser checks the token count and the nesting
+# of parentheses and NOTs between lexing and the recursive parse, so a huge or
+# deeply nested string is turned away before it is parsed. The cost above is
+# checked once the AST is built. Nesting is held to max_depth, so redundant
+# parentheses count against it as well.
+
+
+class QueryBudget(NamedTuple):
+    max_length: int = 65536
+    max_tokens: int = 8192
+    max_nodes: int = 8192
+    max_depth: int = 128
+    max_wildcards: int = 256
+    max_proximity_fanout: int = 4096
+
+
+DEFAULT_QUERY_BUDGET = QueryBudget()
+
+# Limits on the size of the input, as opposed to the shape of the query.
+SIZE_LIMITS = frozenset({"length", "tokens"})
+
+
+class QueryCost(NamedTuple):
+    nodes: int
+    depth: int
+    wildcards: int
+    proximity_fanout: int
+
+
+class QueryBudgetExceeded(ValueError):
+    """
+    A query over its budget. `limit` names the QueryBudget field without the
+    "max_" prefix; `position` is the offset in the query string, when known.
+    """
+    def __init__(self, limit: str, value: int, maximum: int, position: Optional[int] = None):
+        where = f" at position {position}" if position is not None else ""
+        super().__init__(f"Query exceeds the {limit} limit ({value} > {maximum}){where}")
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        self.position = position
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"error": "query_budget_exceeded", "message": str(self), "limit": self.limit,
+                "value": self.value, "maximum": self.maximum, "position": self.position}
+
+
+def _alternatives(node: ASTNode) -> int:
+    """How many different terms `node` can stand for inside a proximity operator."""
+    if isinstance(node, BooleanOpNode) and node.operator == "OR":
+        return sum(_alternatives(operand) for operand in node.operands)
+    if isinstance(node, ProximityOpNode):
+        fanout = 1
+        for term in node.terms:
+            fanout *= _alternatives(term)
+        return fanout
+    if isinstance(node, FieldedSearchNode):
+        return _alternatives(node.query)
+    return 1
+
+
+def query_cost(root: ASTNode) -> QueryCost:
+    """The cost of the tree under `root`. Walks it level by level, so any depth can be measured."""
+    nodes = depth = wildcards = fanout = 0
+    level = [root]
+    while level:
+        nodes += len(level)
+        depth += 1
+        below: List[ASTNode] = []
+        for node in level:
+            kind = type(node)
+            if kind is TermNode:
+                wildcards += node.has_wildcard
+            elif kind is BooleanOpNode:
+                below += node.operands
+            elif kind is ProximityOpNode:
+                fanout = max(fanout, _alternatives(node))
+                below += node.terms
+            elif kind is FieldedSearchNode or kind is QueryRootNode:
+                below.append(node.query)
+        level = below
+    return QueryCost(nodes, depth, wildcards, fanout)
+
+
+def check_cost(cost: QueryCost, budget: QueryBudget = DEFAULT_QUERY_BUDGET) -> None:
+    """Raises QueryBudgetExceeded for the first limit `cost` is over."""
+    for limit, value, maximum in (
+        ("nodes", cost.nodes, budget.max_nodes),
+        ("depth", cost.depth, budget.max_depth),
+        ("wildcards", cost.wildcards, budget.max_wildcards),
+        ("proximity_fanout", cost.proximity_fanout, budget.max_proximity_fanout),
+    ):
+        if value > maximum:
+            raise QueryBudgetExceeded(limit, value, maximum)
+
+
+def check_length(query_string: str, budget: QueryBudget = DEFAULT_QUERY_BUDGET) -> None:
+    if len(query_string) > budget.max_length:
+        raise QueryBudgetExceeded("length", len(query_string), budget.max_length)
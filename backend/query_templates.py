@@ -0,0 +1,171 @@
+# query_templates.py
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import quote_plus
+import re
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode, ClassificationNode
+)
+from ast_optimizer import optimize
+from dialects import DIALECTS
+from query_budget import DEFAULT_QUERY_BUDGET, QueryBudget
+
+# --- Query templates ---
+# A template is a Google query with named placeholders in term, field and date
+# values, e.g.
+#   assignee:{assignee} (lidar OR radar) after:filing:{date_from}
+# It is parsed, optimized and generated once. Binding values then only
+# renders the parts that depend on them and splices them into the static
+# text, with the same result as substituting the values into the AST and
+# generating the whole query.
+#
+# A slot is the smallest subtree whose rendering depends on its values: the
+# term, date or classification holding the placeholder, or the Google field
+# around it, since the generator picks the field's bracketing by looking at
+# the rendered value. The static text is generated with a marker term in
+# each slot's place. Whether a slot needs parentheses depends only on where
+# it sits, so that is decided once as well.
+
+PLACEHOLDER_REGEX = re.compile(r"\{(\w+)\}")
+# Marks the slots in the compile-time rendering: "\x00<slot index>\x00".
+SLOT_MARKER = "\x00"
+SLOT_MARKER_REGEX = re.compile(r"\x00(\d+)\x00")
+GOOGLE_SEARCH_URL = "https://patents.google.com/?"
+
+
+class BoundQuery(NamedTuple):
+    query_string: str
+    url: str
+
+
+def _placeholders_in(value: Optional[str]) -> List[str]:
+    return PLACEHOLDER_REGEX.findall(value) if value else []
+
+
+def _substitute(value: Optional[str], values: Mapping[str, str]) -> Optional[str]:
+    if not value or "{" not in value:
+        return value
+    return PLACEHOLDER_REGEX.sub(lambda m: values[m.group(1)], value)
+
+
+def _node_placeholders(node: ASTNode) -> List[str]:
+    """Placeholder names used anywhere in `node`, in order of appearance."""
+    if isinstance(node, TermNode):
+        return _placeholders_in(node.value)
+    if isinstance(node, DateSearchNode):
+        return _placeholders_in(node.date_value) + _placeholders_in(node.date_value2)
+    if isinstance(node, ClassificationNode):
+        return _placeholders_in(node.value)
+    names: List[str] = []
+    for child in _children(node):
+        names.extend(_node_placeholders(child))
+    return names
+
+
+def _children(node: ASTNode) -> List[ASTNode]:
+    if isinstance(node, BooleanOpNode):
+        return node.operands
+    if isinstance(node, ProximityOpNode):
+        return node.terms
+    if isinstance(node, (FieldedSearchNode, QueryRootNode)):
+        return [node.query]
+    return []
+
+
+def _bind_node(node: ASTNode, values: Mapping[str, str]) -> ASTNode:
+    """A copy of `node` with the placeholders replaced by `values`."""
+    if isinstance(node, TermNode):
+        # has_wildcard is left to be derived from the bound value.
+        return TermNode(_substitute(node.value, values), is_phrase=node.is_phrase)  # type: ignore
+    if isinstance(node, DateSearchNode):
+        return DateSearchNode(node.field_canonical_name, node.operator, _substitute(node.date_value, values),  # type: ignore
+                              date_value2=_substitute(node.date_value2, values), system_field_code=node.system_field_code)
+    if isinstance(node, ClassificationNode):
+        return ClassificationNode(node.scheme, _substitute(node.value, values), include_children=node.include_children)  # type: ignore
+    if isinstance(node, BooleanOpNode):
+        return BooleanOpNode(node.operator, [_bind_node(op, values) for op in node.operands])  # type: ignore
+    if isinstance(node, ProximityOpNode):
+        return ProximityOpNode(node.operator, [_bind_node(t, values) for t in node.terms], distance=node.distance,  # type: ignore
+                               ordered=node.ordered, scope_unit=node.scope_unit)
+    if isinstance(node, FieldedSearchNode):
+        return FieldedSearchNode(node.field_canonical_name, _bind_node(node.query, values),
+                                 system_field_code=node.system_field_code)
+    return node
+
+
+class QueryTemplate:
+    def __init__(self, ast_root: QueryRootNode, generator: Optional[Any] = None):
+        """Prepares a template from a parsed AST. Use `compile` to start from a query string."""
+        # Imported here, like the dialect itself, so importing this module does not load the Google dialect.
+        from google_generator import GOOGLE_FIELD_MAP
+        self.generator = generator if generator is not None else DIALECTS.generators["google"]
+        self._google_fields = GOOGLE_FIELD_MAP
+        self.ast = ast_root
+        self.placeholders: Tuple[str, ...] = tuple(dict.fromkeys(_node_placeholders(ast_root)))
+        self._slots: List[ASTNode] = []
+        static = self.generator.generate(QueryRootNode(query=self._mark_slots(ast_root.query), settings=ast_root.settings))
+        # Alternating static text and slot indexes: [text, index, text, index, ..., text].
+        pieces = SLOT_MARKER_REGEX.split(static)
+        self._texts: List[str] = pieces[0::2]
+        self._slot_order: List[int] = [int(index) for index in pieces[1::2]]
+
+    @classmethod
+    def compile(cls, query_string: str, budget: QueryBudget = DEFAULT_QUERY_BUDGET) -> "QueryTemplate":
+        """
+        Parses and optimizes a Google query with {name} placeholders. Raises
+        ValueError if it does not parse, QueryBudgetExceeded if it is over `budget`.
+        """
+        if SLOT_MARKER in query_string:
+            raise ValueError("Query templates cannot contain NUL characters")
+        ast_root = DIALECTS.parsers["google"].parse(query_string, None, budget)
+        if isinstance(ast_root.query, TermNode) and ast_root.query.value.startswith("PARSE_ERROR"):
+            raise ValueError(ast_root.query.value)
+        return cls(optimize(ast_root))
+
+    def _mark_slots(self, node: ASTNode) -> ASTNode:
+        """Returns `node` with every slot replaced by a marker term, and records the slots."""
+        is_slot = (
+            isinstance(node, (TermNode, DateSearchNode, ClassificationNode))
+            or (isinstance(node, FieldedSearchNode) and node.field_canonical_name in self._google_fields)
+        )
+        if is_slot:
+            if not _node_placeholders(node):
+                return node
+            self._slots.append(node)
+            return TermNode(f"{SLOT_MARKER}{len(self._slots) - 1}{SLOT_MARKER}")
+        children = _children(node)
+        marked = [self._mark_slots(child) for child in children]
+        if all(new is old for new, old in zip(marked, children)):
+            return node
+        if isinstance(node, BooleanOpNode):
+            return BooleanOpNode(node.operator, marked)  # type: ignore
+        if isinstance(node, ProximityOpNode):
+            return ProximityOpNode(node.operator, marked, distance=node.distance,  # type: ignore
+                                   ordered=node.ordered, scope_unit=node.scope_unit)
+        # A field the generator does not map is rendered in place, like its query.
+        return FieldedSearchNode(node.field_canonical_name, marked[0], system_field_code=node.system_field_code)  # type: ignore
+
+    def bind(self, values: Mapping[str, Any]) -> BoundQuery:
+        """
+        Renders the query for `values` (placeholder name -> value). Values are
+        converted with str() and stripped. Raises ValueError if one is missing or empty.
+        """
+        missing = [name for name in self.placeholders if name not in values]
+        if missing:
+            raise ValueError(f"Missing values for placeholders: {', '.join(missing)}")
+        bound: Dict[str, str] = {}
+        for name in self.placeholders:
+            value = str(values[name]).strip()
+            if not value:
+                raise ValueError(f"Empty value for placeholder: {name}")
+            bound[name] = value
+
+        texts = self._texts
+        parts = [texts[0]]
+        for position, slot_index in enumerate(self._slot_order):
+            slot = _bind_node(self._slots[slot_index], bound)
+            parts.append(self.generator.generate(QueryRootNode(query=slot)))
+            parts.append(texts[position + 1])
+        query_string = "".join(parts).strip()
+        url = f"{GOOGLE_SEARCH_URL}q={quote_plus(query_string)}" if query_string else "#"
+        return BoundQuery(query_string, url)
@@ -1,29 +1,204 @@
 # /backend/services.py
 from typing import List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException
-import uuid
+from concurrent.futures import ProcessPoolExecutor
+import json
+from hashlib import blake2b
+import os
+import random
+import threading
+from time import perf_counter
 import re
 from urllib.parse import quote_plus, quote
+from pydantic_core import to_json
 import models
+from lru_cache import LRUCache
+from shared_cache import shared_cache_from_env
+from classification_index import default_index
+from metrics import StageTimer, merge_worker_stats, register_worker_stats, take_worker_stats
+from ast_optimizer import optimize
+from ast_canonical import canonical_key
+from ast_diff import Patch, diff_ast
+from query_templates import QueryTemplate
+from query_budget import DEFAULT_QUERY_BUDGET, SIZE_LIMITS, QueryBudgetExceeded, check_length
+from wildcard_expansion import VOCABULARY_ENV_VAR, default_expander, expand_wildcards, expansion_sizes
 from ast_nodes import (
     ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
     FieldedSearchNode, DateSearchNode, ClassificationNode
 )
-from google_parser import GoogleQueryParser
-from google_generator import ASTToGoogleQueryGenerator
-from uspto_parser import USPTOQueryParser
-from uspto_generator import ASTToUSPTOQueryGenerator
-
-# Instantiate parsers and generators once to be reused
-PARSERS = {
-    "google": GoogleQueryParser(),
-    "uspto": USPTOQueryParser()
-}
-GENERATORS = {
-    "google": ASTToGoogleQueryGenerator(),
-    "uspto": ASTToUSPTOQueryGenerator()
+from dialects import DIALECTS
+
+# Parsers and generators by dialect name. Each is imported and built on first use.
+PARSERS = DIALECTS.parsers
+GENERATORS = DIALECTS.generators
+
+# --- Memoization of parse and generate results ---
+# Parses are keyed on (format, normalized query string); generation on
+# (target format, AST), using the AST's cached structural hash, so every
+# spelling of the same tree shares one entry. Cached ASTs are shared between
+# requests, so nothing downstream may mutate them.
+PARSE_CACHE = LRUCache(maxsize=4096)
+GENERATE_CACHE = LRUCache(maxsize=4096)
+# Incremental parse states by (format, normalized query), for parsers with
+# `parse_with_state`/`reparse_query`. Only filled for requests that name the
+# query they follow, i.e. the query builder's parse-as-you-type calls.
+PARSE_STATE_CACHE = LRUCache(maxsize=256)
+# A second level shared by the worker processes and kept across restarts,
+# when PATENTPEEK_SHARED_CACHE names its file (see shared_cache.py). It holds
+# parsed ASTs in the compact format and whole conversion results, and is only
+# consulted on a miss in the caches above.
+SHARED_CACHE = shared_cache_from_env()
+# Part of every shared cache key. Entries outlive the process, so bump this
+# whenever a parser's or generator's output changes. Output that depends on
+# the classification index is told apart by the index's fingerprint, which
+# is part of the keys as well.
+SHARED_CACHE_VERSION = 2
+# Conversion results by (source format, target format, normalized query),
+# in front of SHARED_CACHE; PARSE_CACHE and GENERATE_CACHE sit behind it.
+CONVERT_CACHE = LRUCache(maxsize=4096)
+# Every parse runs under this budget; a query over it raises
+# QueryBudgetExceeded before it is fully parsed (see query_budget.py).
+QUERY_BUDGET = DEFAULT_QUERY_BUDGET
+
+def _normalize_query(query_string: str) -> str:
+    return " ".join(query_string.split())
+
+def _parse_incremental(parser: Any, fmt: str, normalized: str, previous: str,
+                       timings: Optional[Dict[str, float]]) -> QueryRootNode:
+    """Parses `normalized` as an edit of the normalized query `previous`, if that one's state is still cached."""
+    state = PARSE_STATE_CACHE.get((fmt, previous))
+    if state is None:
+        ast_root, new_state = parser.parse_with_state(normalized, timings, QUERY_BUDGET)
+    else:
+        ast_root, new_state = parser.reparse_query(state, normalized, timings, QUERY_BUDGET)
+    if new_state is not None:
+        PARSE_STATE_CACHE.put((fmt, normalized), new_state)
+    return ast_root
+
+def _parse(fmt: str, normalized: str, timings: Optional[Dict[str, float]] = None,
+           previous: Optional[str] = None) -> QueryRootNode:
+    """
+    Parses a normalized query. `timings` receives the tokenize/parse
+    durations. `previous` is the normalized query parsed before this one, if known.
+    """
+    parser = PARSERS[fmt]
+    if previous is not None and hasattr(parser, "reparse_query"):
+        return _parse_incremental(parser, fmt, normalized, previous, timings)
+    return parser.parse(normalized, timings, QUERY_BUDGET)
+
+def _optimize(ast_root: QueryRootNode, timings: Optional[Dict[str, float]]) -> QueryRootNode:
+    """
+    Optimizes an AST on its way to a generator. Only outbound queries are
+    optimized: the parse-query text goes back into the user's form, so it
+    keeps the query's own structure.
+    """
+    started = perf_counter()
+    ast_root = optimize(ast_root)
+    if timings is not None:
+        timings["optimize"] = perf_counter() - started
+    return ast_root
+
+_shared_key_prefix: Optional[str] = None
+
+def _shared_key(kind: str, *parts: str) -> str:
+    global _shared_key_prefix
+    if _shared_key_prefix is None:
+        # The generators consult the default classification index (see may_have_children).
+        index = default_index()
+        _shared_key_prefix = f"{SHARED_CACHE_VERSION}\x00{index.fingerprint if index is not None else '-'}"
+    return "\x00".join((_shared_key_prefix, kind, *parts))
+
+def _parse_cached(fmt: str, query_string: str, timings: Optional[Dict[str, float]] = None,
+                  previous_query: Optional[str] = None, shared: bool = False) -> QueryRootNode:
+    """
+    Parses through PARSE_CACHE, which holds the parsers' ASTs, and with `shared`
+    through SHARED_CACHE behind it. `timings` is only filled on a cache miss.
+    Raises QueryBudgetExceeded for a query over QUERY_BUDGET.
+    """
+    # Checked before normalizing, so an oversized string is not even copied.
+    check_length(query_string, QUERY_BUDGET)
+    normalized = _normalize_query(query_string)
+    key = (fmt, normalized)
+    ast_root = PARSE_CACHE.get(key)
+    if ast_root is not None:
+        return ast_root
+    # Encoding an AST costs a good part of parsing it, so only callers without a
+    # shared cache of their own results use this level.
+    shared_key = _shared_key("parse", fmt, normalized) if shared and SHARED_CACHE is not None else None
+    if shared_key is not None:
+        compact = SHARED_CACHE.get(shared_key)
+        if compact is not None:
+            try:
+                ast_root = QueryRootNode.from_compact(json.loads(compact))
+            except ValueError:
+                pass  # A corrupt entry is a miss; the parse below replaces it.
+    if ast_root is None:
+        previous = _normalize_query(previous_query) if previous_query is not None else None
+        ast_root = _parse(fmt, normalized, timings, previous)
+        if shared_key is not None:
+            SHARED_CACHE.put(shared_key, json.dumps(ast_root.to_compact(), separators=(",", ":")))
+    PARSE_CACHE.put(key, ast_root)
+    return ast_root
+
+def _generate_cached(target_format: str, ast_root: QueryRootNode) -> str:
+    key = (target_format, ast_root)
+    generated = GENERATE_CACHE.get(key)
+    if generated is None:
+        generated = GENERATORS[target_format].generate(ast_root)
+        GENERATE_CACHE.put(key, generated)
+    return generated
+
+# Whole /api/generate-query responses, keyed on generate_request_key(). The
+# frontend re-posts the same form state on every render, so most requests are
+# repeats. Entries expire so that a long-lived process does not serve stale
+# responses indefinitely.
+GENERATE_RESPONSE_CACHE = LRUCache(maxsize=2048, ttl=600)
+# Part of every request key. Bump whenever generate_query's output for a given
+# request changes, so clients holding an old ETag get the new response.
+GENERATE_RESPONSE_VERSION = 1
+
+# Fields of GenerateRequest that do not affect the response: ids are random
+# per form row and only matter to the frontend.
+_GENERATE_KEY_EXCLUDE = {
+    "searchConditions": {"__all__": {"id"}},
+    "googleLikeFields": {"inventors": {"__all__": {"id"}}, "assignees": {"__all__": {"id"}}},
 }
 
+def generate_request_key(req: models.GenerateRequest) -> str:
+    """
+    A content hash of a GenerateRequest. Requests that differ only in row ids or
+    in whitespace inside the search boxes produce the same response, so they
+    get the same key.
+    """
+    data = req.model_dump(exclude=_GENERATE_KEY_EXCLUDE)
+    for condition in data["searchConditions"]:
+        condition["data"]["text"] = _normalize_query(condition["data"]["text"])
+    payload = json.dumps([GENERATE_RESPONSE_VERSION, data], sort_keys=True, separators=(",", ":"))
+    return blake2b(payload.encode(), digest_size=16).hexdigest()
+
+def _caches() -> Dict[str, Any]:
+    return {
+        "parse": PARSE_CACHE, "parse_state": PARSE_STATE_CACHE, "generate": GENERATE_CACHE,
+        "generate_response": GENERATE_RESPONSE_CACHE,
+        "template": TEMPLATE_CACHE, "convert": CONVERT_CACHE, "wildcard_sizes": WILDCARD_SIZES_CACHE,
+        **({"shared": SHARED_CACHE} if SHARED_CACHE is not None else {}),
+    }
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Counters include the lookups made in worker processes; sizes are this process's."""
+    return {name: cache.stats() for name, cache in _caches().items()}
+
+def _take_cache_counters() -> Dict[str, Dict[str, int]]:
+    return {name: cache.take_counters() for name, cache in _caches().items()}
+
+def _merge_cache_counters(counters: Dict[str, Dict[str, int]]) -> None:
+    caches = _caches()
+    for name, values in counters.items():
+        if name in caches:
+            caches[name].add_counters(values)
+
+register_worker_stats("caches", _take_cache_counters, _merge_cache_counters)
+
 
 # --- A simple data class to hold different parameter types ---
 class UrlParam:
@@ -140,13 +315,95 @@ def _create_field_nodes_from_params(top_level_params: List[UrlParam]) -> List[AS
     return nodes
 
 
+def _serialize_ast(ast_root: QueryRootNode, ast_format: str) -> Dict[str, Any]:
+    return ast_root.to_compact() if ast_format == "compact" else ast_root.to_dict()
+
+
+# --- JSON response bodies ---
+# The parse-query and generate-query endpoints return their bodies as JSON
+# bytes. A model returned to FastAPI is validated against the route's
+# response_model and encoded field by field, which costs more than building
+# the response. The bytes are the same as FastAPI's encoding of the models,
+# and the fixed parts are encoded once, here. The model-returning functions
+# decode these bodies, for callers that want objects.
+
+def _dump_json(data: Any) -> bytes:
+    # Compact UTF-8 like FastAPI's, from pydantic's serializer: about 3x faster
+    # than json.dumps on an AST dict.
+    return to_json(data)
+
+DEFAULT_USPTO_SETTINGS_JSON = _dump_json({
+    "defaultOperator": "AND", "plurals": False, "britishEquivalents": True,
+    "selectedDatabases": ["US-PGPUB", "USPAT", "USOCR"], "highlights": "SINGLE_COLOR", "showErrors": True,
+})
+EMPTY_GOOGLE_FIELDS_JSON = _dump_json({
+    "dateFrom": "", "dateTo": "", "dateType": "publication", "inventors": [], "assignees": [],
+    "patentOffices": [], "languages": [], "status": "", "patentType": "", "litigation": "",
+})
+
+def _new_row_id() -> str:
+    """
+    A random id in the UUID layout for a form row. Ids only need to be unique
+    within one client's form, so this skips uuid4()'s system entropy and UUID object.
+    """
+    digits = f"{random.getrandbits(128):032x}"
+    # Version 4 in the third group, and the RFC 4122 variant (8-b) leading the fourth.
+    variant = "89ab"[int(digits[16], 16) & 3]
+    return f"{digits[:8]}-{digits[8:12]}-4{digits[13:16]}-{variant}{digits[17:20]}-{digits[20:]}"
+
+def _parse_response_json(text: str, google_fields_json: bytes) -> bytes:
+    condition = _dump_json({"id": _new_row_id(), "type": "TEXT", "data": {"type": "TEXT", "text": text}})
+    return b"".join((b'{"searchConditions":[', condition, b'],"googleLikeFields":', google_fields_json,
+                     b',"usptoSpecificSettings":', DEFAULT_USPTO_SETTINGS_JSON, b"}"))
+
+
 def generate_query(req: models.GenerateRequest) -> models.GenerateResponse:
+    return models.GenerateResponse.model_validate_json(generate_query_json(req))
+
+def generate_query_json(req: models.GenerateRequest) -> bytes:
+    """The /api/generate-query response body for `req`."""
+    timer = StageTimer("generate_query", req.format)
+    try:
+        return _generate_query(req, timer)
+    finally:
+        timer.finish()
+
+def generate_query_diff(req: models.GenerateRequest,
+                        previous_ast: Optional[QueryRootNode]) -> Tuple[str, str, Optional[QueryRootNode], Patch]:
+    """
+    Generates like generate_query, but returns the AST itself and a JSON Patch
+    from `previous_ast` to it (see ast_diff) instead of the serialized AST.
+    """
+    timer = StageTimer("live_query", req.format)
+    try:
+        display, url, ast_root = _generate_parts(req, timer)
+        patch = diff_ast(previous_ast, ast_root)
+        timer.lap("diff")
+        return display, url, ast_root, patch
+    finally:
+        timer.finish()
+
+def _generate_query(req: models.GenerateRequest, timer: StageTimer) -> bytes:
+    display, url, ast_root = _generate_parts(req, timer)
+    if ast_root is None:
+        return _dump_json({"queryStringDisplay": display, "url": url, "ast": None})
+    ast_data = _serialize_ast(ast_root, req.astFormat)
+    timer.lap(f"to_{req.astFormat}")
+    response = _dump_json({"queryStringDisplay": display, "url": url, "ast": ast_data})
+    timer.lap("response")
+    return response
+
+def _generate_parts(req: models.GenerateRequest, timer: StageTimer) -> Tuple[str, str, Optional[QueryRootNode]]:
+    """Returns the display query string, the search URL and the combined AST (None if the form is empty)."""
     if req.format == "google":
         generator = GENERATORS["google"]
         text_ast_nodes, top_level_params = _build_query_components(req)
+        timer.lap("build")
+        text_ast_nodes = [optimize(QueryRootNode(query=node)).query for node in text_ast_nodes]
+        timer.lap("optimize")
 
         if not text_ast_nodes and not top_level_params:
-            return models.GenerateResponse(queryStringDisplay="", url="#", ast=None)
+            return "", "#", None
 
         url_params_list = []
         display_parts = []
@@ -157,6 +414,7 @@ def generate_query(req: models.GenerateRequest) -> models.GenerateResponse:
                 url_params_list.append(UrlParam('q', generated_str).to_string())
                 # Always wrap expressions from the search term boxes in parentheses for clarity
                 display_parts.append(f"({generated_str})")
+        timer.lap("generate")
 
         for param in top_level_params:
             url_params_list.append(param.to_string())
@@ -175,23 +433,25 @@ def generate_query(req: models.GenerateRequest) -> models.GenerateResponse:
         final_ast = None
         if all_nodes:
             combined_query_node = BooleanOpNode("AND", all_nodes) if len(all_nodes) > 1 else all_nodes[0]
-            final_ast = QueryRootNode(query=combined_query_node).to_dict()
-
-        return models.GenerateResponse(queryStringDisplay=final_display_string, url=url, ast=final_ast)
+            final_ast = QueryRootNode(query=combined_query_node)
+        return final_display_string, url, final_ast
 
     elif req.format == "uspto":
         generator = GENERATORS["uspto"]
         ast_nodes, _ = _build_query_components(req)
-        
+        timer.lap("build")
+
         if not ast_nodes:
-             return models.GenerateResponse(queryStringDisplay="", url="#", ast=None)
+             return "", "#", None
 
         combined_query_node = BooleanOpNode("AND", ast_nodes) if len(ast_nodes) > 1 else ast_nodes[0]
-        query_root = QueryRootNode(query=combined_query_node)
+        query_root = optimize(QueryRootNode(query=combined_query_node))
+        timer.lap("optimize")
         combined_query = generator.generate(query_root)
         url_query_param = quote_plus(combined_query)
         url = f"https://ppubs.uspto.gov/pubwebapp/static/pages/ppubsadvanced.html?query={url_query_param}" if url_query_param else "#"
-        return models.GenerateResponse(queryStringDisplay=combined_query, url=url, ast=query_root.to_dict())
+        timer.lap("generate")
+        return combined_query, url, query_root
     else:
         raise HTTPException(status_code=400, detail=f"Invalid format for generation: {req.format}")
 
@@ -230,9 +490,11 @@ def _extract_field_data(node: ASTNode) -> Tuple[List[ASTNode], Optional[ASTNode]
                 return None
             if len(new_operands_filtered) == 1:
                 return new_operands_filtered[0]
+            if len(new_operands_filtered) == len(current_node.operands):
+                return current_node
             
-            current_node.operands = new_operands_filtered
-            return current_node
+            # Build a new node rather than mutating: the input AST may be shared via PARSE_CACHE.
+            return BooleanOpNode(current_node.operator, new_operands_filtered)
         
         return current_node
 
@@ -241,69 +503,259 @@ def _extract_field_data(node: ASTNode) -> Tuple[List[ASTNode], Optional[ASTNode]
 
 
 def parse_query(req: models.ParseRequest) -> models.ParseResponse:
+    return models.ParseResponse.model_validate_json(parse_query_json(req))
+
+def parse_query_json(req: models.ParseRequest) -> bytes:
+    """The /api/parse-query response body for `req`."""
+    timer = StageTimer("parse_query", req.format)
+    try:
+        return _parse_query(req, timer)
+    finally:
+        timer.finish()
+
+def _parse_query(req: models.ParseRequest, timer: StageTimer) -> bytes:
     if req.format not in PARSERS:
         raise HTTPException(status_code=400, detail=f"No parser available for format: {req.format}")
 
-    parser = PARSERS[req.format]
-    generator = GENERATORS[req.format]
-    
-    ast_root = parser.parse(req.queryString)
+    timings: Dict[str, float] = {}
+    try:
+        ast_root = _parse_cached(req.format, req.queryString, timings, req.previousQueryString, shared=True)
+    except QueryBudgetExceeded as e:
+        raise HTTPException(status_code=413 if e.limit in SIZE_LIMITS else 422, detail=e.to_dict())
+    timer.record(timings)
     if isinstance(ast_root.query, TermNode) and ast_root.query.value.startswith("PARSE_ERROR"):
-        return models.ParseResponse(
-            searchConditions=[models.SearchCondition(
-                id=str(uuid.uuid4()), type="TEXT", data={"type": "TEXT", "text": req.queryString, "error": ast_root.query.value}
-            )],
-            googleLikeSearchFields=models.GoogleLikeSearchFields(dateFrom="", dateTo="", dateType="publication", inventors=[], assignees=[], patentOffices=[], languages=[], status="", patentType="", litigation=""),
-            usptoSpecificSettings=models.UsptoSpecificSettings(defaultOperator="AND", plurals=False, britishEquivalents=True, selectedDatabases=['US-PGPUB', 'USPAT', 'USOCR'], highlights='SINGLE_COLOR', showErrors=True)
-        )
+        # The condition holds the query as typed. (TextSearchData has no error field, so the
+        # message never reached the client; the frontend flags the row itself.)
+        response = _parse_response_json(req.queryString, EMPTY_GOOGLE_FIELDS_JSON)
+        timer.lap("response")
+        return response
 
     field_nodes, text_query_ast = _extract_field_data(ast_root.query)
-
-    glf = models.GoogleLikeSearchFields(dateFrom="", dateTo="", dateType="publication", inventors=[], assignees=[], patentOffices=[], languages=[], status="", patentType="", litigation="")
-    for node in field_nodes:
-        if isinstance(node, FieldedSearchNode) and isinstance(node.query, TermNode):
-            val = node.query.value
-            if node.field_canonical_name == "inventor_name": glf.inventors.extend([models.DynamicEntry(id=str(uuid.uuid4()), value=v.strip()) for v in val.split(',') if v.strip()])
-            elif node.field_canonical_name == "assignee_name": glf.assignees.extend([models.DynamicEntry(id=str(uuid.uuid4()), value=v.strip()) for v in val.split(',') if v.strip()])
-            elif node.field_canonical_name == "country_code": glf.patentOffices.extend([v.strip() for v in val.split(',') if v.strip()])
-            elif node.field_canonical_name == "language": glf.languages.extend([v.strip().upper() for v in val.split(',') if v.strip()])
-            elif node.field_canonical_name == "status": glf.status = val.upper()
-            elif node.field_canonical_name == "patent_type": glf.patentType = val.upper()
-        elif isinstance(node, DateSearchNode):
-            date_obj = node.date_value
-            date_str = f"{date_obj[:4]}-{date_obj[4:6]}-{date_obj[6:]}" if len(date_obj) > 4 else date_obj
-
-            if node.operator in [">=", ">"]:
-                glf.dateFrom = date_str
-                if node.field_canonical_name == "publication_date": glf.dateType = "publication"
-                elif node.field_canonical_name == "application_date": glf.dateType = "filing"
-                elif node.field_canonical_name == "priority_date": glf.dateType = "priority"
-            elif node.operator in ["<=", "<"]:
-                glf.dateTo = date_str
-        elif isinstance(node, TermNode) and node.value.lower() == "is:litigated": glf.litigation = "YES"
+    timer.lap("extract_fields")
+
+    glf_json = EMPTY_GOOGLE_FIELDS_JSON
+    if field_nodes:
+        glf: Dict[str, Any] = {"dateFrom": "", "dateTo": "", "dateType": "publication", "inventors": [], "assignees": [],
+                               "patentOffices": [], "languages": [], "status": "", "patentType": "", "litigation": ""}
+        for node in field_nodes:
+            if isinstance(node, FieldedSearchNode) and isinstance(node.query, TermNode):
+                val = node.query.value
+                if node.field_canonical_name == "inventor_name": glf["inventors"].extend([{"id": _new_row_id(), "value": v.strip()} for v in val.split(',') if v.strip()])
+                elif node.field_canonical_name == "assignee_name": glf["assignees"].extend([{"id": _new_row_id(), "value": v.strip()} for v in val.split(',') if v.strip()])
+                elif node.field_canonical_name == "country_code": glf["patentOffices"].extend([v.strip() for v in val.split(',') if v.strip()])
+                elif node.field_canonical_name == "language": glf["languages"].extend([v.strip().upper() for v in val.split(',') if v.strip()])
+                elif node.field_canonical_name == "status": glf["status"] = val.upper()
+                elif node.field_canonical_name == "patent_type": glf["patentType"] = val.upper()
+            elif isinstance(node, DateSearchNode):
+                date_obj = node.date_value
+                date_str = f"{date_obj[:4]}-{date_obj[4:6]}-{date_obj[6:]}" if len(date_obj) > 4 else date_obj
+
+                if node.operator in [">=", ">"]:
+                    glf["dateFrom"] = date_str
+                    if node.field_canonical_name == "publication_date": glf["dateType"] = "publication"
+                    elif node.field_canonical_name == "application_date": glf["dateType"] = "filing"
+                    elif node.field_canonical_name == "priority_date": glf["dateType"] = "priority"
+                elif node.operator in ["<=", "<"]:
+                    glf["dateTo"] = date_str
+            elif isinstance(node, TermNode) and node.value.lower() == "is:litigated": glf["litigation"] = "YES"
+        glf_json = _dump_json(glf)
 
     text_search_string = ""
     if text_query_ast:
-        text_search_string = generator.generate(QueryRootNode(query=text_query_ast))
-        
-    return models.ParseResponse(
-        searchConditions=[models.SearchCondition(
-            id=str(uuid.uuid4()), type="TEXT", data={"type": "TEXT", "text": text_search_string}
-        )],
-        googleLikeFields=glf,
-        usptoSpecificSettings=models.UsptoSpecificSettings(defaultOperator="AND", plurals=False, britishEquivalents=True, selectedDatabases=['US-PGPUB', 'USPAT', 'USOCR'], highlights='SINGLE_COLOR', showErrors=True)
-    )
+        text_search_string = _generate_cached(req.format, QueryRootNode(query=text_query_ast))
+    timer.lap("generate")
 
-def convert_query_service(req: models.ConvertRequest) -> models.ConvertResponse:
-    try:
-        source_parser = PARSERS[req.source_format]
-        target_generator = GENERATORS[req.target_format]
-        ast = source_parser.parse(req.query_string)
-        
-        if isinstance(ast.query, TermNode) and ast.query.value.startswith("PARSE_ERROR"):
-            return models.ConvertResponse(converted_text=None, error=f"Could not parse source query: {ast.query.value}", settings={})
+    response = _parse_response_json(text_search_string, glf_json)
+    timer.lap("response")
+    return response
 
-        converted_text = target_generator.generate(ast)
-        return models.ConvertResponse(converted_text=converted_text, error=None, settings={})
+def _convert_one(query_string: str, source_format: str, target_format: str,
+                 use_cache: bool = True, timer: Optional[StageTimer] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Converts a single query string. Returns (converted_text, error)."""
+    try:
+        if not use_cache:
+            return _convert(query_string, source_format, target_format, False, timer)
+        # Checked before the key is normalized, so an oversized string is not even copied.
+        check_length(query_string, QUERY_BUDGET)
+        key = (source_format, target_format, _normalize_query(query_string))
+        result = CONVERT_CACHE.get(key)
+        if result is not None:
+            return result
+        shared_key = _shared_key("convert", *key) if SHARED_CACHE is not None else None
+        if shared_key is not None:
+            stored = SHARED_CACHE.get(shared_key)
+            if stored is not None:
+                result = tuple(json.loads(stored))
+        if result is None:
+            result = _convert(query_string, source_format, target_format, True, timer)
+            if shared_key is not None:
+                SHARED_CACHE.put(shared_key, json.dumps(result))
+        CONVERT_CACHE.put(key, result)
+        return result
     except Exception as e:
-        return models.ConvertResponse(converted_text=None, error=str(e), settings={})
\ No newline at end of file
+        # Not cached: an exception is not a property of the query alone.
+        return None, str(e)
+
+def _convert(query_string: str, source_format: str, target_format: str,
+             use_cache: bool, timer: Optional[StageTimer]) -> Tuple[Optional[str], Optional[str]]:
+    """Parses and generates, through PARSE_CACHE and GENERATE_CACHE if `use_cache`. Raises on unexpected errors."""
+    timings: Optional[Dict[str, float]] = {} if timer else None
+    if use_cache:
+        ast = _parse_cached(source_format, query_string, timings)
+    else:
+        ast = _parse(source_format, _normalize_query(query_string), timings)
+
+    if isinstance(ast.query, TermNode) and ast.query.value.startswith("PARSE_ERROR"):
+        if timer:
+            timer.record(timings)
+        return None, f"Could not parse source query: {ast.query.value}"
+    ast = _optimize(ast, timings)
+    if timer:
+        timer.record(timings)
+
+    if not use_cache:
+        converted_text = GENERATORS[target_format].generate(ast)
+    else:
+        converted_text = _generate_cached(target_format, ast)
+    if timer:
+        timer.lap("generate")
+    return converted_text, None
+
+def convert_query_service(req: models.ConvertRequest) -> models.ConvertResponse:
+    timer = StageTimer("convert_query", f"{req.source_format}->{req.target_format}")
+    converted_text, error = _convert_one(req.query_string, req.source_format, req.target_format, timer=timer)
+    response = models.ConvertResponse(converted_text=converted_text, error=error, settings={})
+    timer.lap("response")
+    timer.finish()
+    return response
+
+def convert_query_ndjson_line(index: int, query_string: str, source_format: str, target_format: str) -> bytes:
+    """
+    Converts one query and encodes the result as a single NDJSON line. Bulk
+    exports mostly see each query once, so they bypass the shared caches
+    rather than evicting the interactive working set.
+    """
+    converted_text, error = _convert_one(query_string, source_format, target_format, use_cache=False)
+    return _ndjson_line(index, converted_text, error)
+
+def convert_query_ndjson_lines(lines: List[Tuple[int, str]], source_format: str, target_format: str) -> bytes:
+    """Converts a group of (index, query string) pairs from one stream into consecutive NDJSON lines."""
+    return b"".join(convert_query_ndjson_line(index, query_string, source_format, target_format)
+                    for index, query_string in lines)
+
+def oversized_ndjson_line(index: int, length: int) -> bytes:
+    """The NDJSON error line for an input line of `length` characters, over the length budget."""
+    return ndjson_error_line(index, str(QueryBudgetExceeded("length", length, QUERY_BUDGET.max_length)))
+
+def ndjson_error_line(index: int, error: str) -> bytes:
+    return _ndjson_line(index, None, error)
+
+def _ndjson_line(index: int, converted_text: Optional[str], error: Optional[str]) -> bytes:
+    return json.dumps({"index": index, "converted_text": converted_text, "error": error}).encode() + b"\n"
+
+
+# --- Batch conversion ---
+# Items are shipped to worker processes as plain tuples in chunks, so the
+# per-item cost is the parse/generate work itself rather than pickling and
+# executor bookkeeping. Small batches are converted inline.
+BATCH_MAX_ITEMS = 10000
+BATCH_CHUNK_SIZE = 250
+BATCH_MAX_WORKERS = os.cpu_count() or 1
+
+_batch_executor: Optional[ProcessPoolExecutor] = None
+_batch_executor_lock = threading.Lock()
+
+def _convert_chunk(items: List[Tuple[str, str, str]]) -> List[Tuple[Optional[str], Optional[str]]]:
+    return [_convert_one(*item) for item in items]
+
+def _convert_chunk_in_worker(items: List[Tuple[str, str, str]]) -> Tuple[List[Tuple[Optional[str], Optional[str]]], Dict[str, Any]]:
+    """_convert_chunk in a pool process, with that process's cache counts for the chunk (see metrics)."""
+    take_worker_stats()
+    results = _convert_chunk(items)
+    return results, take_worker_stats()
+
+def _get_batch_executor() -> ProcessPoolExecutor:
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ProcessPoolExecutor(max_workers=BATCH_MAX_WORKERS)
+        return _batch_executor
+
+def convert_query_batch_service(req: models.BatchConvertRequest) -> models.BatchConvertResponse:
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(req.items)} items (max {BATCH_MAX_ITEMS})")
+
+    items = [(item.query_string, item.source_format, item.target_format) for item in req.items]
+    chunks = [items[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(items), BATCH_CHUNK_SIZE)]
+
+    if len(chunks) <= 1 or BATCH_MAX_WORKERS <= 1:
+        chunk_results = [_convert_chunk(chunk) for chunk in chunks]
+    else:
+        # Executor.map yields in submission order, which keeps results aligned with the input.
+        chunk_results = []
+        for chunk_result, stats in _get_batch_executor().map(_convert_chunk_in_worker, chunks):
+            merge_worker_stats(stats)
+            chunk_results.append(chunk_result)
+
+    results = [
+        models.ConvertResponse(converted_text=converted_text, error=error, settings={})
+        for chunk in chunk_results
+        for converted_text, error in chunk
+    ]
+    return models.BatchConvertResponse(results=results)
+
+
+# --- Query templates ---
+# Compiled templates by template string, so a job that renders the same
+# template in many requests compiles it once per worker.
+TEMPLATE_CACHE = LRUCache(maxsize=256)
+
+def render_template_service(req: models.TemplateRenderRequest) -> models.TemplateRenderResponse:
+    if len(req.bindings) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many bindings: {len(req.bindings)} (max {BATCH_MAX_ITEMS})")
+    template = TEMPLATE_CACHE.get(req.template)
+    if template is None:
+        try:
+            template = QueryTemplate.compile(req.template, QUERY_BUDGET)
+        except QueryBudgetExceeded as e:
+            raise HTTPException(status_code=413 if e.limit in SIZE_LIMITS else 422, detail=e.to_dict())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
+        TEMPLATE_CACHE.put(req.template, template)
+
+    results = []
+    for values in req.bindings:
+        try:
+            bound = template.bind(values)
+            results.append(models.TemplateRenderResult(query_string=bound.query_string, url=bound.url))
+        except ValueError as e:
+            results.append(models.TemplateRenderResult(error=str(e)))
+    return models.TemplateRenderResponse(placeholders=list(template.placeholders), results=results)
+
+
+# --- Wildcard expansion ---
+# Runs against the vocabulary named by PATENTPEEK_VOCABULARY (see
+# wildcard_expansion.py); without one the endpoint answers 503. Sizes are
+# cached by the query's canonical key, so every operand order and spelling of
+# a query, in either dialect, is measured once per expander.
+WILDCARD_SIZES_CACHE = LRUCache(maxsize=1024)
+
+def wildcard_expansion_service(req: models.WildcardExpansionRequest) -> models.WildcardExpansionResponse:
+    expander = default_expander()
+    if expander is None:
+        raise HTTPException(status_code=503, detail=f"Wildcard expansion is not configured: {VOCABULARY_ENV_VAR} is not set")
+    try:
+        ast_root = _parse_cached(req.format, req.queryString, shared=True)
+    except QueryBudgetExceeded as e:
+        raise HTTPException(status_code=413 if e.limit in SIZE_LIMITS else 422, detail=e.to_dict())
+    if isinstance(ast_root.query, TermNode) and ast_root.query.value.startswith("PARSE_ERROR"):
+        raise HTTPException(status_code=400, detail=f"Could not parse query: {ast_root.query.value}")
+
+    key = (expander, canonical_key(ast_root.query))
+    sizes = WILDCARD_SIZES_CACHE.get(key)
+    if sizes is None:
+        sizes = expansion_sizes(ast_root.query, expander)
+        WILDCARD_SIZES_CACHE.put(key, sizes)
+    expanded = expand_wildcards(_optimize(ast_root, None), expander)
+    expanded_query = _generate_cached(req.targetFormat or req.format, expanded)
+    return models.WildcardExpansionResponse(sizes=sizes, expandedQuery=expanded_query)
@@ -0,0 +1,166 @@
+# shared_cache.py
+from typing import Any, Dict, Optional
+import os
+import sqlite3
+import threading
+import time
+
+# --- Shared persistent cache ---
+# A second cache level behind the per-process LRU caches, kept in one SQLite
+# file that every worker process on a host opens. Entries written by one
+# worker are hits for the others, and they survive restarts, so the workers
+# of a fresh deploy start warm instead of each re-parsing the working set.
+#
+# Keys and values are strings. The database runs in WAL mode, so readers do
+# not block each other or the writer. The cache is best effort: a lock held
+# longer than BUSY_TIMEOUT_MS or any other SQLite error counts as a miss (or
+# a dropped write) rather than failing the request.
+#
+# Eviction is approximately least recently used: a hit refreshes the entry's
+# timestamp at most every TOUCH_INTERVAL seconds, so most reads stay reads,
+# and every EVICT_EVERY writes a worker trims the table to `max_entries`,
+# oldest first.
+#
+# Configured from the environment:
+#   PATENTPEEK_SHARED_CACHE          database file (unset: no shared cache)
+#   PATENTPEEK_SHARED_CACHE_ENTRIES  entry limit (default: SHARED_CACHE_ENTRIES)
+
+SHARED_CACHE_ENTRIES = 100_000
+BUSY_TIMEOUT_MS = 50
+# Creating the schema may wait for the other workers starting at the same time.
+SETUP_TIMEOUT = 5.0
+TOUCH_INTERVAL = 60.0
+EVICT_EVERY = 256
+SHARED_CACHE_ENV_VAR = "PATENTPEEK_SHARED_CACHE"
+SHARED_CACHE_ENTRIES_ENV_VAR = "PATENTPEEK_SHARED_CACHE_ENTRIES"
+
+_COUNTERS = ("hits", "misses", "evictions", "errors")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)",
+)
+
+
+class SharedCache:
+    """
+    A size-bounded string cache in a SQLite file, shared by the processes
+    that open the same path; see the module comment. Thread-safe. Keeps
+    hit/miss/eviction/error counters for this process.
+    """
+    def __init__(self, path: str, max_entries: int = SHARED_CACHE_ENTRIES):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        # Fail at startup, not on the first request, if the file cannot be opened.
+        with self._lock:
+            self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """This process's connection. A forked child must not reuse its parent's, so it opens its own."""
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SETUP_TIMEOUT,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Losing the last writes in a power cut only costs cache misses.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                connection = self._connect()
+                row = connection.execute("SELECT value, used FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return default
+                now = time.time()
+                if now - row[1] >= TOUCH_INTERVAL:
+                    connection.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+            except sqlite3.Error:
+                self.errors += 1
+                self.misses += 1
+                return default
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            try:
+                connection = self._connect()
+                connection.execute("INSERT OR REPLACE INTO entries (key, value, used) VALUES (?, ?, ?)",
+                                   (key, value, time.time()))
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0:
+                    self._evict(connection)
+            except sqlite3.Error:
+                self.errors += 1
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        excess = connection.execute("SELECT count(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.evictions += connection.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY used LIMIT ?)", (excess,)).rowcount
+
+    def clear(self) -> bool:
+        """Empties the cache for every process sharing it. Returns False if the database was unavailable."""
+        with self._lock:
+            try:
+                self._connect().execute("DELETE FROM entries")
+            except sqlite3.Error:
+                self.errors += 1
+                return False
+            self.hits = self.misses = self.evictions = self.errors = 0
+            return True
+
+    def take_counters(self) -> Dict[str, int]:
+        """Returns this process's counters and zeroes them (see metrics.take_worker_stats)."""
+        with self._lock:
+            counters = {name: getattr(self, name) for name in _COUNTERS}
+            self.hits = self.misses = self.evictions = self.errors = 0
+            return counters
+
+    def add_counters(self, counters: Dict[str, int]) -> None:
+        """Adds counters taken in another process."""
+        with self._lock:
+            for name in _COUNTERS:
+                setattr(self, name, getattr(self, name) + counters.get(name, 0))
+
+    def __len__(self) -> int:
+        """The number of entries, or 0 if the database is unavailable (counted as an error)."""
+        with self._lock:
+            try:
+                return self._connect().execute("SELECT count(*) FROM entries").fetchone()[0]
+            except sqlite3.Error:
+                self.errors += 1
+                return 0
+
+    def stats(self) -> Dict[str, int]:
+        size = len(self)
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "errors": self.errors, "size": size, "maxsize": self.max_entries,
+            }
+
+
+def shared_cache_from_env() -> Optional[SharedCache]:
+    """The cache named by PATENTPEEK_SHARED_CACHE, or None if it is not set."""
+    path = os.environ.get(SHARED_CACHE_ENV_VAR)
+    if not path:
+        return None
+    entries = os.environ.get(SHARED_CACHE_ENTRIES_ENV_VAR)
+    return SharedCache(path, int(entries) if entries else SHARED_CACHE_ENTRIES)
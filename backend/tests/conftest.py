@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# The backend modules import each other as top-level modules (main.py is run
+# from the backend directory), so the tests do the same.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
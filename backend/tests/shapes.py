@@ -0,0 +1,23 @@
+# tests/shapes.py
+from ast_nodes import (
+    BooleanOpNode, ClassificationNode, DateSearchNode, FieldedSearchNode, ProximityOpNode, QueryRootNode, TermNode
+)
+
+
+def shape(node):
+    """A compact nested-tuple form of an AST, for comparing structure."""
+    if isinstance(node, QueryRootNode):
+        return shape(node.query)
+    if isinstance(node, TermNode):
+        return f'"{node.value}"' if node.is_phrase else node.value
+    if isinstance(node, BooleanOpNode):
+        return (node.operator, *map(shape, node.operands))
+    if isinstance(node, ProximityOpNode):
+        return (node.operator + str(node.distance or ""), *map(shape, node.terms))
+    if isinstance(node, FieldedSearchNode):
+        return (node.field_canonical_name, shape(node.query))
+    if isinstance(node, DateSearchNode):
+        return (node.field_canonical_name, node.operator, node.date_value)
+    if isinstance(node, ClassificationNode):
+        return (node.scheme, node.value, node.include_children)
+    return repr(node)
@@ -0,0 +1,67 @@
+# tests/test_ast_canonical.py
+import pytest
+from ast_canonical import canonical_key, canonicalize
+from evaluator import CorpusIndex
+from google_parser import GoogleQueryParser
+from uspto_parser import USPTOQueryParser
+from wildcard_expansion import Vocabulary, WildcardExpander
+import models
+import services
+
+GOOGLE = GoogleQueryParser()
+USPTO = USPTOQueryParser()
+
+
+@pytest.mark.parametrize("left, right", [
+    ("a b", "b a"),
+    ("a (b c)", "(c a) b"),
+    ("a OR (b OR c)", "c OR b OR a"),
+    ("a NEAR3 b", "b NEAR3 a"),
+])
+def test_reorderings_share_a_key(left, right):
+    assert canonical_key(GOOGLE.parse(left)) == canonical_key(GOOGLE.parse(right))
+    assert canonicalize(GOOGLE.parse(left)) == canonicalize(GOOGLE.parse(right))
+
+
+@pytest.mark.parametrize("left, right", [
+    ("a ADJ2 b", "b ADJ2 a"),
+    # A chain is matched left to right, so its order is kept.
+    ("a NEAR3 b NEAR3 c", "c NEAR3 b NEAR3 a"),
+    ("a NOT b", "b NOT a"),
+])
+def test_ordered_operands_keep_their_order(left, right):
+    assert canonical_key(GOOGLE.parse(left)) != canonical_key(GOOGLE.parse(right))
+
+
+def test_field_syntax_is_not_part_of_the_key():
+    assert canonical_key(GOOGLE.parse("TI=(battery)")) == canonical_key(USPTO.parse("battery.ti."))
+
+
+def test_canonicalize_leaves_its_input_alone():
+    ast = GOOGLE.parse("b OR a")
+    before = ast.to_dict()
+    canonicalize(ast)
+    assert ast.to_dict() == before
+
+
+def test_reordered_query_reuses_cached_bitsets():
+    index = CorpusIndex.from_records([
+        {"id": "1", "title": "battery with an anode and a cathode"},
+        {"id": "2", "title": "anode only"},
+    ])
+    assert index.count(GOOGLE.parse("battery AND (anode NEAR3 cathode)")) == 1
+    misses = index.cache_stats()["misses"]
+    assert index.count(GOOGLE.parse("(cathode NEAR3 anode) AND battery")) == 1
+    assert index.cache_stats()["misses"] == misses
+
+
+def test_reordered_query_reuses_wildcard_sizes(monkeypatch):
+    expander = WildcardExpander(Vocabulary.from_terms(["anode", "anodes", "cathode", "cathodes"]))
+    monkeypatch.setattr(services, "default_expander", lambda: expander)
+    measured = []
+    monkeypatch.setattr(services, "expansion_sizes", lambda node, e: measured.append(node) or {"anode*": 2, "cathode*": 2})
+    for fmt, query in [("google", "anode* AND cathode*"), ("google", "cathode* AND anode*"),
+                       ("uspto", "cathode* AND anode*")]:
+        response = services.wildcard_expansion_service(models.WildcardExpansionRequest(format=fmt, queryString=query))
+        assert response.sizes == {"anode*": 2, "cathode*": 2}
+    assert len(measured) == 1
@@ -0,0 +1,35 @@
+# tests/test_ast_diff.py
+import copy
+import pytest
+from ast_diff import apply_patch, diff_ast
+from google_parser import GoogleQueryParser
+
+PARSER = GoogleQueryParser()
+
+
+@pytest.mark.parametrize("old, new", [
+    ("battery", "battery"),
+    ("battery AND anode", "battery AND cathode"),
+    ("battery AND anode", "battery AND anode AND cathode"),
+    ("battery AND anode AND cathode", "battery AND cathode"),
+    ("a OR b", "(a OR b) NEAR3 c"),
+    ('"solid state" NEAR3 electrolyte', '"solid state" NEAR5 electrolyte'),
+    ("TI=(lithium) CPC=H01M10/0525", "TI=(lithium ion) after:publication:2019"),
+    ("a b c d e", "e d c b a"),
+])
+def test_patch_turns_old_dict_into_new(old, new):
+    old_ast, new_ast = PARSER.parse(old), PARSER.parse(new)
+    patch = diff_ast(old_ast, new_ast)
+    assert apply_patch(copy.deepcopy(old_ast.to_dict()), patch) == new_ast.to_dict()
+
+
+def test_equal_trees_give_an_empty_patch():
+    assert diff_ast(PARSER.parse("battery AND anode"), PARSER.parse("battery AND anode")) == []
+
+
+@pytest.mark.parametrize("old, new", [(None, "battery"), ("battery", None), (None, None)])
+def test_patch_to_and_from_no_ast(old, new):
+    old_ast = PARSER.parse(old) if old else None
+    new_ast = PARSER.parse(new) if new else None
+    old_dict = old_ast.to_dict() if old_ast else None
+    assert apply_patch(old_dict, diff_ast(old_ast, new_ast)) == (new_ast.to_dict() if new_ast else None)
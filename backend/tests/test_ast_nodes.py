@@ -0,0 +1,44 @@
+# tests/test_ast_nodes.py
+import json
+import pytest
+from ast_nodes import ASTNode, QueryRootNode
+from google_parser import GoogleQueryParser
+from uspto_parser import USPTOQueryParser
+
+
+@pytest.mark.parametrize("ast", [
+    GoogleQueryParser().parse('a AND (b OR c) NEAR3 "d e"'),
+    GoogleQueryParser().parse("TI=(lithium) CPC=H01M10/0525 after:publication:2019"),
+    USPTOQueryParser().parse("(a ADJ2 b) WITH c.TI. AND @PD>=20200101<=20201231"),
+])
+def test_compact_round_trip(ast):
+    compact = json.loads(json.dumps(ast.to_compact()))
+    assert QueryRootNode.from_compact(compact) == ast
+    assert QueryRootNode.from_compact(compact).to_dict() == ast.to_dict()
+
+
+def test_compact_round_trip_of_a_deep_tree():
+    ast = GoogleQueryParser().parse("(" * 100 + "a" + ")" * 100 + " b")
+    assert QueryRootNode.from_compact(ast.to_compact()) == ast
+
+
+COMPACT = GoogleQueryParser().parse("a AND (b OR c) NEAR3 d").to_compact()
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"v": 1, "n": COMPACT["n"][:3]}, "Invalid child reference"),  # truncated table
+    ({"v": 2, "n": COMPACT["n"]}, "schema version"),
+    ([], "schema version"),
+    ({"v": 1, "n": []}, "no nodes"),
+    ({"v": 1, "n": [[]]}, "type code"),
+    ({"v": 1, "n": [[42, "a"]]}, "type code"),
+    ({"v": 1, "n": [[6]]}, "has no query"),
+    ({"v": 1, "n": [[6, 0]]}, "Invalid child reference"),
+    ({"v": 1, "n": [[6, "1"], [0, "a"]]}, "Invalid child reference"),
+    ({"v": 1, "n": [[6, [1]], [0, "a"]]}, "one index"),
+    ({"v": 1, "n": [[2, "AND", 1], [0, "a"]]}, "list of indices"),
+    ({"v": 1, "n": [[0, "a", False, False, 1]]}, "fields"),
+])
+def test_malformed_compact_ast_raises_value_error(data, message):
+    with pytest.raises(ValueError, match=message):
+        ASTNode.from_compact(data)
@@ -0,0 +1,92 @@
+# tests/test_convert_stream.py
+import asyncio
+import json
+import pytest
+from typing import List, Optional
+from fastapi.testclient import TestClient
+from main import STREAM_GROUP_SIZE, app
+import services
+
+SCOPE = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+    "path": "/api/convert-query/stream", "raw_path": b"/api/convert-query/stream",
+    "query_string": b"source_format=google&target_format=uspto", "root_path": "", "headers": [],
+    "client": ("test", 1), "server": ("test", 80),
+}
+
+
+def _stream(chunks: List[bytes], disconnect_after: Optional[int] = None, complete: bool = True) -> List[dict]:
+    """
+    Runs the stream endpoint on raw ASGI messages and returns the NDJSON
+    results the client got. The body arrives as `chunks` (and stops short
+    of its end unless `complete`); the client disconnects once
+    `disconnect_after` response chunks were sent (0: once the chunks are
+    read), or never if None.
+    """
+    async def run():
+        sent: List[bytes] = []
+        gone = asyncio.Event()
+        if disconnect_after == 0:
+            gone.set()
+        messages = [{"type": "http.request", "body": chunk, "more_body": not complete or i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if gone.is_set():
+                return  # as servers do, drop what is sent after the disconnect
+            if message["type"] == "http.response.body" and message.get("body"):
+                sent.append(message["body"])
+                if disconnect_after is not None and len(sent) >= disconnect_after:
+                    gone.set()
+                    await asyncio.sleep(0)  # lets the body reader's listener see the disconnect
+
+        await app(dict(SCOPE), receive, send)
+        gone.set()
+        return [json.loads(line) for body in sent for line in body.splitlines()]
+    return asyncio.run(run())
+
+
+def test_streams_one_result_per_line():
+    body = "\n".join(f"a{i} b{i}" for i in range(150)).encode()
+    results = _stream([body[:700], body[700:]])
+    assert [r["index"] for r in results] == list(range(150))
+    assert results[5]["converted_text"] == "a5 AND b5"
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """The groups of (index, line) the endpoint converts."""
+    groups: List[List[tuple]] = []
+    convert = services.convert_query_ndjson_lines
+
+    def recording(lines, *formats):
+        groups.append(lines)
+        return convert(lines, *formats)
+    monkeypatch.setattr(services, "convert_query_ndjson_lines", recording)
+    return groups
+
+
+def test_stops_converting_after_disconnect(converted):
+    body = "\n".join(f"a{i} b{i}" for i in range(20 * STREAM_GROUP_SIZE)).encode()
+    results = _stream([body], disconnect_after=2)
+    assert len(results) == 2 * STREAM_GROUP_SIZE
+    assert len(converted) <= 3
+
+
+def test_stops_reading_when_client_leaves_during_upload(converted):
+    chunk = "\n".join(f"a{i} b{i}" for i in range(10)).encode() + b"\npartial li"
+    _stream([chunk], disconnect_after=0, complete=False)
+    # The ten complete lines come with the chunk; the cut-off line is not converted.
+    assert [index for group in converted for index, _ in group] == list(range(10))
+
+
+def test_testclient_round_trip():
+    response = TestClient(app).post("/api/convert-query/stream?source_format=google&target_format=uspto",
+                                    content=b"a b\n\nc OR d\n")
+    assert [json.loads(line)["index"] for line in response.text.splitlines()] == [0, 2]
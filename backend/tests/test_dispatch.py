@@ -0,0 +1,39 @@
+# tests/test_dispatch.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from dispatch import Dispatcher
+
+
+def test_call_after_pool_shutdown_runs_on_a_fresh_pool():
+    dispatcher = Dispatcher("thread", max_workers=1, max_queue=0)
+    # As when another request's _reset_executor shuts the pool down after this one fetched it.
+    dispatcher._get_executor().shutdown()
+    assert asyncio.run(dispatcher.run(pow, 2, 10)) == 1024
+    assert dispatcher.in_flight == 0
+    assert asyncio.run(dispatcher.run(pow, 3, 2)) == 9
+
+
+def test_failed_submit_releases_its_slot(monkeypatch):
+    dispatcher = Dispatcher("thread", max_workers=1, max_queue=0)
+    stale = ThreadPoolExecutor(max_workers=1)
+    stale.shutdown()
+    monkeypatch.setattr(dispatcher, "_get_executor", lambda: stale)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(dispatcher.run(pow, 2, 10))
+    assert raised.value.status_code == 503
+    assert raised.value.headers == {"Retry-After": "1"}
+    assert dispatcher.in_flight == 0
+
+    monkeypatch.undo()
+    assert asyncio.run(dispatcher.run(pow, 2, 10)) == 1024
+
+
+def test_saturated_dispatcher_rejects_with_503():
+    dispatcher = Dispatcher("thread", max_workers=1, max_queue=0)
+    dispatcher.in_flight = 1
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(dispatcher.run(pow, 2, 10))
+    assert raised.value.status_code == 503
+    assert dispatcher.rejected == 1
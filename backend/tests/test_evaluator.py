@@ -0,0 +1,94 @@
+# tests/test_evaluator.py
+import pytest
+from evaluator import CorpusIndex
+from google_parser import GoogleQueryParser
+from uspto_parser import USPTOQueryParser
+
+RECORDS = [
+    {"id": "US1", "title": "Lithium ion battery",
+     "abstract": "A solid state electrolyte for a lithium battery. The anode is graphite.",
+     "claims": ["A battery comprising an anode and a cathode."], "cpc": ["H01M10/0525"],
+     "publication_date": "2019-05-01", "assignee_name": "Acme Energy", "country_code": "US"},
+    {"id": "US2", "title": "Graphene anode", "abstract": "Graphene coated anode material.",
+     "claims": ["An anode of graphene."], "cpc": ["H01M4/583"], "publication_date": "2021-02-10",
+     "assignee_name": "Globex Corp", "country_code": "US"},
+    {"id": "EP3", "title": "Solar cell", "abstract": "A photovoltaic cell. State of the art electrolyte is not used.",
+     "claims": ["A cell."], "cpc": ["H01L31/04"], "publication_date": "2020-07-15", "country_code": "EP"},
+    {"id": "WO4", "title": "Battery management", "abstract": "Cathode monitoring for a battery pack.",
+     "cpc": ["H02J7/00"], "publication_date": "2018-01-01", "country_code": "WO"},
+]
+INDEX = CorpusIndex.from_records(RECORDS)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("battery", ["US1", "WO4"]),
+    ("battery AND anode", ["US1"]),
+    ("anode OR cathode", ["US1", "US2", "WO4"]),
+    ("battery NOT cathode", []),
+    ("battery -anode", ["WO4"]),
+    ("(battery OR cell) AND -anode", ["EP3", "WO4"]),
+    ("graph*", ["US1", "US2"]),
+    ('"solid state" electrolyte', ["US1"]),
+    # "State of the art electrolyte" is four words apart.
+    ("state NEAR2 electrolyte", ["US1"]),
+    ("anode ADJ2 graphene", ["US2"]),
+    ("electrolyte WITH state", ["US1", "EP3"]),
+    ("TI=(battery)", ["US1", "WO4"]),
+    ("CPC=H01M10/0525", ["US1"]),
+    ("assignee:acme", ["US1"]),
+    ("country:EP", ["EP3"]),
+    ("after:publication:20200101", ["US2", "EP3"]),
+    ("before:publication:20190601", ["US1", "WO4"]),
+])
+def test_google_query_hits(query, expected):
+    ast = GoogleQueryParser().parse(query)
+    assert INDEX.matching_ids(ast) == expected
+    assert INDEX.count(ast) == len(expected)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("battery.TI.", ["US1", "WO4"]),
+    ("anode WITH graphite", ["US1"]),
+    ("anode SAME graphite", ["US1"]),
+    ("@PD>=20200101", ["US2", "EP3"]),
+])
+def test_uspto_query_hits(query, expected):
+    ast = USPTOQueryParser().parse(query)
+    assert INDEX.matching_ids(ast) == expected
+    assert INDEX.count(ast) == len(expected)
+
+
+def test_matching_ids_limit():
+    assert INDEX.matching_ids(GoogleQueryParser().parse("anode OR cathode"), limit=2) == ["US1", "US2"]
+
+
+def _claims(i):
+    claims = ["A device."]
+    if i % 8 == 0:
+        claims.append("An alpha beta unit.")
+    if i % 6 == 0:
+        claims.append("A zeta eta unit.")
+    if i % 9 == 0:
+        claims.append("The gamma x delta part.")
+    if i % 10 == 0:
+        claims.append("The gamma part. The delta part.")
+    return claims
+
+
+# Large enough that proximity operators after the first in an AND only look at a few documents.
+LARGE_INDEX = CorpusIndex.from_records({"id": str(i), "claims": _claims(i)} for i in range(512))
+
+
+@pytest.mark.parametrize("query, matches", [
+    ("alpha ADJ beta AND gamma NEAR2 delta", lambda i: i % 72 == 0),
+    ("zeta ADJ eta AND gamma NEAR2 delta", lambda i: i % 18 == 0),
+    ("alpha ADJ beta AND gamma WITH delta", lambda i: i % 72 == 0),
+    ("alpha ADJ beta AND gamma SAME delta", lambda i: i % 8 == 0 and (i % 9 == 0 or i % 10 == 0)),
+    ("zeta ADJ eta AND CL=(gamma SAME delta)", lambda i: i % 6 == 0 and (i % 9 == 0 or i % 10 == 0)),
+])
+def test_proximity_within_other_operands(query, matches):
+    ast = GoogleQueryParser().parse(query)
+    expected = [str(i) for i in range(512) if matches(i)]
+    assert LARGE_INDEX.matching_ids(ast) == expected
+    # Again, from the cache.
+    assert LARGE_INDEX.matching_ids(ast) == expected
@@ -0,0 +1,58 @@
+# tests/test_google_parser.py
+import pytest
+from google_generator import ASTToGoogleQueryGenerator
+from google_parser import GoogleQueryParser
+from shapes import shape
+
+PARSER = GoogleQueryParser()
+GENERATOR = ASTToGoogleQueryGenerator()
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("a b OR c", ("OR", ("AND", "a", "b"), "c")),
+    ("a OR b c", ("OR", "a", ("AND", "b", "c"))),
+    ("NOT a b", ("AND", ("NOT", "a"), "b")),
+    ("a NEAR3 b OR c", ("OR", ("NEAR3", "a", "b"), "c")),
+    ("a NEAR3 b NEAR2 c", ("NEAR2", ("NEAR3", "a", "b"), "c")),
+    ("(a OR (b OR (c)))", ("OR", "a", ("OR", "b", "c"))),
+    ("((((a b))))", ("AND", "a", "b")),
+    ('"x y" AND z', ("AND", '"x y"', "z")),
+    ("TI=(x OR y) z", ("AND", ("title", ("OR", "x", "y")), "z")),
+])
+def test_precedence_and_grouping(query, expected):
+    assert shape(PARSER.parse(query)) == expected
+
+
+@pytest.mark.parametrize("query, error", [
+    ("a OR", "Unexpected end of query"),
+    ("(a", "Unclosed parenthesis"),
+])
+def test_syntax_errors(query, error):
+    value = PARSER.parse(query).query.value
+    assert value.startswith("PARSE_ERROR") and error in value
+
+
+def test_long_and_deeply_nested_queries():
+    ast = PARSER.parse(" ".join(f"(w{i} OR v{i})" for i in range(3000)))
+    assert len(ast.query.operands) == 3000
+    assert shape(PARSER.parse("(" * 100 + "a" + ")" * 100)) == "a"
+
+
+@pytest.mark.parametrize("query", [
+    "battery AND (anode OR cathode)",
+    '"solid state" NEAR3 electrolyte',
+    "TI=(lithium) AND CPC=H01M10/0525",
+    'inventor:"Jane Doe" before:priority:20200101',
+    "(a OR b) -c",
+    "a NOT b",
+    "graph* AND after:publication:2019-01-01",
+    "x ADJ2 y",
+])
+def test_generated_query_parses_to_the_same_ast(query):
+    ast = PARSER.parse(query)
+    assert PARSER.parse(GENERATOR.generate(ast)).to_dict() == ast.to_dict()
+
+
+@pytest.mark.parametrize("query", ['"solid state" NEAR3 electrolyte', "x ADJ2 y", "(a OR b) -c"])
+def test_canonical_queries_are_generated_unchanged(query):
+    assert GENERATOR.generate(PARSER.parse(query)) == query
@@ -0,0 +1,49 @@
+# tests/test_query_budget.py
+import pytest
+from fastapi.testclient import TestClient
+from google_parser import GoogleQueryParser
+from main import app
+from query_budget import QueryBudget, QueryBudgetExceeded, query_cost
+from uspto_parser import USPTOQueryParser
+
+CLIENT = TestClient(app)
+
+
+@pytest.mark.parametrize("parser, query, budget, limit", [
+    (GoogleQueryParser(), "a b c d", QueryBudget(max_length=5), "length"),
+    (USPTOQueryParser(), "a AND b AND c", QueryBudget(max_length=5), "length"),
+    (GoogleQueryParser(), "a b c d", QueryBudget(max_tokens=3), "tokens"),
+    (GoogleQueryParser(), "a OR b OR c OR d", QueryBudget(max_nodes=4), "nodes"),
+    (GoogleQueryParser(), "((((a))))", QueryBudget(max_depth=3), "depth"),
+    (USPTOQueryParser(), "a$ OR b$ OR c$", QueryBudget(max_wildcards=2), "wildcards"),
+    (GoogleQueryParser(), "(a OR b OR c) NEAR3 (d OR e)", QueryBudget(max_proximity_fanout=5), "proximity_fanout"),
+])
+def test_parser_rejects_query_over_budget(parser, query, budget, limit):
+    with pytest.raises(QueryBudgetExceeded) as raised:
+        parser.parse(query, budget=budget)
+    assert raised.value.limit == limit
+    assert raised.value.value > raised.value.maximum
+
+
+def test_query_within_budget_parses():
+    query = "(a OR b OR c) NEAR3 (d OR e)"
+    ast = GoogleQueryParser().parse(query, budget=QueryBudget(max_proximity_fanout=6))
+    assert query_cost(ast).proximity_fanout == 6
+
+
+@pytest.mark.parametrize("body, status, limit", [
+    ({"format": "google", "queryString": "a " * 40000}, 413, "length"),
+    ({"format": "google", "queryString": "(" * 200 + "a" + ")" * 200}, 422, "depth"),
+    ({"format": "uspto", "queryString": " OR ".join(f"w{i}$" for i in range(300))}, 422, "wildcards"),
+])
+def test_parse_query_endpoint_reports_budget(body, status, limit):
+    response = CLIENT.post("/api/parse-query", json=body)
+    assert response.status_code == status
+    detail = response.json()["detail"]
+    assert detail["error"] == "query_budget_exceeded"
+    assert detail["limit"] == limit
+
+
+def test_parse_query_endpoint_accepts_query_within_budget():
+    response = CLIENT.post("/api/parse-query", json={"format": "google", "queryString": "battery AND anode"})
+    assert response.status_code == 200
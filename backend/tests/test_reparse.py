@@ -0,0 +1,55 @@
+# tests/test_reparse.py
+import random
+import pytest
+from google_parser import GoogleQueryParser, QueryEdit
+
+PARSER = GoogleQueryParser()
+
+# Each query is an edit of the one before it, as when typing in the form.
+EDITS = [
+    ["b", "ba", "battery", "battery AND", "battery AND (anode", "battery AND (anode OR cathode)"],
+    ['"solid', '"solid state"', '"solid state" NEAR3 electrolyte', '"solid state" NEAR5 electrolyte'],
+    ["TI=(lithium)", "TI=(lithium) CPC=H01M", "TI=(lithium) CPC=H01M10/0525", "TI=(lithium ion) CPC=H01M10/0525"],
+    ["(a OR b) AND c", "(a OR b OR d) AND c", "(a OR d) AND c", "(a OR d) AND -c", "a OR d AND -c"],
+    ["inventor:doe", 'inventor:"Jane Doe"', 'inventor:"Jane Doe" before:priority:2020', 'inventor:"Jane Doe" before:priority:20200101'],
+]
+
+
+def _parse_after(state, query):
+    """Reparses `query` as an edit of the last query, as services does; a query that did not parse has no state."""
+    if state is None:
+        return PARSER.parse_with_state(query)
+    return PARSER.reparse_query(state, query)
+
+
+@pytest.mark.parametrize("queries", EDITS)
+def test_reparse_matches_full_parse(queries):
+    state = None
+    for query in queries:
+        ast, state = _parse_after(state, query)
+        assert ast.to_dict() == PARSER.parse(query).to_dict()
+    assert state is not None
+
+
+def test_random_edits_match_full_parse():
+    rng = random.Random(0)
+    pieces = ["a", "b", " ", "(", ")", '"', "-", "*", " AND ", " OR ", " NOT ", " NEAR3 ", "TI=", "CPC=H01M", "x y"]
+    reparsed = 0
+    for _ in range(300):
+        # Random edits soon leave nothing that parses, so each run starts from a valid query.
+        queries = rng.choice(EDITS)
+        ast, state = PARSER.parse_with_state(queries[-1])
+        query = queries[-1]
+        while state is not None:
+            start = rng.randint(0, len(query))
+            end = min(len(query), start + rng.randint(0, 3))
+            query = (query[:start] + "".join(rng.choice(pieces) for _ in range(rng.randint(0, 2))) + query[end:]).strip()
+            ast, state = PARSER.reparse_query(state, query)
+            reparsed += 1
+            assert ast.to_dict() == PARSER.parse(query).to_dict(), query
+    assert reparsed > 300
+
+
+def test_query_edit_round_trip():
+    old, new = "battery AND anode", "battery OR anode"
+    assert QueryEdit.between(old, new).apply(old) == new
@@ -0,0 +1,43 @@
+# tests/test_uspto_generator.py
+import pytest
+from ast_nodes import (
+    BooleanOpNode, ClassificationNode, DateSearchNode, FieldedSearchNode, ProximityOpNode, QueryRootNode, TermNode
+)
+from google_parser import GoogleQueryParser
+from uspto_generator import ASTToUSPTOQueryGenerator
+
+GENERATOR = ASTToUSPTOQueryGenerator()
+T = TermNode
+
+
+@pytest.mark.parametrize("node, expected", [
+    (BooleanOpNode("AND", [BooleanOpNode("OR", [T("a"), T("b")]), T("c")]), "(a OR b) AND c"),
+    (BooleanOpNode("OR", [BooleanOpNode("AND", [T("a"), T("b")]), T("c")]), "a AND b OR c"),
+    (BooleanOpNode("XOR", [T("a"), BooleanOpNode("OR", [T("b"), T("c")])]), "a XOR (b OR c)"),
+    (BooleanOpNode("NOT", [T("a"), T("b")]), "a NOT b"),
+    (BooleanOpNode("NOT", [T("a")]), "NOT a"),
+    (ProximityOpNode("ADJ", [T("a"), T("b")], distance=2, ordered=True, scope_unit="word"), "a ADJ2 b"),
+    (ProximityOpNode("NEAR", [BooleanOpNode("OR", [T("a"), T("b")]), T("c")], distance=3), "(a OR b) NEAR3 c"),
+    (ProximityOpNode("WITH", [ProximityOpNode("ADJ", [T("a"), T("b")], ordered=True), T("c")], scope_unit="sentence"),
+     "a ADJ b WITH c"),
+    (FieldedSearchNode("title", BooleanOpNode("OR", [T("a"), T("b")])), "(a OR b).TI."),
+    (FieldedSearchNode("claims", T("solid state", is_phrase=True)), '"solid state".CLM.'),
+    (FieldedSearchNode("cpc", ClassificationNode("CPC", "H01M10/0525")), "H01M10/0525.CPC."),
+    (ClassificationNode("CPC", "H04L9/32", include_children=True), "H04L9/32$.CPC."),
+    (DateSearchNode("publication_date", ">=", "20200101"), "@PD>=20200101"),
+    (DateSearchNode("application_date", "<", "20190630"), "@AD<20190630"),
+    (T("graph*"), "graph$"),
+])
+def test_generates_ppubs_syntax_with_only_needed_parentheses(node, expected):
+    assert GENERATOR.generate(QueryRootNode(query=node)) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("battery AND (anode OR cathode)", "battery AND (anode OR cathode)"),
+    ("TI=(lithium) AND CPC=H01M10/0525", "lithium.TI. AND H01M10/0525.CPC."),
+    ('inventor:"Jane Doe" before:priority:20200101', '"Jane Doe".IN. AND @PRAD<=20200101'),
+    ("graph* AND after:publication:2019-01-01", "graph$ AND @PD>=20190101"),
+    ("(a OR b) -c", "(a OR b) AND -c"),
+])
+def test_google_to_uspto(query, expected):
+    assert GENERATOR.generate(GoogleQueryParser().parse(query)) == expected
@@ -0,0 +1,112 @@
+# tests/test_uspto_parser.py
+import pytest
+from shapes import shape
+from uspto_generator import ASTToUSPTOQueryGenerator
+from uspto_parser import USPTOQueryParser
+
+PARSER = USPTOQueryParser()
+
+
+@pytest.mark.parametrize("query, expected", [
+    # Lowest to highest: OR, XOR, AND, NOT, SAME, WITH, ADJ/NEAR.
+    ("a OR b XOR c AND d NOT e SAME f WITH g ADJ h NEAR3 i",
+     ("OR", "a", ("XOR", "b", ("AND", "c", ("NOT", "d", ("SAME", "e", ("WITH", "f", ("NEAR3", ("ADJ", "g", "h"), "i")))))))),
+    ("a AND b OR c", ("OR", ("AND", "a", "b"), "c")),
+    ("a OR b AND c", ("OR", "a", ("AND", "b", "c"))),
+    ("a XOR b OR c", ("OR", ("XOR", "a", "b"), "c")),
+    ("a AND b NOT c", ("AND", "a", ("NOT", "b", "c"))),
+    ("a NOT b NOT c", ("NOT", "a", "b", "c")),
+    ("NOT a AND b", ("AND", ("NOT", "a"), "b")),
+    ("a ADJ2 b WITH c SAME d", ("SAME", ("WITH", ("ADJ2", "a", "b"), "c"), "d")),
+    ("a SAME b WITH c", ("SAME", "a", ("WITH", "b", "c"))),
+    ("a NEAR3 b ADJ c", ("ADJ", ("NEAR3", "a", "b"), "c")),
+    ("(a OR b) ADJ c", ("ADJ", ("OR", "a", "b"), "c")),
+    ("a or b and c", ("OR", "a", ("AND", "b", "c"))),
+    ("a b", ("AND", "a", "b")),
+])
+def test_operator_precedence(query, expected):
+    assert shape(PARSER.parse(query)) == expected
+
+
+def test_proximity_semantics():
+    adj, near, with_, same = (PARSER.parse(q).query for q in ("a ADJ2 b", "a NEAR b", "a WITH b", "a SAME b"))
+    assert (adj.distance, adj.ordered, adj.scope_unit) == (2, True, "word")
+    assert (near.distance, near.ordered, near.scope_unit) == (None, False, "word")
+    assert (with_.ordered, with_.scope_unit) == (False, "sentence")
+    assert (same.ordered, same.scope_unit) == (False, "paragraph")
+
+
+def test_default_operator():
+    assert shape(USPTOQueryParser("OR").parse("a b")) == ("OR", "a", "b")
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("battery.TI.", ("title", "battery")),
+    ("battery.ti.", ("title", "battery")),
+    ("(a OR b).AB.", ("abstract", ("OR", "a", "b"))),
+    ('"solid state".CLM.', ("claims", '"solid state"')),
+    ("battery.TI,AB.", ("OR", ("title", "battery"), ("abstract", "battery"))),
+    ("a.TI. AND b.CLM.", ("AND", ("title", "a"), ("claims", "b"))),
+    ("Acme.AS.", ("assignee_name", "Acme")),
+    ("H01M10/0525.CPC.", ("cpc", ("CPC", "H01M10/0525", False))),
+    ("H04L9/32$.cpc.", ("cpc", ("CPC", "H04L9/32", True))),
+    ("(H01M4/583 OR H01M10/0525).CPC.",
+     ("cpc", ("OR", ("CPC", "H01M4/583", False), ("CPC", "H01M10/0525", False)))),
+    # An unknown suffix leaves the word as typed.
+    ("a.XX.", "a.XX."),
+])
+def test_field_suffixes(query, expected):
+    assert shape(PARSER.parse(query)) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("@PD>=20200101", ("publication_date", ">=", "20200101")),
+    ("@AD<2019-06-30", ("application_date", "<", "20190630")),
+    ("@PRAD<=20180101", ("priority_date", "<=", "20180101")),
+    ("@PY=2020", ("publication_year", "=", "2020")),
+    ("@PD>=20200101<=20201231",
+     ("AND", ("publication_date", ">=", "20200101"), ("publication_date", "<=", "20201231"))),
+    ("battery AND @PD>20200101", ("AND", "battery", ("publication_date", ">", "20200101"))),
+])
+def test_date_clauses(query, expected):
+    assert shape(PARSER.parse(query)) == expected
+
+
+@pytest.mark.parametrize("query", ["graph$", "graph$3", "wir?", "?node"])
+def test_truncation_is_kept_on_the_term(query):
+    ast = PARSER.parse(query)
+    assert shape(ast) == query
+    assert ast.query.has_wildcard
+
+
+@pytest.mark.parametrize("query, error", [
+    ("(a OR b", "Unclosed parenthesis"),
+    ("a)", "Unmatched ')'"),
+    ('"abc', "Unterminated phrase"),
+    ("a AND", "Unexpected end of query"),
+    ("@ZZ>=2020", "Unknown date field"),
+    ("@PD~2020", "Malformed date clause"),
+    (".TI.", "Field suffix without a preceding term"),
+])
+def test_syntax_errors(query, error):
+    value = PARSER.parse(query).query.value
+    assert value.startswith("PARSE_ERROR") and error in value
+
+
+@pytest.mark.parametrize("query", [
+    "battery AND (anode OR cathode)",
+    "lithium.TI. AND H01M10/0525.CPC.",
+    "(solid ADJ2 state) WITH electrolyte",
+    "anode NOT cathode",
+    "@PD>=20200101<=20201231",
+    "graph$ OR grapheme",
+    "a XOR b SAME c",
+])
+def test_generated_query_parses_to_the_same_ast(query):
+    ast = PARSER.parse(query)
+    assert PARSER.parse(ASTToUSPTOQueryGenerator().generate(ast)).to_dict() == ast.to_dict()
+
+
+def test_long_query_parses():
+    query = " OR ".join(f"(w{i} ADJ v{i}).TI." for i in range(5000))
+    assert len(PARSER.parse(query).query.operands) == 5000
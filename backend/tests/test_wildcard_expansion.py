@@ -0,0 +1,60 @@
+# tests/test_wildcard_expansion.py
+import random
+import re
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+import services
+from wildcard_expansion import Vocabulary, WildcardExpander
+
+RNG = random.Random(0)
+TERMS = sorted({"".join(RNG.choice("abcde") for _ in range(RNG.randint(1, 7))) for _ in range(3000)})
+EXPANDER = WildcardExpander(Vocabulary.from_terms(TERMS), max_expansions=None, max_scan=None)
+
+
+def _brute_force(pattern: str):
+    """The terms matching `pattern`, by checking every one against a regex."""
+    regex = ""
+    for mark, limit, literal in re.findall(r"(\$(\d+)|[*$?])|([^*$?]+)", pattern):
+        if literal:
+            regex += re.escape(literal)
+        elif limit:
+            regex += f".{{0,{limit}}}"
+        else:
+            regex += "." if mark == "?" else ".*"
+    return tuple(term for term in TERMS if re.fullmatch(regex, term))
+
+
+@pytest.mark.parametrize("pattern", [
+    "ab*", "*de", "a*e", "*bc*", "a?c*", "??", "?a?", "abc$", "ab$2", "*a$1e", "a*b*c", "e", "zz*", "*",
+])
+def test_expansion_matches_brute_force(pattern):
+    expansion = EXPANDER.expand(pattern)
+    assert expansion.terms == _brute_force(pattern)
+    assert expansion.complete
+
+
+def test_capped_expansion_keeps_first_terms():
+    expander = WildcardExpander(Vocabulary.from_terms(TERMS), max_expansions=5)
+    expansion = expander.expand("a*")
+    assert expansion.terms == _brute_force("a*")[:5]
+    assert not expansion.complete
+
+
+def test_endpoint_reports_sizes_and_expands(monkeypatch):
+    expander = WildcardExpander(Vocabulary.from_terms(["battery", "batteries", "cell", "cells", "cellar"]),
+                                max_expansions=2)
+    monkeypatch.setattr(services, "default_expander", lambda: expander)
+    response = TestClient(app).post("/api/wildcard-expansion", json={
+        "format": "google", "queryString": "batter* AND cell*", "targetFormat": "uspto"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sizes"] == {"batter*": 2, "cell*": 3}
+    # cell* matches more terms than the cap, so it keeps its wildcard.
+    assert body["expandedQuery"] == "(batteries OR battery) AND cell$"
+
+
+def test_endpoint_without_vocabulary(monkeypatch):
+    monkeypatch.setattr(services, "default_expander", lambda: None)
+    response = TestClient(app).post("/api/wildcard-expansion", json={"format": "google", "queryString": "batter*"})
+    assert response.status_code == 503
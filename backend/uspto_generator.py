@@ -1,23 +1,224 @@
 # uspto_generator.py
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode, ClassificationNode
+)
+from typing import Optional, Dict, List
+import re
+from classification_index import may_have_children, normalize_symbol
 
-# --- Placeholder Logic ---
-# This generator defines the ASTToUSPTOQueryGenerator class but does not
-# perform real generation. It returns a simple string representation of the AST.
+# Words that PPUBS would read as operators; as terms they must be quoted.
+USPTO_OPERATOR_KEYWORDS_REGEX = re.compile(
+    r'^(AND|OR|NOT|XOR|ADJ\d*|NEAR\d*|WITH|SAME)$',
+    re.IGNORECASE
+)
 
-from ast_nodes import QueryRootNode
+# Binding strength of each construct, matching USPTO_PRECEDENCE in uspto_parser.
+USPTO_OP_PRECEDENCE: Dict[str, int] = {
+    "OR": 1, "XOR": 2, "AND": 3, "NOT": 4,
+    "SAME": 5, "WITH": 6, "ADJ": 7, "NEAR": 7,
+}
+# Field suffixes (".TI.") are postfix and bind tighter than every operator.
+FIELD_SUFFIX_PRECEDENCE = 90
+ATOM_PRECEDENCE = 100
+# Operators whose nested use needs no parentheses: (a OR b) OR c == a OR b OR c.
+ASSOCIATIVE_OPERATORS = {"AND", "OR", "XOR"}
 
-class ASTToUSPTOQueryGenerator: # <-- FIX: Added the class definition
+CANONICAL_TO_USPTO_FIELD: Dict[str, str] = {
+    "title": "TI", "abstract": "AB", "claims": "CLM", "description": "SPEC",
+    "brief_summary": "BSUM", "cpc": "CPC", "ipc": "IPC", "uspc": "CCLS",
+    "inventor_name": "IN", "assignee_name": "AS", "patent_number": "PN",
+    "country_code": "CTRY",
+}
+CLASSIFICATION_SCHEME_TO_FIELD: Dict[str, str] = {"CPC": "CPC", "IPC": "IPC", "USPC": "CCLS", "CCLS": "CCLS"}
+
+CANONICAL_TO_USPTO_DATE_FIELD: Dict[str, str] = {
+    "publication_date": "PD", "application_date": "AD", "priority_date": "PRAD",
+    "issue_date": "ISD", "publication_year": "PY", "application_year": "AY",
+}
+
+# Terms with no PPUBS equivalent. They are left out of the generated query.
+UNSUPPORTED_TERMS = {"__EMPTY__", "is:litigated"}
+# Full-text fields PPUBS searches by default: their query is emitted without a suffix.
+DEFAULT_TEXT_FIELDS = {"text_all_core"}
+
+# Stack frame kinds for ASTToUSPTOQueryGenerator._emit
+_VISIT, _NEXT_CHILD, _CLOSE = 0, 1, 2
+
+
+class _Group:
+    """Bookkeeping for a composite node whose children are being emitted."""
+    __slots__ = ('start', 'separator', 'suffix', 'non_empty', 'child_mark', 'separator_pending')
+
+    def __init__(self, start: int, separator: str, suffix: str):
+        self.start = start                  # output length before this node wrote anything
+        self.separator = separator          # written between non-empty children
+        self.suffix = suffix                # written after the last child: ")" and/or ".TI."
+        self.non_empty = 0                  # children so far that produced output
+        self.child_mark = start             # output length when the current child started
+        self.separator_pending = False      # a separator precedes the current child
+
+
+class ASTToUSPTOQueryGenerator:
+    """
+    Generates USPTO PPUBS syntax. The tree is walked once with an explicit
+    stack, appending fragments to a single output list that is joined at the
+    end. Parentheses are only written where precedence requires them.
+    Children that produce no output (e.g. "__EMPTY__") are dropped together
+    with the separator in front of them.
+    """
     def __init__(self):
         pass
 
     def generate(self, ast_root: QueryRootNode) -> str:
-        """
-        Placeholder generate method.
-        Returns a string representation of the root AST node.
-        """
         if not isinstance(ast_root, QueryRootNode):
             return "Error: Invalid AST root"
-        
-        settings_str = f" (Settings: {ast_root.settings})" if ast_root.settings else ""
-        
-        return f"USPTO Query from AST: {ast_root.query!r}{settings_str}"
\ No newline at end of file
+        out: List[str] = []
+        self._emit(ast_root.query, out)
+        return "".join(out).strip()
+
+    def _needs_paren(self, prec: int, op: Optional[str], parent_prec: int, parent_op: Optional[str]) -> bool:
+        if prec < parent_prec:
+            return True
+        return prec == parent_prec and not (op == parent_op and op in ASSOCIATIVE_OPERATORS)
+
+    def _format_term(self, node: TermNode) -> str:
+        value = node.value
+        if node.is_phrase or " " in value or USPTO_OPERATOR_KEYWORDS_REGEX.match(value):
+            return f'"{value}"'
+        # Google's "*" is unlimited truncation, spelled "$" in PPUBS.
+        return value.replace("*", "$") if node.has_wildcard else value
+
+    def _format_classification(self, node: ClassificationNode) -> str:
+        value = node.value
+        if node.scheme in ("CPC", "IPC") and ("/" in value or not node.include_children):
+            value = normalize_symbol(value) or value
+        # A leaf in the classification index has nothing below it to add.
+        if node.include_children and (node.scheme not in ("CPC", "IPC") or may_have_children(value)):
+            value += "$"
+        return value
+
+    def _format_date(self, node: DateSearchNode) -> str:
+        code = CANONICAL_TO_USPTO_DATE_FIELD.get(node.field_canonical_name) or node.system_field_code
+        if not code:
+            return f"Error:UnknownDateField({node.field_canonical_name})"
+        # PPUBS dates are YYYYMMDD; Google accepts YYYY-MM-DD as well.
+        clause = f"@{code}{node.operator}{node.date_value.replace('-', '')}"
+        if node.date_value2:
+            clause += f"<={node.date_value2.replace('-', '')}"
+        return clause
+
+    def _emit(self, root: ASTNode, out: List[str]) -> None:
+        # Visit frames: (_VISIT, node, parent_prec, parent_op, class_field), where
+        # class_field is the classification field code the node is inside, if any.
+        stack: List[tuple] = [(_VISIT, root, 0, None, None)]
+        while stack:
+            frame = stack.pop()
+            kind = frame[0]
+
+            if kind == _NEXT_CHILD:
+                _, group, is_first = frame
+                if not is_first:
+                    self._finish_child(group, out)
+                if group.non_empty:
+                    out.append(group.separator)
+                    group.separator_pending = True
+                else:
+                    group.separator_pending = False
+                group.child_mark = len(out)
+                continue
+
+            if kind == _CLOSE:
+                group = frame[1]
+                self._finish_child(group, out)
+                if group.non_empty:
+                    out.append(group.suffix)
+                else:
+                    del out[group.start:]
+                continue
+
+            _, node, parent_prec, parent_op, class_field = frame
+
+            if isinstance(node, TermNode):
+                if node.value in UNSUPPORTED_TERMS:
+                    continue
+                if class_field:
+                    value = node.value
+                    if value.upper().endswith("/LOW"):
+                        value = value[:-4] + "$"
+                    out.append(value)
+                else:
+                    out.append(self._format_term(node))
+                continue
+
+            if isinstance(node, ClassificationNode):
+                out.append(self._format_classification(node))
+                field_code = CLASSIFICATION_SCHEME_TO_FIELD.get(node.scheme, node.scheme)
+                if class_field != field_code:
+                    out.append(f".{field_code}.")
+                continue
+
+            if isinstance(node, DateSearchNode):
+                out.append(self._format_date(node))
+                continue
+
+            if isinstance(node, FieldedSearchNode):
+                field_code = CANONICAL_TO_USPTO_FIELD.get(node.field_canonical_name)
+                if not field_code:
+                    if node.field_canonical_name in DEFAULT_TEXT_FIELDS:
+                        stack.append((_VISIT, node.query, parent_prec, parent_op, class_field))
+                    # Other fields PPUBS cannot express (language, status, ...) are left out.
+                    continue
+                child_class_field = field_code if field_code in CLASSIFICATION_SCHEME_TO_FIELD.values() else None
+                child = node.query
+                # A bare classification symbol under its own field only needs the suffix once.
+                if isinstance(child, ClassificationNode) and CLASSIFICATION_SCHEME_TO_FIELD.get(child.scheme) == field_code:
+                    stack.append((_VISIT, child, parent_prec, parent_op, None))
+                    continue
+                # Operators get their own parentheses from the suffix precedence; a
+                # nested field suffix needs explicit ones: "(battery.AB.).TI.".
+                paren = isinstance(child, FieldedSearchNode)
+                group = _Group(len(out), "", (")" if paren else "") + f".{field_code}.")
+                if paren:
+                    out.append("(")
+                stack.append((_CLOSE, group))
+                stack.append((_VISIT, child, FIELD_SUFFIX_PRECEDENCE, None, child_class_field))
+                stack.append((_NEXT_CHILD, group, True))
+                continue
+
+            if isinstance(node, BooleanOpNode):
+                op = node.operator.upper()
+                children = node.operands
+                prefix = ""
+                if op == "NOT" and len(children) == 1:
+                    prefix = "NOT "
+                separator = f" {op} "
+            elif isinstance(node, ProximityOpNode):
+                op = node.operator.upper()
+                children = node.terms
+                prefix = ""
+                separator = f" {op}{node.distance} " if node.distance is not None and op in ("ADJ", "NEAR") else f" {op} "
+            else:
+                out.append(f"Error:UnhandledASTNode({type(node).__name__})")
+                continue
+
+            prec = USPTO_OP_PRECEDENCE.get(op, 0)
+            paren = self._needs_paren(prec, op, parent_prec, parent_op) if parent_prec else False
+            group = _Group(len(out), separator, ")" if paren else "")
+            if paren:
+                out.append("(")
+            if prefix:
+                out.append(prefix)
+            # A unary NOT's operand must bind tighter than NOT itself.
+            child_op = None if prefix else op
+            stack.append((_CLOSE, group))
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((_VISIT, children[i], prec, child_op, class_field))
+                stack.append((_NEXT_CHILD, group, i == 0))
+
+    def _finish_child(self, group: _Group, out: List[str]) -> None:
+        if len(out) > group.child_mark:
+            group.non_empty += 1
+        elif group.separator_pending:
+            # The child wrote nothing, so the separator before it is the last fragment.
+            out.pop()
@@ -1,22 +1,336 @@
 # uspto_parser.py
+from typing import Dict, Any, List, Optional, Tuple
+import re
+from time import perf_counter
+from ast_nodes import (
+    ASTNode, QueryRootNode, TermNode, BooleanOpNode, ProximityOpNode,
+    FieldedSearchNode, DateSearchNode, ClassificationNode
+)
+from classification_index import normalize_symbol
+from query_budget import QueryBudget, QueryBudgetExceeded, check_cost, check_length, query_cost
 
-# --- Placeholder Logic ---
-# This parser defines the USPTOQueryParser class but does not perform
-# real parsing. It returns a minimal, valid AST.
+# Maps a PPUBS/EAST field suffix code (".TI.") to its canonical field name.
+USPTO_FIELD_CODE_TO_CANONICAL: Dict[str, str] = {
+    "TI": "title", "AB": "abstract", "CLM": "claims",
+    "SPEC": "description", "DETD": "description", "BSUM": "brief_summary",
+    "CPC": "cpc", "CPCI": "cpc", "CPCA": "cpc", "IPC": "ipc", "CCLS": "uspc",
+    "IN": "inventor_name", "INNM": "inventor_name",
+    "AS": "assignee_name", "ASNM": "assignee_name",
+    "PN": "patent_number", "CTRY": "country_code",
+}
 
-from ast_nodes import QueryRootNode, TermNode
+# Field codes whose values are classification symbols, mapped to their scheme.
+USPTO_CLASSIFICATION_FIELDS: Dict[str, str] = {
+    "CPC": "CPC", "CPCI": "CPC", "CPCA": "CPC", "IPC": "IPC", "CCLS": "CCLS",
+}
 
-class USPTOQueryParser: # <-- FIX: Added the class definition
-    def __init__(self):
-        pass
+# "@PD>=20200101" style date clauses.
+USPTO_DATE_CODE_TO_CANONICAL: Dict[str, str] = {
+    "PD": "publication_date", "AD": "application_date", "PRAD": "priority_date",
+    "ISD": "issue_date", "PY": "publication_year", "AY": "application_year",
+}
 
-    def parse(self, query_string: str) -> QueryRootNode:
+# Lexer regex. Every alternative consumes at least one character, so a single
+# finditer pass splits the query in linear time while keeping match offsets.
+TOKENIZE_REGEX = re.compile(
+    r'''
+    (?P<ws>\s+) |
+    (?P<lparen>\() |
+    (?P<rparen>\)) |
+    "(?P<phrase>[^"]*)(?P<phrase_close>"?) |  # A phrase; an empty close group means it is unterminated
+    (?P<date>@[A-Za-z]+[^\s()"]*) |  # @PD>=20200101, optionally followed by <=20201231
+    (?P<suffix>\.[A-Za-z][A-Za-z0-9]*(?:,[A-Za-z][A-Za-z0-9]*)*\.) |  # ".TI." after a group or phrase
+    (?P<word>[^\s()"]+)  # Anything else up to whitespace, a paren or a quote
+    ''',
+    re.VERBOSE
+)
+# A word carrying its own field suffix: "battery.ti." or "H04L9/32.cpc."
+WORD_SUFFIX_REGEX = re.compile(r"^(.+?)\.([A-Za-z][A-Za-z0-9]*(?:,[A-Za-z][A-Za-z0-9]*)*)\.$")
+DATE_REGEX = re.compile(r"^@([A-Za-z]+)(>=|<=|<>|=|>|<)([\d-]+)(?:(<=|<)([\d-]+))?$")
+PROXIMITY_OPERATOR_REGEX = re.compile(r"^(ADJ|NEAR)(\d*)$|^(WITH|SAME)$", re.IGNORECASE)
+BOOLEAN_OPERATORS = {"AND", "OR", "NOT", "XOR"}
+
+# Token kinds
+T_LPAREN, T_RPAREN, T_PHRASE, T_WORD = "LPAREN", "RPAREN", "PHRASE", "WORD"
+T_BOOL, T_PROX, T_FIELD, T_DATE = "BOOL", "PROX", "FIELD", "DATE"
+
+# A token is (kind, value, position in the query string). T_BOOL carries the
+# upper-case operator, T_PROX an (operator, distance) pair, T_FIELD a tuple of
+# upper-case field codes and T_DATE the ready DateSearchNode.
+Token = Tuple[str, Any, int]
+
+# Binary operator precedence, lowest first. Operators are case-insensitive.
+# Adjacent operands are joined by the parser's default operator.
+USPTO_PRECEDENCE: Dict[str, int] = {
+    "OR": 1, "XOR": 2, "AND": 3, "NOT": 4,
+    "SAME": 5, "WITH": 6, "ADJ": 7, "NEAR": 7,
+}
+# ProximityOpNode attributes implied by each proximity operator.
+PROXIMITY_SEMANTICS: Dict[str, Tuple[bool, str]] = {
+    "ADJ": (True, "word"), "NEAR": (False, "word"),
+    "WITH": (False, "sentence"), "SAME": (False, "paragraph"),
+}
+
+
+class QuerySyntaxError(ValueError):
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+def _field_codes(suffix_body: str) -> Optional[Tuple[str, ...]]:
+    """Splits "ti,ab" into ("TI", "AB"), or returns None if any code is unknown."""
+    codes = tuple(code.upper() for code in suffix_body.split(","))
+    if all(code in USPTO_FIELD_CODE_TO_CANONICAL for code in codes):
+        return codes
+    return None
+
+
+def _date_node(clause: str, pos: int) -> ASTNode:
+    m = DATE_REGEX.match(clause)
+    if not m:
+        raise QuerySyntaxError(f"Malformed date clause '{clause}'", pos)
+    code, op, value, op2, value2 = m.groups()
+    canonical_field = USPTO_DATE_CODE_TO_CANONICAL.get(code.upper())
+    if not canonical_field:
+        raise QuerySyntaxError(f"Unknown date field '@{code}'", pos)
+    lower = DateSearchNode(canonical_field, op, value.replace("-", ""), system_field_code=code.upper())  # type: ignore
+    if not op2:
+        return lower
+    # "@PD>=20200101<=20201231" is a range; keep it as two bounds so every generator can express it.
+    upper = DateSearchNode(canonical_field, op2, value2.replace("-", ""), system_field_code=code.upper())  # type: ignore
+    return BooleanOpNode("AND", [lower, upper])
+
+
+def tokenize(query_string: str) -> List[Token]:
+    tokens: List[Token] = []
+    for m in TOKENIZE_REGEX.finditer(query_string):
+        kind = m.lastgroup
+        pos = m.start()
+        if kind == "ws":
+            continue
+        if kind == "lparen":
+            tokens.append((T_LPAREN, "(", pos))
+        elif kind == "rparen":
+            tokens.append((T_RPAREN, ")", pos))
+        elif kind in ("phrase", "phrase_close"):
+            if not m.group("phrase_close"):
+                raise QuerySyntaxError("Unterminated phrase", pos)
+            if m.group("phrase"):
+                tokens.append((T_PHRASE, m.group("phrase"), pos))
+        elif kind == "date":
+            tokens.append((T_DATE, _date_node(m.group("date"), pos), pos))
+        elif kind == "suffix":
+            codes = _field_codes(m.group("suffix")[1:-1])
+            if codes is None:
+                raise QuerySyntaxError(f"Unknown field suffix '{m.group('suffix')}'", pos)
+            tokens.append((T_FIELD, codes, pos))
+        else:
+            word = m.group("word")
+            upper = word.upper()
+            if upper in BOOLEAN_OPERATORS:
+                tokens.append((T_BOOL, upper, pos))
+                continue
+            prox_match = PROXIMITY_OPERATOR_REGEX.match(word)
+            if prox_match:
+                if prox_match.group(1):
+                    op_type, dist_val_str = prox_match.group(1).upper(), prox_match.group(2)
+                else:
+                    op_type, dist_val_str = prox_match.group(3).upper(), ""
+                distance = int(dist_val_str) if dist_val_str else None
+                tokens.append((T_PROX, (op_type, distance), pos))
+                continue
+            suffix_match = WORD_SUFFIX_REGEX.match(word)
+            codes = _field_codes(suffix_match.group(2)) if suffix_match else None
+            if codes is not None:
+                tokens.append((T_WORD, suffix_match.group(1), pos))
+                tokens.append((T_FIELD, codes, pos + len(suffix_match.group(1))))
+            else:
+                tokens.append((T_WORD, word, pos))
+    return tokens
+
+
+def _apply_fields(codes: Tuple[str, ...], query: ASTNode) -> ASTNode:
+    """Wraps `query` for a ".TI." / ".TI,AB." suffix. Several codes mean any of those fields."""
+    nodes: List[ASTNode] = []
+    for code in codes:
+        scheme = USPTO_CLASSIFICATION_FIELDS.get(code)
+        field_query = _as_classification(scheme, query) if scheme else query
+        nodes.append(FieldedSearchNode(USPTO_FIELD_CODE_TO_CANONICAL[code], field_query, system_field_code=code))
+    return nodes[0] if len(nodes) == 1 else BooleanOpNode("OR", nodes)
+
+
+def _as_classification(scheme: str, node: ASTNode) -> ASTNode:
+    """Turns the terms under a classification field into ClassificationNodes."""
+    if isinstance(node, TermNode):
+        value = node.value.upper()
+        # A trailing "$" (H04L9/32$) or "/low" asks for the symbol and everything below it.
+        include_children = False
+        if value.endswith("/LOW"):
+            value, include_children = value[:-4], True
+        elif value.endswith("$"):
+            value, include_children = value.rstrip("$").rstrip("/"), True
+        # Without a subgroup, "$" truncates (H01M1$ is H01M1*), so only symbols with one are normalized.
+        if scheme in ("CPC", "IPC") and ("/" in value or not include_children):
+            value = normalize_symbol(value) or value
+        return ClassificationNode(scheme, value, include_children=include_children)  # type: ignore
+    if isinstance(node, BooleanOpNode):
+        return BooleanOpNode(node.operator, [_as_classification(scheme, op) for op in node.operands])
+    return node
+
+
+class _ExpressionParser:
+    """
+    Precedence-climbing parser over a token list. Each token is visited once,
+    so parsing is linear in the number of tokens. Holds per-call state so that
+    a single USPTOQueryParser can be shared between threads.
+    """
+    def __init__(self, tokens: List[Token], query_length: int, default_operator: str):
+        self.tokens = tokens
+        self.index = 0
+        self.end_position = query_length
+        self.default_operator = default_operator
+
+    def _peek(self) -> Optional[Token]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _peek_operator(self) -> Optional[Tuple[Any, int]]:
+        """Returns (operator key, precedence) for the operator at the cursor, if any."""
+        token = self._peek()
+        if token is None or token[0] == T_RPAREN:
+            return None
+        kind = token[0]
+        if kind == T_BOOL:
+            # A NOT here is binary ("a NOT b"); a leading NOT is handled by parse_unary.
+            return token[1], USPTO_PRECEDENCE[token[1]]
+        if kind == T_PROX:
+            return token[1], USPTO_PRECEDENCE[token[1][0]]
+        # The start of another operand: the default operator applies.
+        return self.default_operator, USPTO_PRECEDENCE[self.default_operator]
+
+    def parse_expression(self, min_precedence: int = 1) -> ASTNode:
+        left = self.parse_unary()
+        while True:
+            operator = self._peek_operator()
+            if operator is None or operator[1] < min_precedence:
+                return left
+            key, precedence = operator
+            # Collect a whole chain of the same operator into one node (a OR b OR c).
+            operands = [left]
+            while True:
+                if self.tokens[self.index][0] in (T_BOOL, T_PROX):
+                    self.index += 1
+                operands.append(self.parse_expression(precedence + 1))
+                following = self._peek_operator()
+                if following is None or following[0] != key:
+                    break
+            left = self._build(key, operands)
+
+    def _build(self, key: Any, operands: List[ASTNode]) -> ASTNode:
+        if isinstance(key, str):
+            return BooleanOpNode(key, operands)  # type: ignore
+        op_type, distance = key
+        ordered, scope_unit = PROXIMITY_SEMANTICS[op_type]
+        return ProximityOpNode(op_type, operands, distance=distance, ordered=ordered, scope_unit=scope_unit)  # type: ignore
+
+    def parse_unary(self) -> ASTNode:
+        token = self._peek()
+        if token is not None and token[0] == T_BOOL and token[1] == "NOT":
+            self.index += 1
+            return BooleanOpNode("NOT", [self.parse_expression(USPTO_PRECEDENCE["NOT"] + 1)])
+        return self.parse_atom()
+
+    def parse_atom(self) -> ASTNode:
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query", self.end_position)
+        kind, value, pos = token
+        self.index += 1
+
+        if kind == T_LPAREN:
+            closing = self._peek()
+            if closing is not None and closing[0] == T_RPAREN:
+                self.index += 1
+                node: ASTNode = TermNode("__EMPTY__")
+            else:
+                node = self.parse_expression()
+                closing = self._peek()
+                if closing is None or closing[0] != T_RPAREN:
+                    raise QuerySyntaxError("Unclosed parenthesis opened", pos)
+                self.index += 1
+        elif kind == T_PHRASE:
+            node = TermNode(value, is_phrase=True)
+        elif kind == T_WORD:
+            node = TermNode(value)
+        elif kind == T_DATE:
+            return value
+        elif kind == T_RPAREN:
+            raise QuerySyntaxError("Unmatched ')'", pos)
+        elif kind == T_FIELD:
+            raise QuerySyntaxError("Field suffix without a preceding term", pos)
+        else:
+            operator_text = value[0] if kind == T_PROX else value
+            raise QuerySyntaxError(f"Unexpected operator '{operator_text}'", pos)
+
+        # Field suffixes are postfix and bind tighter than any operator.
+        suffix = self._peek()
+        while suffix is not None and suffix[0] == T_FIELD:
+            self.index += 1
+            node = _apply_fields(suffix[1], node)
+            suffix = self._peek()
+        return node
+
+
+class USPTOQueryParser:
+    """
+    Parses USPTO PPUBS/EAST search syntax: AND/OR/XOR/NOT, ADJn/NEARn/WITH/SAME
+    proximity, ".TI." style field suffixes (including ".TI,AB."), "$"/"?"
+    truncation, "@PD>=20200101" date clauses and classification symbols under
+    ".CPC."/".IPC."/".CCLS.".
+    """
+    def __init__(self, default_operator: str = "AND"):
+        if default_operator.upper() not in ("AND", "OR"):
+            raise ValueError(f"Unsupported default operator: {default_operator}")
+        self.default_operator = default_operator.upper()
+
+    def parse(self, query_string: str, timings: Optional[Dict[str, float]] = None,
+              budget: Optional[QueryBudget] = None) -> QueryRootNode:
         """
-        Placeholder parse method.
-        Returns a simple AST with the query string inside a TermNode.
+        Parses `query_string`. If `timings` is given, the seconds spent in the
+        "tokenize" and "parse" stages are stored in it. With a `budget`, a query
+        over it raises QueryBudgetExceeded (see query_budget.py).
         """
-        if not query_string.strip():
+        query_string = query_string.strip()
+        if not query_string:
             return QueryRootNode(query=TermNode("__EMPTY__"))
-        
-        placeholder_node = TermNode(f"Parsed from USPTO: '{query_string}'")
-        return QueryRootNode(query=placeholder_node, settings={})
\ No newline at end of file
+        if budget is not None:
+            check_length(query_string, budget)
+
+        try:
+            started = perf_counter()
+            tokens = tokenize(query_string)
+            tokenized = perf_counter()
+            if not tokens:
+                return QueryRootNode(query=TermNode("__EMPTY__"))
+            if budget is not None and len(tokens) > budget.max_tokens:
+                raise QueryBudgetExceeded("tokens", len(tokens), budget.max_tokens, tokens[budget.max_tokens][2])
+
+            expression_parser = _ExpressionParser(tokens, len(query_string), self.default_operator)
+            final_ast = expression_parser.parse_expression()
+            leftover = expression_parser._peek()
+            if leftover is not None:
+                raise QuerySyntaxError("Unmatched ')'", leftover[2])
+            if timings is not None:
+                timings["tokenize"] = tokenized - started
+                timings["parse"] = perf_counter() - tokenized
+            root = QueryRootNode(query=final_ast, settings={})
+            if budget is not None:
+                check_cost(query_cost(root), budget)
+            return root
+
+        except QueryBudgetExceeded:
+            raise
+        except RecursionError:
+            return QueryRootNode(query=TermNode("PARSE_ERROR: Query is nested too deeply"))
+        except Exception as e:
+            return QueryRootNode(query=TermNode(f"PARSE_ERROR: {str(e)}"))
@@ -0,0 +1,501 @@
+# wildcard_expansion.py
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import nlargest
+from itertools import accumulate
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from ast_nodes import ASTNode, QueryRootNode, TermNode, BooleanOpNode
+from ast_optimizer import optimize
+from lru_cache import LRUCache
+
+# --- Wildcard expansion ---
+# Expands a wildcard term into the vocabulary terms it matches, so a query
+# can be sent as an OR of plain terms to a search that lacks truncation, and
+# so the blow-up of a wildcard can be measured before a query goes out.
+# Patterns use both dialects' marks:
+#   *  or  $    any number of characters
+#   $n          at most n characters (USPTO)
+#   ?           exactly one character
+# The vocabulary is lower case, and so is every pattern before matching.
+#
+# The vocabulary is a sorted array of terms, which works as an implicit trie:
+# the terms under a prefix are one contiguous range, found by two binary
+# searches, and the children of a node are found by stepping from range to
+# range. A second copy sorted by the reversed terms does the same for
+# suffixes, so "*ation" is as cheap as "batter*". A pattern is matched from
+# the end with the longer fixed part (literals and "?") up to the first
+# variable-length wildcard; a lone "*" after it is answered from the range
+# sizes alone, anything else is checked with one regular expression run over
+# the range's bytes. A pattern with no fixed part at either end ("*ion*")
+# falls back to scanning the whole vocabulary.
+#
+# Terms are stored as UTF-8, one per line, so a range of terms is one slice of
+# a byte string that a compiled regex scans without a Python-level loop.
+#
+# `Vocabulary.build` turns a term list into an index file that is
+# memory-mapped when opened, so the worker processes on a host share one copy
+# in the page cache. A term list is text with one term per line (blank lines
+# and lines starting with "#" are skipped) and an optional second
+# tab-separated column with the term's document frequency; capped expansions
+# keep the most frequent terms. Layout, in native byte order:
+#   header            magic, byte order, term count, blob bytes, flags
+#   offsets           uint32[count + 1]  term i is blob[offsets[i]:offsets[i + 1] - 1]
+#   reversed_offsets  uint32[count + 1]  the same for reversed_blob
+#   reversed_ids      uint32[count]      the term number of each reversed_blob entry
+#   counts            uint32[count]      frequencies, 0 without them
+#   blob              the terms in sorted order, each followed by "\n"
+#   reversed_blob     the reversed terms in sorted order, each followed by "\n"
+#
+# Set PATENTPEEK_VOCABULARY to an index file to have `default_expander` use it;
+# /api/wildcard-expansion (see services.py) answers from that expander.
+
+WILDCARD_REGEX = re.compile(r"\$(\d+)|[*$]|\?")
+MAX_EXPANSIONS = 128
+# Terms checked against a pattern before its match count becomes a lower bound.
+MAX_SCAN = 1_000_000
+EXPANSION_CACHE_SIZE = 1024
+# "?" steps through the children of every range it is applied to; past this
+# many ranges the rest of the pattern is left to the regex instead.
+MAX_RANGES = 256
+VOCABULARY_MAGIC = b"PPVOCIDX"
+_HEADER = struct.Struct("=8s8sIII")  # magic, byte order, count, blob size, flags
+_HAS_COUNTS = 1
+_MAX_COUNT = 0xFFFFFFFF
+VOCABULARY_ENV_VAR = "PATENTPEEK_VOCABULARY"
+
+# One UTF-8 encoded character of a term, and any run of them.
+_CHAR = rb"(?:[^\n\x80-\xff]|[\xc0-\xff][\x80-\xbf]*)"
+_CHARS = rb"[^\n]*"
+
+# Pattern tokens: a one-character string is a literal, "?" is one character,
+# "*" any number of them and an int n at most n.
+_Token = Union[str, int]
+
+
+def _tokens(pattern: str) -> List[_Token]:
+    tokens: List[_Token] = []
+    position = 0
+    for match in WILDCARD_REGEX.finditer(pattern):
+        tokens += pattern[position:match.start()]
+        if match.group(1):
+            tokens.append(int(match.group(1)))
+        else:
+            tokens.append("?" if match.group(0) == "?" else "*")
+        position = match.end()
+    tokens += pattern[position:]
+    return tokens
+
+
+def _lead(tokens: List[_Token]) -> int:
+    """How many tokens before the first variable-length wildcard."""
+    for position, token in enumerate(tokens):
+        if token == "*" or isinstance(token, int):
+            return position
+    return len(tokens)
+
+
+def _regex(tokens: List[_Token]) -> "re.Pattern[bytes]":
+    parts = []
+    for token in tokens:
+        if token == "*":
+            parts.append(_CHARS)
+        elif token == "?":
+            parts.append(_CHAR)
+        elif isinstance(token, int):
+            parts.append(_CHAR + b"{0,%d}" % token)
+        else:
+            parts.append(re.escape(token.encode("utf-8")))
+    # Ends on the newline rather than "$", which would also match the empty string after the last term.
+    return re.compile(rb"(?m)^" + b"".join(parts) + rb"\n")
+
+
+def _successor(prefix: bytes) -> bytes:
+    """The smallest byte string after every string that starts with `prefix`."""
+    return prefix[:-1] + bytes((prefix[-1] + 1,))
+
+
+def _char_length(lead_byte: int) -> int:
+    if lead_byte < 0x80:
+        return 1
+    return 2 if lead_byte < 0xE0 else 3 if lead_byte < 0xF0 else 4
+
+
+def _columns(terms: Dict[str, int]) -> Tuple[List[array], bytes, bytes]:
+    """The index columns and blobs of `terms` (term: frequency); see the module comment."""
+    ordered = sorted(terms)
+    encoded = [term.encode("utf-8") for term in ordered]
+    offsets = array("I", accumulate((len(term) + 1 for term in encoded), initial=0))
+    reversed_ids = array("I", sorted(range(len(ordered)), key=lambda i: ordered[i][::-1]))
+    reversed_encoded = [ordered[i][::-1].encode("utf-8") for i in reversed_ids]
+    reversed_offsets = array("I", accumulate((len(term) + 1 for term in reversed_encoded), initial=0))
+    counts = array("I", (min(terms[term], _MAX_COUNT) for term in ordered))
+    blob = b"".join(term + b"\n" for term in encoded)
+    reversed_blob = b"".join(term + b"\n" for term in reversed_encoded)
+    return [offsets, reversed_offsets, reversed_ids, counts], blob, reversed_blob
+
+
+def _read_terms(path: str) -> Tuple[Dict[str, int], bool]:
+    """Term frequencies from a term list, duplicates summed, and whether the file had any."""
+    terms: Dict[str, int] = {}
+    has_counts = False
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            columns = line.rstrip("\n").split("\t")
+            term = columns[0].strip().lower()
+            if not term:
+                continue
+            count = columns[1].strip() if len(columns) > 1 else ""
+            if count and not count.isdigit():
+                raise ValueError(f"{path}:{line_number}: not a term count: {count!r}")
+            has_counts = has_counts or bool(count)
+            terms[term] = terms.get(term, 0) + int(count or 0)
+    return terms, has_counts
+
+
+class _Side:
+    """
+    One sorted copy of the vocabulary, read as a sequence of byte strings for
+    `bisect`. `blob` is bytes or the memory map, with the terms from `base` on.
+    """
+
+    def __init__(self, blob, offsets, ids=None, base: int = 0):
+        self.blob = blob
+        self.base = base
+        self.offsets = offsets
+        self.ids = ids  # term numbers by position; None when position is the term number
+        self.size = len(offsets) - 1
+        # What the regexes scan: it must start at the first term for "^" to match there.
+        self.text = memoryview(blob)[base:] if base else blob
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.blob[self.base + self.offsets[position]:self.base + self.offsets[position + 1] - 1]
+
+    def term_ids(self, start: int, end: int) -> Iterable[int]:
+        return range(start, end) if self.ids is None else self.ids[start:end]
+
+    def term_id(self, position: int) -> int:
+        return position if self.ids is None else self.ids[position]
+
+
+class Vocabulary:
+    """
+    A sorted term list with a reversed copy, in memory (`from_terms`) or
+    memory-mapped (`open`, `build`); see the module comment.
+    """
+
+    def __init__(self, columns: List, has_counts: bool, forward: _Side, backward: _Side,
+                 index_map: Optional[mmap.mmap] = None, path: Optional[str] = None):
+        self.path = path
+        self.has_counts = has_counts
+        self.forward = forward
+        self.backward = backward
+        self._columns = columns
+        self._counts = columns[3]
+        self._map = index_map
+
+    @classmethod
+    def from_terms(cls, terms: Union[Iterable[str], Mapping[str, int]]) -> "Vocabulary":
+        """An in-memory vocabulary; a mapping gives each term's frequency."""
+        frequencies: Dict[str, int] = {}
+        if isinstance(terms, Mapping):
+            for term, count in terms.items():
+                term = term.lower()
+                frequencies[term] = frequencies.get(term, 0) + count
+        else:
+            frequencies = dict.fromkeys((term.lower() for term in terms), 0)
+        frequencies.pop("", None)
+        columns, blob, reversed_blob = _columns(frequencies)
+        offsets, reversed_offsets, reversed_ids, _ = columns
+        return cls(columns, isinstance(terms, Mapping), _Side(blob, offsets),
+                   _Side(reversed_blob, reversed_offsets, reversed_ids))
+
+    @classmethod
+    def open(cls, path: str) -> "Vocabulary":
+        with open(path, "rb") as f:
+            index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order, count, blob_size, flags = _HEADER.unpack_from(index_map, 0)
+        if magic != VOCABULARY_MAGIC:
+            raise ValueError(f"{path} is not a vocabulary index")
+        built_on = byte_order.rstrip(b"\0").decode()
+        if built_on != sys.byteorder:
+            raise ValueError(f"{path} was built on a {built_on}-endian machine")
+        blob_start = _HEADER.size + (4 * count + 2) * 4
+        words = memoryview(index_map)[_HEADER.size:blob_start].cast("I")
+        columns = [words[:count + 1], words[count + 1:2 * count + 2],
+                   words[2 * count + 2:3 * count + 2], words[3 * count + 2:]]
+        offsets, reversed_offsets, reversed_ids, _ = columns
+        # Terms are sliced from the map itself, which gives bytes that bisect can compare.
+        return cls(columns, bool(flags & _HAS_COUNTS), _Side(index_map, offsets, base=blob_start),
+                   _Side(index_map, reversed_offsets, reversed_ids, base=blob_start + blob_size), index_map, path)
+
+    @classmethod
+    def build(cls, terms_path: str, index_path: str) -> "Vocabulary":
+        """Writes the index for a term list and opens it. Raises ValueError for a malformed count."""
+        terms, has_counts = _read_terms(terms_path)
+        columns, blob, reversed_blob = _columns(terms)
+        # Written under a temporary name and renamed, so a worker never maps a half-written file.
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(_HEADER.pack(VOCABULARY_MAGIC, sys.byteorder.encode(), len(terms), len(blob),
+                                 _HAS_COUNTS if has_counts else 0))
+            for column in columns:
+                column.tofile(f)
+            f.write(blob)
+            f.write(reversed_blob)
+        os.replace(temporary_path, index_path)
+        return cls.open(index_path)
+
+    def close(self) -> None:
+        if self._map is not None:
+            for view in (*self._columns, self.forward.text, self.backward.text):
+                view.release()
+            self._map.close()
+
+    def __len__(self) -> int:
+        return self.forward.size
+
+    def __contains__(self, term: str) -> bool:
+        encoded = term.lower().encode("utf-8")
+        position = bisect_left(self.forward, encoded)
+        return position < self.forward.size and self.forward[position] == encoded
+
+    def term(self, term_id: int) -> str:
+        return self.forward[term_id].decode("utf-8")
+
+    def count(self, term_id: int) -> int:
+        return self._counts[term_id]
+
+
+class Expansion(NamedTuple):
+    """
+    The vocabulary terms a pattern matches, in sorted order. `matches` counts
+    every match found; it is a lower bound unless `exact`. `terms` holds all
+    of them unless a cap cut it short (see `complete`).
+    """
+    terms: Tuple[str, ...]
+    matches: int
+    exact: bool
+
+    @property
+    def complete(self) -> bool:
+        return self.exact and len(self.terms) == self.matches
+
+
+class WildcardExpander:
+    """
+    Expands patterns against a Vocabulary, keeping the recent expansions in
+    an LRU cache. `max_expansions` caps the terms of one expansion (the most
+    frequent are kept when the vocabulary has counts, the first in sorted
+    order otherwise) and `max_scan` the terms examined for one pattern; None
+    lifts either cap. Thread-safe.
+    """
+
+    def __init__(self, vocabulary: Vocabulary, max_expansions: Optional[int] = MAX_EXPANSIONS,
+                 max_scan: Optional[int] = MAX_SCAN, cache_size: int = EXPANSION_CACHE_SIZE):
+        self.vocabulary = vocabulary
+        self.max_expansions = max_expansions
+        self.max_scan = max_scan
+        self._cache = LRUCache(maxsize=cache_size) if cache_size > 0 else None
+
+    def expand(self, pattern: str) -> Expansion:
+        pattern = pattern.lower()
+        expansion = self._cache.get(pattern) if self._cache is not None else None
+        if expansion is None:
+            ids, matches, exact = self._match(pattern, collect=True)
+            if self.max_expansions is not None and len(ids) > self.max_expansions:
+                if self.vocabulary.has_counts:
+                    ids = nlargest(self.max_expansions, ids, key=self.vocabulary.count)
+                else:
+                    ids = sorted(ids)[:self.max_expansions]
+            expansion = Expansion(tuple(self.vocabulary.term(i) for i in sorted(ids)), matches, exact)
+            if self._cache is not None:
+                self._cache.put(pattern, expansion)
+        return expansion
+
+    def estimate(self, pattern: str) -> int:
+        """
+        How many terms `pattern` matches, without building the expansion:
+        a lower bound if more than `max_scan` terms had to be examined.
+        """
+        pattern = pattern.lower()
+        expansion = self._cache.get(pattern) if self._cache is not None else None
+        if expansion is not None:
+            return expansion.matches
+        return self._match(pattern, collect=False)[1]
+
+    def clear_cache(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self._cache.stats() if self._cache is not None else {}
+
+    def _match(self, pattern: str, collect: bool) -> Tuple[List[int], int, bool]:
+        """The ids of the matching terms (if `collect`), how many match, and whether that count is exact."""
+        tokens = _tokens(pattern)
+        reversed_tokens = tokens[::-1]
+        lead = _lead(tokens)
+        reversed_lead = _lead(reversed_tokens)
+        side, tokens, lead = self.vocabulary.forward, tokens, lead
+        if _literals(reversed_tokens[:reversed_lead]) > _literals(tokens[:lead]):
+            side, tokens, lead = self.vocabulary.backward, reversed_tokens, reversed_lead
+
+        ranges, consumed = _descend(side, tokens[:lead])
+        rest = tokens[consumed:]
+        ids: List[int] = []
+        if not rest:
+            # No wildcard left: only a term equal to the range's prefix matches.
+            matches = 0
+            for start, end, prefix in ranges:
+                if len(side[start]) == len(prefix):
+                    matches += 1
+                    ids.append(side.term_id(start))
+            return ids, matches, True
+
+        budget = self.max_scan
+        if rest == ["*"]:
+            matches = sum(end - start for start, end, _ in ranges)
+            if collect:
+                for start, end, _ in ranges:
+                    if budget is not None:
+                        end = min(end, start + budget)
+                        budget -= end - start
+                    ids.extend(side.term_ids(start, end))
+            return ids, matches, True
+
+        regex = _regex(tokens)
+        offsets = side.offsets
+        matches = 0
+        exact = True
+        for start, end, _ in ranges:
+            if budget is not None:
+                if budget <= 0:
+                    exact = False
+                    break
+                if end - start > budget:
+                    end, exact = start + budget, False
+                budget -= end - start
+            for match in regex.finditer(side.text, offsets[start], offsets[end]):
+                matches += 1
+                if collect:
+                    ids.append(side.term_id(bisect_right(offsets, match.start(), start, end) - 1))
+        return ids, matches, exact
+
+
+def _literals(tokens: List[_Token]) -> int:
+    return sum(1 for token in tokens if token != "?")
+
+
+def _descend(side: _Side, lead: List[_Token]) -> Tuple[List[Tuple[int, int, bytes]], int]:
+    """
+    The ranges of `side` that start with the fixed `lead` (start, end, prefix),
+    and how many of its tokens they account for.
+    """
+    ranges = [(0, side.size, b"")]
+    for consumed, token in enumerate(lead):
+        if len(ranges) > MAX_RANGES:
+            return ranges, consumed
+        narrowed = []
+        for start, end, prefix in ranges:
+            if token == "?":
+                length = len(prefix)
+                if start < end and len(side[start]) == length:
+                    start += 1  # the prefix itself has no next character
+                while start < end:
+                    term = side[start]
+                    child = term[:length + _char_length(term[length])]
+                    child_end = bisect_left(side, _successor(child), start, end)
+                    narrowed.append((start, child_end, child))
+                    start = child_end
+            else:
+                child = prefix + token.encode("utf-8")  # type: ignore
+                child_start = bisect_left(side, child, start, end)
+                child_end = bisect_left(side, _successor(child), child_start, end)
+                if child_start < child_end:
+                    narrowed.append((child_start, child_end, child))
+        ranges = narrowed
+    return ranges, len(lead)
+
+
+def expand_wildcards(root: QueryRootNode, expander: WildcardExpander) -> QueryRootNode:
+    """
+    A copy of `root` with every wildcard term replaced by an OR of the terms
+    it expands to. Phrases are left alone, and so are terms whose expansion is
+    empty or was cut short by the expander's caps, since an OR of some of the
+    matches would silently narrow the query.
+    """
+    query = _expand(root.query, expander)
+    if query is root.query:
+        return root
+    return optimize(QueryRootNode(query=query, settings=root.settings))
+
+
+def _expand(node: ASTNode, expander: WildcardExpander) -> ASTNode:
+    if type(node) is TermNode:
+        if not node.has_wildcard or node.is_phrase:
+            return node
+        expansion = expander.expand(node.value)
+        if not expansion.terms or not expansion.complete:
+            return node
+        if len(expansion.terms) == 1:
+            return TermNode(expansion.terms[0], has_wildcard=False)
+        return BooleanOpNode("OR", [TermNode(term, has_wildcard=False) for term in expansion.terms])
+    if not node._child_fields:
+        return node
+    values = []
+    changed = False
+    for field in node._fields:
+        value = getattr(node, field)
+        if field in node._child_fields:
+            expanded = [_expand(child, expander) for child in value] if isinstance(value, list) else _expand(value, expander)
+            changed = changed or (any(new is not old for new, old in zip(expanded, value))
+                                  if isinstance(value, list) else expanded is not value)
+            value = expanded
+        values.append(value)
+    return type(node)(*values) if changed else node
+
+
+def expansion_sizes(root: ASTNode, expander: WildcardExpander) -> Dict[str, int]:
+    """How many terms each wildcard term under `root` matches (a lower bound if the scan was capped)."""
+    sizes: Dict[str, int] = {}
+    level = [root]
+    while level:
+        below: List[ASTNode] = []
+        for node in level:
+            if type(node) is TermNode:
+                if node.has_wildcard and not node.is_phrase and node.value not in sizes:
+                    sizes[node.value] = expander.estimate(node.value)
+                continue
+            for field in node._child_fields:
+                value = getattr(node, field)
+                below += value if isinstance(value, list) else [value]
+        level = below
+    return sizes
+
+
+_default_expander: Optional[WildcardExpander] = None
+_default_expander_loaded = False
+_default_expander_lock = threading.Lock()
+
+
+def default_expander() -> Optional[WildcardExpander]:
+    """An expander over the vocabulary named by PATENTPEEK_VOCABULARY, opened on first use, or None if it is not set."""
+    global _default_expander, _default_expander_loaded
+    if not _default_expander_loaded:
+        with _default_expander_lock:
+            if not _default_expander_loaded:
+                path = os.environ.get(VOCABULARY_ENV_VAR)
+                _default_expander = WildcardExpander(Vocabulary.open(path)) if path else None
+                _default_expander_loaded = True
+    return _default_expander
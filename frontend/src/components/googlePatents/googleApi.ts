@@ -2,6 +2,7 @@
 import { PatentFormat } from '../../types';
 import { SearchCondition, TextSearchCondition, SearchToolType, GoogleLikeSearchFields } from '../searchToolTypes';
 import { UsptoSpecificSettings } from '../usptoPatents/usptoQueryBuilder';
+import { liveQuerySession } from './liveQuery';
 
 // --- START: Define Payload-Specific Types ---
 interface TextSearchDataPayload {
@@ -35,6 +36,10 @@ export interface ConvertResponse {
   settings: Record<string, any>;
 }
 
+// The last successful generate response and its ETag. The form re-posts the
+// same state on every render; sending the ETag back lets the server answer 304.
+let lastGenerated: { etag: string; result: GenerateResponse } | null = null;
+
 /**
  * Sends structured state to the backend to generate a query string.
  */
@@ -56,17 +61,32 @@ export const generateQuery = async (
       };
   });
 
+  const payload = { format, searchConditions: processedSearchConditions, googleLikeFields, usptoSpecificSettings };
   try {
+    // Prefer the live WebSocket session, which sends only the changes; fall back to a POST without it.
+    const live = await liveQuerySession.generate(payload);
+    if (live) {
+      return live;
+    }
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    if (lastGenerated) {
+      headers['If-None-Match'] = lastGenerated.etag;
+    }
     const response = await fetch('/api/generate-query', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ format, searchConditions: processedSearchConditions, googleLikeFields, usptoSpecificSettings }),
+      headers,
+      body: JSON.stringify(payload),
     });
+    if (response.status === 304 && lastGenerated) {
+      return lastGenerated.result;
+    }
     const result = await response.json();
     if (!response.ok) {
       const errorMessage = result.detail ? JSON.stringify(result.detail) : (result.error || 'Error from server');
       return { queryStringDisplay: `Validation Error: ${errorMessage}`, url: '#', ast: null };
     }
+    const etag = response.headers.get('ETag');
+    lastGenerated = etag ? { etag, result } : null;
     return result;
   } catch (error) {
     const errorMessage = error instanceof Error ? error.message : "Network error.";
@@ -74,6 +94,22 @@ export const generateQuery = async (
   }
 };
 
+// FastAPI's error `detail` is a string, or an object with a `message` (a query
+// over the server's complexity budget, for one).
+const detailMessage = (detail: unknown): string | undefined => {
+  if (typeof detail === 'string') {
+    return detail;
+  }
+  if (detail && typeof detail === 'object' && 'message' in detail && typeof detail.message === 'string') {
+    return detail.message;
+  }
+  return detail ? JSON.stringify(detail) : undefined;
+};
+
+// The last query sent for parsing, per format. While typing, each query is a
+// small edit of the previous one, which the server can reparse incrementally.
+const lastParsed: Partial<Record<PatentFormat, string>> = {};
+
 /**
  * Sends a raw query string to the backend to be parsed into structured state.
  */
@@ -85,11 +121,12 @@ export const parseQuery = async (
     const response = await fetch('/api/parse-query', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ format, queryString }),
+      body: JSON.stringify({ format, queryString, previousQueryString: lastParsed[format] }),
     });
+    lastParsed[format] = queryString;
     const result = await response.json();
     if (!response.ok) {
-        throw new Error(result.detail || result.error || 'Error from server');
+        throw new Error(detailMessage(result.detail) || result.error || 'Error from server');
     }
     return result;
   } catch (error) {
@@ -0,0 +1,172 @@
+// src/components/googlePatents/liveQuery.ts
+import type { GenerateResponse } from './googleApi';
+
+// A persistent query-building session over /ws/live-query. The form state is
+// sent once and then only as a JSON Merge Patch of what changed; the server
+// answers with the query string, URL and a JSON Patch to the previous AST.
+// See backend/live_query.py for the message format.
+
+type Json = any;
+
+interface AstPatchOp {
+  op: 'add' | 'remove' | 'replace';
+  path: string;
+  value?: Json;
+}
+
+interface LiveReply {
+  id: number;
+  queryStringDisplay?: string;
+  url?: string;
+  astPatch?: AstPatchOp[];
+  error?: { status: number; detail: Json };
+}
+
+// Errors after which the server discarded the message's request: the next
+// message must carry the whole request again.
+const REJECTED_STATUSES = new Set([400, 409, 422]);
+
+// After a failed connection attempt, calls stay on HTTP for this long before
+// the next attempt, doubling per consecutive failure up to the maximum.
+const RECONNECT_DELAY_MS = 1000;
+const MAX_RECONNECT_DELAY_MS = 60000;
+
+const isObject = (value: Json): value is Record<string, Json> =>
+  value !== null && typeof value === 'object' && !Array.isArray(value);
+
+/** Applies a JSON Patch from the server to a copy-on-write AST document. */
+export const applyAstPatch = (document: Json, patch: AstPatchOp[]): Json => {
+  for (const op of patch) {
+    if (op.path === '') {
+      document = op.value ?? null;
+      continue;
+    }
+    const keys = op.path.slice(1).split('/').map(key => key.replace(/~1/g, '/').replace(/~0/g, '~'));
+    const last = keys.pop() as string;
+    // Copy the nodes along the path so the previous document, which React may still hold, is untouched.
+    document = Array.isArray(document) ? [...document] : { ...document };
+    let target = document;
+    for (const key of keys) {
+      const child = target[key];
+      target = target[key] = Array.isArray(child) ? [...child] : { ...child };
+    }
+    if (Array.isArray(target)) {
+      const index = Number(last);
+      if (op.op === 'add') target.splice(index, 0, op.value);
+      else if (op.op === 'remove') target.splice(index, 1);
+      else target[index] = op.value;
+    } else if (op.op === 'remove') {
+      delete target[last];
+    } else {
+      target[last] = op.value;
+    }
+  }
+  return document;
+};
+
+/** The JSON Merge Patch (RFC 7386) that turns `previous` into `next`, or null if they are equal. */
+const mergePatch = (previous: Record<string, Json>, next: Record<string, Json>): Record<string, Json> | null => {
+  const patch: Record<string, Json> = {};
+  for (const key of Object.keys(previous)) {
+    if (!(key in next)) patch[key] = null;
+  }
+  for (const [key, value] of Object.entries(next)) {
+    const old = previous[key];
+    if (isObject(value) && isObject(old)) {
+      const nested = mergePatch(old, value);
+      if (nested) patch[key] = nested;
+    } else if (JSON.stringify(value) !== JSON.stringify(old)) {
+      patch[key] = value;
+    }
+  }
+  return Object.keys(patch).length ? patch : null;
+};
+
+class LiveQuerySession {
+  private socket: WebSocket | null = null;
+  private opening: Promise<WebSocket | null> | null = null;
+  private nextId = 1;
+  private pending = new Map<number, (reply: GenerateResponse | null) => void>();
+  private lastSent: Record<string, Json> | null = null;
+  private lastResult: GenerateResponse | null = null;
+  private ast: Json = null;
+  // Consecutive failed connection attempts, and when the next one may be made; until then the caller stays on HTTP.
+  private failures = 0;
+  private retryAt = 0;
+
+  private open(): Promise<WebSocket | null> {
+    if (this.socket) return Promise.resolve(this.socket);
+    if (Date.now() < this.retryAt) return Promise.resolve(null);
+    if (!this.opening) {
+      this.opening = new Promise(resolve => {
+        const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${protocol}://${window.location.host}/ws/live-query`);
+        socket.onopen = () => {
+          this.socket = socket;
+          this.failures = 0;
+          resolve(socket);
+        };
+        socket.onmessage = event => this.receive(JSON.parse(event.data));
+        socket.onclose = () => {
+          if (!this.socket) {
+            this.failures += 1;
+            this.retryAt = Date.now() + Math.min(MAX_RECONNECT_DELAY_MS, RECONNECT_DELAY_MS * 2 ** (this.failures - 1));
+          }
+          // The server-side session is gone with the connection; start over on the next call.
+          this.socket = null;
+          this.opening = null;
+          this.lastSent = null;
+          this.ast = null;
+          // Calls still waiting for a reply fall back to HTTP.
+          this.pending.forEach(settle => settle(null));
+          this.pending.clear();
+          resolve(null);
+        };
+      });
+    }
+    return this.opening;
+  }
+
+  private receive(reply: LiveReply) {
+    if (reply.error) {
+      if (REJECTED_STATUSES.has(reply.error.status)) this.lastSent = null;
+    } else {
+      this.ast = applyAstPatch(this.ast, reply.astPatch ?? []);
+      this.lastResult = { queryStringDisplay: reply.queryStringDisplay ?? '', url: reply.url ?? '#', ast: this.ast };
+    }
+    const settle = this.pending.get(reply.id);
+    this.pending.delete(reply.id);
+    if (!settle) return;
+    if (reply.error) {
+      const detail = typeof reply.error.detail === 'string' ? reply.error.detail : JSON.stringify(reply.error.detail);
+      settle({ queryStringDisplay: `Validation Error: ${detail}`, url: '#', ast: null });
+    } else {
+      settle(this.lastResult as GenerateResponse);
+    }
+  }
+
+  /**
+   * Generates over the session; resolves to null if no WebSocket connection
+   * can be made or it closes before the reply arrives.
+   */
+  async generate(request: Record<string, Json>): Promise<GenerateResponse | null> {
+    const socket = await this.open();
+    if (!socket) return null;
+    const id = this.nextId++;
+    let message: Record<string, Json>;
+    if (this.lastSent) {
+      const patch = mergePatch(this.lastSent, request);
+      if (!patch && this.lastResult && this.pending.size === 0) return this.lastResult;
+      message = { id, patch: patch ?? {} };
+    } else {
+      message = { id, request };
+    }
+    this.lastSent = request;
+    return new Promise(resolve => {
+      this.pending.set(id, resolve);
+      socket.send(JSON.stringify(message));
+    });
+  }
+}
+
+export const liveQuerySession = new LiveQuerySession();
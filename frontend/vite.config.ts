@@ -11,6 +11,11 @@ export default defineConfig({
         target: 'http://127.0.0.1:8000', // <-- THIS MUST MATCH YOUR BACKEND ADDRESS
         changeOrigin: true,
         secure: false,      
+      },
+      // The live query WebSocket
+      '/ws': {
+        target: 'ws://127.0.0.1:8000',
+        ws: true,
       }
     }
   }